@@ -63,9 +63,12 @@ class AgentTeam:
     _tasks: List[_AgentTask] = []
     _team_name: str = ""
 
-    def __init__(self, team_name: str, project_client: AIProjectClient):
+    def __init__(self, team_name: str, project_client: AIProjectClient, parallel_tasks: bool = True):
         """
         Initialize a new AgentTeam and set it as the singleton instance.
+
+        :param parallel_tasks: If True, pending tasks for different agents run concurrently,
+                               each on its own thread. Defaults to True.
         """
         # Validate that the team_name is a non-empty string
         if not isinstance(team_name, str) or not team_name:
@@ -77,6 +80,7 @@ class AgentTeam:
         if project_client is None:
             raise ValueError("No AIProjectClient provided.")
         self._project_client = project_client
+        self.parallel_tasks = parallel_tasks
         # Store the instance in the static container
         AgentTeam._teams[team_name] = self
 
@@ -94,6 +98,8 @@ class AgentTeam:
             self.TEAM_MEMBER_CAN_DELEGATE_INSTRUCTIONS = config["TEAM_MEMBER_CAN_DELEGATE_INSTRUCTIONS"]
             self.TEAM_MEMBER_NO_DELEGATE_INSTRUCTIONS = config["TEAM_MEMBER_NO_DELEGATE_INSTRUCTIONS"]
             self.TEAM_LEADER_MODEL = config["TEAM_LEADER_MODEL"].strip()
+            self.TEAM_MEMBER_PARALLEL_TASK_REQUEST = config["TEAM_MEMBER_PARALLEL_TASK_REQUEST"]
+            self.TEAM_LEADER_PARALLEL_TASK_RESULT = config["TEAM_LEADER_PARALLEL_TASK_RESULT"]
 
     @staticmethod
     def get_team(team_name: str) -> "AgentTeam":
@@ -268,77 +274,174 @@ class AgentTeam:
         """
         Handle a user's request by creating a team and delegating tasks to
         the team leader. The team leader may generate additional tasks.
-    
+        Pending tasks for different agents run concurrently, each on its own thread,
+        and their outcomes are posted back to the team leader's thread.
+
         :param request: The user's request or question.
         :return: A list of text messages from the agent.
         """
         assert self._project_client is not None, "project client must not be None"
         assert self._team_leader is not None, "team leader must not be None"
-    
+
         thread = await self._project_client.agents.create_thread()
         print(f"Created thread with ID: {thread.id}")
         self._thread_id = thread.id
-    
+
         team_leader_request = self.TEAM_LEADER_INITIAL_REQUEST.format(original_request=request)
         self._add_task(_AgentTask(self._team_leader.name, team_leader_request, "user"))
-    
+
         agent_responses = []  # List to store agent text messages
-    
+
         while self._tasks:
-            task = self._tasks.pop(0)
-            print(
-                f"Starting task for agent '{task.recipient}'. "
-                f"Requestor: '{task.requestor}'. "
-                f"Task description: '{task.task_description}'."
-            )
-    
-            message = await self._project_client.agents.create_message(
-                thread_id=self._thread_id,
-                role="user",
-                content=task.task_description,
-            )
-            print(f"Created message with ID: {message.id} for task in thread {self._thread_id}")
-    
-            agent = self._get_member_by_name(task.recipient)
-            if agent and agent.agent_instance:
-                # Check if agent.agent_instance has been resolved
-                if asyncio.iscoroutine(agent.agent_instance):
-                    agent_instance = await agent.agent_instance
-                    # Replace the coroutine with its result to prevent re-awaiting
-                    agent.agent_instance = agent_instance
-                else:
-                    agent_instance = agent.agent_instance
-                print('creating process {}-{}-{}'.format(self._thread_id, agent_instance.id, task.recipient))
-                run = await self._project_client.agents.create_and_process_run(
-                    thread_id=self._thread_id,
-                    assistant_id=agent_instance.id,
-                )
-                print(f"Created and processed run for agent '{agent.name}', run ID: {run.id}")
-    
-                messages = await self._project_client.agents.list_messages(thread_id=self._thread_id)
-                text_message = messages.get_last_message_by_sender(MessageRole.AGENT)
-                if text_message and text_message.get("content") and len(text_message["content"]) > 0:
-                    # Extract the text from the first content item.
-                    content_item = text_message["content"][0]
-                    text_value = print_response_with_citations(content_item.get("text", {}))
-                    # Use the assistant_id from text_message if available; otherwise fallback to agent_instance.id.
-                    assistant_id = text_message.get("assistant_id", agent_instance.id)
-                    last_message = {"assistant_id": assistant_id, "text": text_value, "agent": agent.name}
-                    agent_responses.append(last_message)
-                    print(f"Agent '{agent.name}' completed task. Outcome: {last_message}")
-                else:
-                    print(f"Agent '{agent.name}' completed task but no valid text message was returned.")
-                    
+            tasks = self._pop_parallel_tasks()
+            if len(tasks) == 1:
+                response = await self._run_task(tasks[0], self._thread_id, tasks[0].task_description)
+                if response:
+                    agent_responses.append(response)
+            else:
+                recipients = ", ".join(task.recipient for task in tasks)
+                print(f"Running {len(tasks)} tasks concurrently for agents: {recipients}")
+                conversation = await self._get_conversation(self._thread_id)
+                responses = await asyncio.gather(*(self._run_forked_task(task, conversation) for task in tasks))
+                # Outcomes are merged in task order, so the team leader's thread doesn't depend on which finished first
+                for task, response in zip(tasks, responses):
+                    if response:
+                        agent_responses.append(response)
+                        await self._project_client.agents.create_message(
+                            thread_id=self._thread_id,
+                            role="user",
+                            content=self.TEAM_LEADER_PARALLEL_TASK_RESULT.format(
+                                agent_name=response["agent"],
+                                task_description=task.task_description,
+                                result=response["text"],
+                            ),
+                        )
+
             # If no tasks remain AND the recipient is not the TeamLeader,
             # let the TeamLeader see if more delegation is needed.
-            if not self._tasks and not task.recipient == "TeamLeader":
+            if not self._tasks and not tasks[0].recipient == "TeamLeader":
                 team_leader_request = self.TEAM_LEADER_TASK_COMPLETENESS_CHECK_INSTRUCTIONS
                 task = _AgentTask(
                     recipient=self._team_leader.name, task_description=team_leader_request, requestor="user"
                 )
                 self._add_task(task)
-        return agent_responses  
-                
+        return agent_responses
+
+    def _pop_parallel_tasks(self) -> List[_AgentTask]:
+        """
+        Pop the next task, along with the pending tasks that can run concurrently with it.
+
+        Tasks for the team leader run alone, since they continue the team's thread.
+        Otherwise the first pending task of each other agent is taken, up to the next task for the team leader,
+        so that no agent works on two tasks at once.
+        """
+        assert self._team_leader is not None, "team leader must not be None"
+        tasks = [self._tasks.pop(0)]
+        if not self.parallel_tasks or tasks[0].recipient == self._team_leader.name:
+            return tasks
+        recipients = {tasks[0].recipient}
+        for task in list(self._tasks):
+            if task.recipient == self._team_leader.name:
+                break
+            if task.recipient not in recipients:
+                recipients.add(task.recipient)
+                tasks.append(task)
+                self._tasks.remove(task)
+        return tasks
+
+    async def _run_task(self, task: _AgentTask, thread_id: str, content: str) -> Optional[Dict[str, str]]:
+        """
+        Post a task to a thread and run its recipient agent on that thread.
+
+        :param task: The task to run.
+        :param thread_id: The ID of the thread to run the agent on.
+        :param content: The message that asks the agent to do the task.
+        :return: The agent's last text message, or None if it didn't return one.
+        """
+        print(
+            f"Starting task for agent '{task.recipient}'. "
+            f"Requestor: '{task.requestor}'. "
+            f"Task description: '{task.task_description}'."
+        )
+
+        message = await self._project_client.agents.create_message(
+            thread_id=thread_id,
+            role="user",
+            content=content,
+        )
+        print(f"Created message with ID: {message.id} for task in thread {thread_id}")
+
+        agent = self._get_member_by_name(task.recipient)
+        if not agent or not agent.agent_instance:
+            return None
+        # Check if agent.agent_instance has been resolved
+        if asyncio.iscoroutine(agent.agent_instance):
+            agent_instance = await agent.agent_instance
+            # Replace the coroutine with its result to prevent re-awaiting
+            agent.agent_instance = agent_instance
+        else:
+            agent_instance = agent.agent_instance
+        print('creating process {}-{}-{}'.format(thread_id, agent_instance.id, task.recipient))
+        run = await self._project_client.agents.create_and_process_run(
+            thread_id=thread_id,
+            assistant_id=agent_instance.id,
+        )
+        print(f"Created and processed run for agent '{agent.name}', run ID: {run.id}")
+
+        messages = await self._project_client.agents.list_messages(thread_id=thread_id)
+        text_message = messages.get_last_message_by_sender(MessageRole.AGENT)
+        if text_message and text_message.get("content") and len(text_message["content"]) > 0:
+            # Extract the text from the first content item.
+            content_item = text_message["content"][0]
+            text_value = print_response_with_citations(content_item.get("text", {}))
+            # Use the assistant_id from text_message if available; otherwise fallback to agent_instance.id.
+            assistant_id = text_message.get("assistant_id", agent_instance.id)
+            last_message = {"assistant_id": assistant_id, "text": text_value, "agent": agent.name}
+            print(f"Agent '{agent.name}' completed task. Outcome: {last_message}")
+            return last_message
+        print(f"Agent '{agent.name}' completed task but no valid text message was returned.")
+        return None
+
+    async def _run_forked_task(self, task: _AgentTask, conversation: str) -> Optional[Dict[str, str]]:
+        """
+        Run a task on a new thread that starts with the team's conversation so far,
+        so that it can run concurrently with tasks for other agents. The thread is deleted afterwards.
+
+        :param task: The task to run.
+        :param conversation: The team's conversation so far, from _get_conversation.
+        :return: The agent's last text message, or None if it didn't return one.
+        """
+        thread = await self._project_client.agents.create_thread()
+        print(f"Created thread with ID: {thread.id} for task of agent '{task.recipient}'")
+        try:
+            content = self.TEAM_MEMBER_PARALLEL_TASK_REQUEST.format(
+                conversation=conversation, task_description=task.task_description
+            )
+            return await self._run_task(task, thread.id, content)
+        finally:
+            await self._project_client.agents.delete_thread(thread.id)
+
+    async def _get_conversation(self, thread_id: str) -> str:
+        """
+        Get the most recent text messages of a thread, oldest first, labeled with who sent them.
+
+        :param thread_id: The ID of the thread.
+        """
+        agent_names = {}
+        for member in [self._team_leader, *self._members]:
+            if member and member.agent_instance and not asyncio.iscoroutine(member.agent_instance):
+                agent_names[member.agent_instance.id] = member.name
+        messages = await self._project_client.agents.list_messages(thread_id=thread_id)
+        lines = []
+        # Messages are listed newest first
+        for message in reversed(messages.data):
+            sender = agent_names.get(message.get("assistant_id"), message.get("role"))
+            for content_item in message.get("content", []):
+                text = content_item.get("text", {}).get("value")
+                if text:
+                    lines.append(f"{sender}: {text}")
+        return "\n".join(lines)
+
     def _get_member_by_name(self, name) -> Optional[_AgentTeamMember]:
         """
         Retrieve a team member (agent) by name.
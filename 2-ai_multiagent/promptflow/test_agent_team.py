@@ -0,0 +1,53 @@
+import pytest
+
+from agent_team import AgentTeam, _AgentTask, _AgentTeamMember
+
+
+@pytest.fixture
+def make_team():
+    team_names = []
+
+    def make_team(parallel_tasks=True):
+        team_name = f"test_team_{len(team_names)}"
+        team_names.append(team_name)
+        # The project client is only used to call the agents service, which these tests don't do
+        team = AgentTeam(team_name, project_client=object(), parallel_tasks=parallel_tasks)
+        team._team_leader = _AgentTeamMember(model="gpt-4o", name="TeamLeader", instructions="Lead the team.")
+        team._tasks = []
+        return team
+
+    yield make_team
+    for team_name in team_names:
+        AgentTeam._remove_team(team_name)
+
+
+def add_tasks(team, *recipients):
+    for index, recipient in enumerate(recipients):
+        team._add_task(_AgentTask(recipient, f"Task {index}", "TeamLeader"))
+
+
+def describe(tasks):
+    return [(task.recipient, task.task_description) for task in tasks]
+
+
+def test_pop_parallel_tasks_takes_one_task_per_agent(make_team):
+    team = make_team()
+    add_tasks(team, "Coder", "Reviewer", "Coder", "Writer")
+    assert describe(team._pop_parallel_tasks()) == [("Coder", "Task 0"), ("Reviewer", "Task 1"), ("Writer", "Task 3")]
+    assert describe(team._tasks) == [("Coder", "Task 2")]
+
+
+def test_pop_parallel_tasks_stops_at_team_leader_task(make_team):
+    team = make_team()
+    add_tasks(team, "Coder", "Reviewer", "TeamLeader", "Writer")
+    assert describe(team._pop_parallel_tasks()) == [("Coder", "Task 0"), ("Reviewer", "Task 1")]
+    assert describe(team._pop_parallel_tasks()) == [("TeamLeader", "Task 2")]
+    assert describe(team._pop_parallel_tasks()) == [("Writer", "Task 3")]
+    assert team._tasks == []
+
+
+def test_pop_parallel_tasks_honors_parallel_tasks_false(make_team):
+    team = make_team(parallel_tasks=False)
+    add_tasks(team, "Coder", "Reviewer")
+    assert describe(team._pop_parallel_tasks()) == [("Coder", "Task 0")]
+    assert describe(team._pop_parallel_tasks()) == [("Reviewer", "Task 1")]
@@ -0,0 +1,20 @@
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO
+
+
+@contextmanager
+def atomic_write(path: Path, mode: str = "w") -> Iterator[IO]:
+    """Opens a temporary file next to `path` for writing, and replaces `path` with it once the block completes,
+    so that a crash or an interrupted run never leaves a truncated file. If the block raises, `path` is unchanged."""
+    path = Path(path)
+    temp_path = path.with_name(path.name + ".tmp")
+    try:
+        with open(temp_path, mode, encoding=None if "b" in mode else "utf-8") as f:
+            yield f
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    os.replace(temp_path, path)
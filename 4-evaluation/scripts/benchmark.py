@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from .evaluate import run_evaluation, write_jsonl
+from .fake_servers import get_fake_openai_config, run_fake_chat_target, run_fake_openai
+
+logger = logging.getLogger("scripts")
+
+DEFAULT_METRICS = ["gpt_groundedness", "gpt_relevance", "gpt_coherence", "answer_length", "latency"]
+
+
+def write_benchmark_testdata(path: Path, num_rows: int):
+    """Writes synthetic test data with distinct questions, so that no target calls are shared between rows."""
+    write_jsonl(
+        path,
+        [
+            {"question": f"What is covered in section {index} of the handbook?", "truth": f"Section {index} [doc.pdf]"}
+            for index in range(num_rows)
+        ],
+    )
+
+
+def run_benchmark_case(
+    num_rows: int,
+    concurrency: int,
+    requested_metrics: list[str],
+    target_latency: float = 0.0,
+    judge_latency: float = 0.0,
+    combined_judge: bool = False,
+    trace_memory: bool = True,
+) -> dict:
+    """Runs one evaluation of `num_rows` synthetic questions against the fake target and judge, and measures it."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        testdata_path = Path(temp_dir) / "testdata.jsonl"
+        write_benchmark_testdata(testdata_path, num_rows)
+        with (
+            run_fake_chat_target(latency_mean=target_latency) as target,
+            run_fake_openai(latency_mean=judge_latency) as judge,
+        ):
+            openai_config = get_fake_openai_config(judge, model="benchmark")
+            if trace_memory:
+                tracemalloc.start()
+            start_time = time.perf_counter()
+            completed = run_evaluation(
+                openai_config=openai_config,
+                testdata_path=testdata_path,
+                results_dir=Path(temp_dir) / "results",
+                target_url=target.url,
+                requested_metrics=requested_metrics,
+                target_response_answer_jmespath="message.content",
+                target_response_context_jmespath="context.data_points.text",
+                concurrency=concurrency,
+                combined_judge=combined_judge,
+            )
+            total_seconds = time.perf_counter() - start_time
+            peak_memory = None
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if not completed:
+                raise RuntimeError(f"Benchmark evaluation of {num_rows} rows with concurrency {concurrency} failed")
+            # Each fake server also received one call checking that it's running
+            target_calls = target.request_count - 1
+            judge_calls = judge.request_count - 1
+        with open(Path(temp_dir) / "results" / "evaluate_parameters.json", encoding="utf-8") as f:
+            timings = json.load(f)["timings"]
+
+    evaluation_seconds = timings["evaluation_seconds"]
+    # Time that the rows would take if the only cost was waiting on the (fake) target and judge
+    ideal_seconds = (target_calls * target_latency + judge_calls * judge_latency) / concurrency
+    return {
+        "rows": num_rows,
+        "concurrency": concurrency,
+        "target_calls": target_calls,
+        "judge_calls": judge_calls,
+        "total_seconds": round(total_seconds, 3),
+        "evaluation_seconds": evaluation_seconds,
+        "aggregation_seconds": timings["aggregation_seconds"],
+        "rows_per_second": round(num_rows / evaluation_seconds, 2),
+        "judge_calls_per_second": round(judge_calls / evaluation_seconds, 2),
+        "overhead_per_row_ms": round((evaluation_seconds - ideal_seconds) / num_rows * 1000, 3),
+        "peak_memory_mb": round(peak_memory / 1024**2, 2) if peak_memory is not None else None,
+    }
+
+
+def run_benchmarks(
+    sizes: list[int],
+    concurrencies: list[int],
+    requested_metrics: list[str] = DEFAULT_METRICS,
+    target_latency: float = 0.0,
+    judge_latency: float = 0.0,
+    combined_judge: bool = False,
+    trace_memory: bool = True,
+) -> dict:
+    """Runs the evaluation pipeline against local fake endpoints, for every combination of dataset size
+    and concurrency, and reports throughput, per-row overhead, time spent aggregating, and peak memory.
+
+    With the default zero latency of the fake endpoints, the results measure the pipeline's own overhead.
+    Peak memory is measured with tracemalloc, which slows down the run, so it can be turned off
+    when only the throughput matters.
+    """
+    cases = []
+    for num_rows in sizes:
+        for concurrency in concurrencies:
+            logger.info("Benchmarking %d rows with concurrency %d", num_rows, concurrency)
+            case = run_benchmark_case(
+                num_rows,
+                concurrency,
+                requested_metrics,
+                target_latency=target_latency,
+                judge_latency=judge_latency,
+                combined_judge=combined_judge,
+                trace_memory=trace_memory,
+            )
+            logger.info(
+                "%d rows with concurrency %d: %.1f rows/sec, %.2f ms overhead per row",
+                num_rows,
+                concurrency,
+                case["rows_per_second"],
+                case["overhead_per_row_ms"],
+            )
+            cases.append(case)
+    return {
+        "timestamp": int(time.time()),
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "settings": {
+            "requested_metrics": requested_metrics,
+            "target_latency": target_latency,
+            "judge_latency": judge_latency,
+            "combined_judge": combined_judge,
+            "trace_memory": trace_memory,
+        },
+        "cases": cases,
+    }
+
+
+def find_benchmark_regressions(baseline: dict, results: dict, tolerance: float = 0.2) -> list[str]:
+    """Compares benchmark results to a baseline run with the same sizes and concurrencies,
+    returning a description of each case whose throughput dropped by more than `tolerance` (relative)."""
+    baseline_cases = {(case["rows"], case["concurrency"]): case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        baseline_case = baseline_cases.get((case["rows"], case["concurrency"]))
+        if baseline_case is None:
+            continue
+        change = case["rows_per_second"] / baseline_case["rows_per_second"] - 1
+        if change < -tolerance:
+            regressions.append(
+                f"{case['rows']} rows with concurrency {case['concurrency']}: "
+                f"{case['rows_per_second']:g} rows/sec vs. {baseline_case['rows_per_second']:g} ({change:+.0%})"
+            )
+    return regressions
@@ -0,0 +1,76 @@
+import json
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger("scripts")
+
+
+class TargetCassette:
+    """Recording of target responses, stored as a JSONL file with one response per question text.
+
+    In "record" mode, the target is always called, and each successful response is appended to the file
+    as it arrives, along with the target URL and parameters that produced it. A question that was recorded before
+    is recorded again, and the latest entry for a question is the one that's replayed.
+    In "replay" mode, responses are read back from the file instead of calling the target,
+    so that metrics and prompts can be iterated on without re-running the target.
+    """
+
+    def __init__(self, path: Path, mode: str, target_url: str | None = None, target_parameters: dict | None = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode}, must be 'record' or 'replay'")
+        self.path = Path(path)
+        self.mode = mode
+        self.target_url = target_url
+        self.target_parameters = target_parameters or {}
+        self._entries = {}
+        self._lock = threading.Lock()
+        if mode == "record":
+            return
+        if not self.path.exists():
+            raise FileNotFoundError(f"Cassette {self.path} does not exist, record it first with --record")
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["question"]] = entry
+        logger.info("Loaded %d recorded target responses from %s", len(self._entries), self.path)
+        self.warn_about_other_targets()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def warn_about_other_targets(self):
+        """Warns if responses were recorded with a different target URL or parameters than the current ones."""
+        other_targets = [
+            entry
+            for entry in self._entries.values()
+            # Cassettes recorded before the target was saved can't be checked
+            if "target_url" in entry
+            and (entry["target_url"] != self.target_url or entry["target_parameters"] != self.target_parameters)
+        ]
+        if other_targets:
+            logger.warning(
+                "%d of the responses in %s were recorded with a different target URL or parameters (like %s with %s)",
+                len(other_targets),
+                self.path,
+                other_targets[0]["target_url"],
+                other_targets[0]["target_parameters"],
+            )
+
+    def get(self, question: str) -> dict | None:
+        entry = self._entries.get(question)
+        return entry["response"] if entry else None
+
+    def record(self, question: str, response: dict):
+        entry = {
+            "question": question,
+            "response": response,
+            "target_url": self.target_url,
+            "target_parameters": self.target_parameters,
+        }
+        with self._lock:
+            self._entries[question] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
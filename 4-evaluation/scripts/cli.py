@@ -1,3 +1,4 @@
+import json
 import logging
 from pathlib import Path
 
@@ -6,8 +7,14 @@ import typer
 from rich.logging import RichHandler
 
 from . import service_setup
+from .benchmark import DEFAULT_METRICS, find_benchmark_regressions, run_benchmarks
+from .compare import compare_runs, print_comparison
+from .dedup import dedup_jsonl
 from .evaluate import run_evaluate_from_config
 from .generate import generate_dontknows_qa_data, generate_test_qa_data
+from .merge import merge_shard_results
+from .recompute import recompute_metrics
+from .testdata import parse_shard
 
 app = typer.Typer(pretty_exceptions_enable=False)
 
@@ -43,8 +50,204 @@ def evaluate(
         default=None,
         parser=str_or_none,
     ),
+    concurrency: int | None = typer.Option(
+        help="Number of target calls to run concurrently (defaults to the one in the config, or 1).",
+        default=None,
+        parser=int_or_none,
+    ),
+    judgeconcurrency: int | None = typer.Option(
+        help="Number of GPT judge calls to run concurrently (defaults to the one in the config, or the concurrency).",
+        default=None,
+        parser=int_or_none,
+    ),
+    resume: Path | None = typer.Option(
+        exists=True,
+        dir_okay=True,
+        file_okay=False,
+        help="Results directory of an interrupted evaluation to resume, skipping the rows it already completed.",
+        default=None,
+    ),
+    judgecache: bool = typer.Option(
+        True,
+        "--judge-cache/--no-judge-cache",
+        help="Reuse GPT judge results cached by previous runs for identical inputs.",
+    ),
+    record: Path | None = typer.Option(
+        dir_okay=False,
+        file_okay=True,
+        help="Path of a cassette file to record the target's responses to, for replaying later.",
+        default=None,
+    ),
+    replay: Path | None = typer.Option(
+        exists=True,
+        dir_okay=False,
+        file_okay=True,
+        help="Path of a cassette file to replay the target's responses from, instead of calling the target.",
+        default=None,
+    ),
+    combinedjudge: bool = typer.Option(
+        False,
+        help="Score all supported GPT rating metrics with a single judge call per question (defaults to the config).",
+    ),
+    sampling: str | None = typer.Option(
+        help="How to select the questions: head, reservoir, or stratified (defaults to the config, or head).",
+        default=None,
+        parser=str_or_none,
+    ),
+    seed: int | None = typer.Option(
+        help="Random seed for reservoir and stratified sampling (defaults to the config).",
+        default=None,
+        parser=int_or_none,
+    ),
+    stratify: str | None = typer.Option(
+        help="Field to stratify questions by, like context, or citation for the source cited in the truth.",
+        default=None,
+        parser=str_or_none,
+    ),
+    offset: int | None = typer.Option(
+        help="Number of rows to skip at the start of the test data (defaults to the config, or 0).",
+        default=None,
+        parser=int_or_none,
+    ),
+    limit: int | None = typer.Option(
+        help="Maximum number of rows of the test data to read, after the offset (defaults to all).",
+        default=None,
+        parser=int_or_none,
+    ),
+    shard: str | None = typer.Option(
+        help="Only evaluate one shard of the test data, like 2/4 for the second of four shards.",
+        default=None,
+        parser=str_or_none,
+    ),
+):
+    if record and replay:
+        raise typer.BadParameter("Only one of --record and --replay can be specified.")
+    try:
+        parsed_shard = parse_shard(shard) if shard else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--shard")
+    run_evaluate_from_config(
+        Path.cwd(),
+        config,
+        numquestions,
+        targeturl,
+        concurrency=concurrency,
+        judge_concurrency=judgeconcurrency,
+        resume_dir=resume,
+        use_judge_cache=judgecache,
+        record_path=record,
+        replay_path=replay,
+        combined_judge=combinedjudge,
+        sampling=sampling,
+        seed=seed,
+        stratify_field=stratify,
+        offset=offset,
+        limit=limit,
+        shard=parsed_shard,
+    )
+
+
+@app.command()
+def merge(
+    shards: list[Path] = typer.Argument(
+        exists=True, dir_okay=True, file_okay=False, help="Results directories of the shards to merge"
+    ),
+    output: Path = typer.Option(dir_okay=True, file_okay=False, help="Directory to write the merged results to"),
+):
+    merge_shard_results([Path.cwd() / shard for shard in shards], Path.cwd() / output)
+
+
+@app.command()
+def compare(
+    runs: list[Path] = typer.Argument(
+        exists=True,
+        dir_okay=True,
+        file_okay=False,
+        help="Results directories to compare, starting with the baseline that the others are compared to",
+    ),
+    threshold: float = typer.Option(
+        0.05, help="Relative change in a metric's mean that counts as a regression, if it is significant"
+    ),
+    significance: float = typer.Option(0.05, help="p-value below which a change is considered significant"),
+    output: Path | None = typer.Option(
+        dir_okay=False, file_okay=True, help="Path to save the comparison to, as JSON", default=None
+    ),
+    failonregression: bool = typer.Option(False, help="Exit with an error if any run has a regression"),
+):
+    if len(runs) < 2:
+        raise typer.BadParameter("At least two results directories are needed to compare.")
+    comparison = compare_runs([Path.cwd() / run for run in runs], threshold=threshold, significance=significance)
+    print_comparison(comparison)
+    if output:
+        with open(Path.cwd() / output, "w", encoding="utf-8") as f:
+            f.write(json.dumps(comparison, indent=4))
+    regressions = [
+        f"{run_name}: {metric_name}"
+        for run_name, run_comparison in comparison["runs"].items()
+        for metric_name, stats in run_comparison.items()
+        if stats["regression"]
+    ]
+    if regressions:
+        logger.warning("Regressions found in %s", ", ".join(regressions))
+        if failonregression:
+            raise typer.Exit(code=1)
+
+
+@app.command()
+def recompute(
+    results: Path = typer.Option(
+        exists=True, dir_okay=True, file_okay=False, help="Results directory of the evaluation to update"
+    ),
+    metric: list[str] = typer.Option(
+        None,
+        help="Metric to recompute, like answer_length (can be repeated). "
+        "Defaults to all the requested metrics that can be recomputed from the saved results.",
+    ),
+):
+    recompute_metrics(Path.cwd() / results, metric or None)
+
+
+@app.command()
+def benchmark(
+    size: list[int] = typer.Option([100, 1000], help="Number of questions to evaluate (can be repeated)."),
+    concurrency: list[int] = typer.Option([1, 8], help="Number of rows to evaluate concurrently (can be repeated)."),
+    metric: list[str] = typer.Option(DEFAULT_METRICS, help="Metric to evaluate (can be repeated)."),
+    targetlatency: float = typer.Option(0.0, help="Seconds that the fake target takes to answer each question."),
+    judgelatency: float = typer.Option(0.0, help="Seconds that the fake GPT judge takes to answer each call."),
+    combinedjudge: bool = typer.Option(False, help="Score the GPT rating metrics in a single judge call per row."),
+    tracememory: bool = typer.Option(True, help="Measure peak memory, which slows down the evaluation."),
+    output: Path = typer.Option(
+        dir_okay=False, file_okay=True, help="Path to save the benchmark results to, as JSON", default="benchmark.json"
+    ),
+    baseline: Path | None = typer.Option(
+        exists=True,
+        dir_okay=False,
+        file_okay=True,
+        help="Results of a previous benchmark, to exit with an error if the throughput regressed.",
+        default=None,
+    ),
+    tolerance: float = typer.Option(
+        0.2, help="Relative drop in rows/sec from the baseline that counts as a regression"
+    ),
 ):
-    run_evaluate_from_config(Path.cwd(), config, numquestions, targeturl)
+    results = run_benchmarks(
+        sizes=size,
+        concurrencies=concurrency,
+        requested_metrics=metric,
+        target_latency=targetlatency,
+        judge_latency=judgelatency,
+        combined_judge=combinedjudge,
+        trace_memory=tracememory,
+    )
+    with open(Path.cwd() / output, "w", encoding="utf-8") as f:
+        f.write(json.dumps(results, indent=4))
+    logger.info("Benchmark results saved in %s", output)
+    if baseline:
+        with open(Path.cwd() / baseline, encoding="utf-8") as f:
+            regressions = find_benchmark_regressions(json.load(f), results, tolerance=tolerance)
+        if regressions:
+            logger.error("Throughput regressed from the baseline:\n%s", "\n".join(regressions))
+            raise typer.Exit(code=1)
 
 
 @app.command()
@@ -52,6 +255,27 @@ def generate(
     output: Path = typer.Option(exists=False, dir_okay=False, file_okay=True),
     numquestions: int = typer.Option(help="Number of questions to generate", default=200),
     persource: int = typer.Option(help="Number of questions to generate per source", default=5),
+    concurrency: int = typer.Option(help="Number of search documents to generate questions for at once", default=4),
+    requestsperminute: int | None = typer.Option(
+        help="Maximum number of calls to the GPT deployment per minute", default=None, parser=int_or_none
+    ),
+    tokensperminute: int | None = typer.Option(
+        help="Maximum number of tokens sent to the GPT deployment per minute", default=None, parser=int_or_none
+    ),
+    dedupindex: Path | None = typer.Option(
+        dir_okay=False,
+        file_okay=True,
+        help="Index of previously generated questions, to skip near-duplicates of them. It's created if missing.",
+        default=None,
+    ),
+    incremental: bool = typer.Option(
+        True,
+        "--incremental/--no-incremental",
+        help="Reuse the questions of search documents that haven't changed since the last run, from its manifest.",
+    ),
+    keyfield: str = typer.Option(
+        help="Unique key field of the search index, to page through it in order", default="id"
+    ),
 ):
     generate_test_qa_data(
         openai_config=service_setup.get_openai_config_dict(),
@@ -59,6 +283,11 @@ def generate(
         num_questions_total=numquestions,
         num_questions_per_source=persource,
         output_file=Path.cwd() / output,
+        concurrency=concurrency,
+        rate_limits={"requests_per_minute": requestsperminute, "tokens_per_minute": tokensperminute},
+        dedup_index_path=Path.cwd() / dedupindex if dedupindex else None,
+        incremental=incremental,
+        key_field=keyfield,
     )
 
 
@@ -67,12 +296,52 @@ def generate_dontknows(
     input: Path = typer.Option(exists=True, dir_okay=False, file_okay=True),
     output: Path = typer.Option(exists=False, dir_okay=False, file_okay=True),
     numquestions: int = typer.Option(help="Number of questions to generate", default=40),
+    dedupindex: Path | None = typer.Option(
+        dir_okay=False,
+        file_okay=True,
+        help="Index of previously generated questions, to skip near-duplicates of them. It's created if missing.",
+        default=None,
+    ),
+    questiontokens: int = typer.Option(
+        help="Maximum number of tokens of input questions to include in each prompt", default=2000
+    ),
+    seed: int | None = typer.Option(
+        help="Random seed for sampling the input questions to include in the prompts",
+        default=None,
+        parser=int_or_none,
+    ),
 ):
     generate_dontknows_qa_data(
         openai_config=service_setup.get_openai_config(),
         num_questions_total=numquestions,
         input_file=Path.cwd() / input,
         output_file=Path.cwd() / output,
+        dedup_index_path=Path.cwd() / dedupindex if dedupindex else None,
+        question_token_budget=questiontokens,
+        seed=seed,
+    )
+
+
+@app.command()
+def dedup(
+    input: Path = typer.Option(exists=True, dir_okay=False, file_okay=True),
+    output: Path = typer.Option(exists=False, dir_okay=False, file_okay=True),
+    threshold: float = typer.Option(
+        0.7, help="Estimated similarity (0-1) of two questions' character shingles above which they are duplicates"
+    ),
+    index: Path | None = typer.Option(
+        dir_okay=False,
+        file_okay=True,
+        help="Index of previously generated questions, to also skip near-duplicates of them. "
+        "It's created if missing, and updated with the questions that are kept.",
+        default=None,
+    ),
+):
+    dedup_jsonl(
+        input_file=Path.cwd() / input,
+        output_file=Path.cwd() / output,
+        threshold=threshold,
+        index_path=Path.cwd() / index if index else None,
     )
 
 
@@ -0,0 +1,166 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rich.console import Console
+from rich.table import Table
+
+from .atomic_write import atomic_write
+from .evaluate_metrics import metrics_by_name
+from .evaluate_metrics.online_stats import FAILED_VALUE
+from .results_store import load_results
+
+logger = logging.getLogger("scripts")
+
+CACHE_FILENAME = ".eval_results.cache.parquet"
+# Key of the Parquet metadata that records which version of eval_results.jsonl the cache was parsed from
+SOURCE_VERSION_KEY = b"eval_results_version"
+
+
+def read_cached_metrics(cache_path: Path, source_version: list[int]) -> pd.DataFrame | None:
+    """Returns the cached metrics, unless the cache is missing, unreadable, or from another version of the results."""
+    if not cache_path.exists():
+        return None
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+        if json.loads(metadata.get(SOURCE_VERSION_KEY, b"null")) != source_version:
+            return None
+        return pq.read_table(cache_path).to_pandas()
+    except (OSError, pa.ArrowException, ValueError) as e:
+        logger.warning("Ignoring the unreadable cache %s: %s", cache_path, e)
+        return None
+
+
+def write_cached_metrics(cache_path: Path, source_version: list[int], metrics: pd.DataFrame):
+    table = pa.Table.from_pandas(metrics)
+    table = table.replace_schema_metadata({**table.schema.metadata, SOURCE_VERSION_KEY: json.dumps(source_version)})
+    with atomic_write(cache_path, "wb") as f:
+        pq.write_table(table, f)
+
+
+def load_run(results_dir: Path) -> pd.DataFrame:
+    """Loads the metric values of an evaluation's results as numeric columns, indexed by question.
+    Invalid values (like "Failed" ratings, or -1 from code metrics) are NaN, and repeated questions are averaged.
+    The parsed results are cached in the results directory, until eval_results.jsonl changes."""
+    results_path = results_dir / "eval_results.jsonl"
+    cache_path = results_dir / CACHE_FILENAME
+    source_stat = results_path.stat()
+    source_version = [source_stat.st_mtime_ns, source_stat.st_size]
+    cached_metrics = read_cached_metrics(cache_path, source_version)
+    if cached_metrics is not None:
+        return cached_metrics
+
+    parameters_path = results_dir / "evaluate_parameters.json"
+    requested_metrics = None
+    if parameters_path.exists():
+        requested_metrics = json.loads(parameters_path.read_text(encoding="utf-8")).get("requested_metrics")
+    metric_names = [name for name in (requested_metrics or metrics_by_name) if name in metrics_by_name]
+
+    df = load_results(results_dir, columns=["question", *metric_names])
+    for metric_name in df.columns.drop("question"):
+        values = pd.to_numeric(df[metric_name], errors="coerce")
+        if metrics_by_name[metric_name].PASS_THRESHOLD is None:
+            values = values.where(values != FAILED_VALUE)
+        df[metric_name] = values.astype(float)
+    metrics = df.groupby("question", sort=False).mean()
+
+    try:
+        write_cached_metrics(cache_path, source_version, metrics)
+    except OSError as e:
+        logger.warning("Couldn't cache the parsed results of %s: %s", results_dir, e)
+    return metrics
+
+
+def paired_permutation_test(differences: np.ndarray, signs: np.ndarray) -> np.ndarray:
+    """Two-sided p-values for the mean of each column of paired differences being zero,
+    using a sign-flip permutation test. NaN differences are left out of their column.
+    All the columns are tested at once, with the same random signs (one row per permutation)."""
+    differences = np.nan_to_num(differences)
+    observed = np.abs(differences.sum(axis=0))
+    # Flipping the sign of a zero difference doesn't change the sum, so NaN pairs drop out of each column's test
+    permuted = np.abs(signs[:, : len(differences)] @ differences)
+    # A small tolerance, so that permutations tied with the observed sum aren't missed due to rounding
+    extreme_count = (permuted >= observed - 1e-9 * np.maximum(observed, 1)).sum(axis=0)
+    return (extreme_count + 1) / (len(signs) + 1)
+
+
+def compare_runs(
+    run_dirs: list[Path], threshold: float = 0.05, significance: float = 0.05, permutations: int = 1000, seed: int = 0
+) -> dict:
+    """Compares each run's metrics to the first run (the baseline), on the questions they have in common.
+
+    For each metric, reports the means over the common questions, the change in the mean, and the p-value
+    of a paired permutation test. A change is flagged as a regression if it's significant, in the wrong direction
+    for the metric, and bigger than `threshold` relative to the baseline mean.
+    """
+    runs = {str(run_dir): load_run(run_dir) for run_dir in run_dirs}
+    baseline_name, baseline = next(iter(runs.items()))
+    max_pairs = max(len(run) for run in runs.values())
+    # The same random signs are shared by all the tests, so they're only drawn once
+    signs = np.random.default_rng(seed).choice(np.array([-1.0, 1.0]), size=(permutations, max_pairs))
+
+    comparison = {"baseline": baseline_name, "runs": {}}
+    for run_name, run in list(runs.items())[1:]:
+        metric_names = [metric_name for metric_name in baseline.columns if metric_name in run.columns]
+        joined = baseline[metric_names].join(run[metric_names], how="inner", lsuffix="_baseline")
+        baseline_values = joined[[f"{metric_name}_baseline" for metric_name in metric_names]].to_numpy()
+        run_values = joined[metric_names].to_numpy()
+        # Only questions with a valid value in both runs are compared
+        paired = ~np.isnan(baseline_values) & ~np.isnan(run_values)
+        differences = np.where(paired, run_values - baseline_values, np.nan)
+        pair_counts = paired.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            baseline_means = np.where(paired, baseline_values, 0).sum(axis=0) / pair_counts
+            run_means = np.where(paired, run_values, 0).sum(axis=0) / pair_counts
+        p_values = paired_permutation_test(differences, signs)
+
+        run_comparison = {}
+        for index, metric_name in enumerate(metric_names):
+            if not pair_counts[index]:
+                continue
+            delta = run_means[index] - baseline_means[index]
+            relative_delta = delta / abs(baseline_means[index]) if baseline_means[index] else None
+            higher_is_better = metrics_by_name[metric_name].HIGHER_IS_BETTER
+            regression = bool(
+                higher_is_better is not None
+                and p_values[index] < significance
+                and (delta < 0 if higher_is_better else delta > 0)
+                and (relative_delta is None or abs(relative_delta) > threshold)
+            )
+            run_comparison[metric_name] = {
+                "pairs": int(pair_counts[index]),
+                "baseline_mean": round(float(baseline_means[index]), 3),
+                "mean": round(float(run_means[index]), 3),
+                "delta": round(float(delta), 3),
+                "relative_delta": round(float(relative_delta), 3) if relative_delta is not None else None,
+                "p_value": round(float(p_values[index]), 4),
+                "regression": regression,
+            }
+        comparison["runs"][run_name] = run_comparison
+        logger.info("Compared %s to the baseline on %d common questions", run_name, len(joined))
+    return comparison
+
+
+def print_comparison(comparison: dict):
+    console = Console()
+    for run_name, run_comparison in comparison["runs"].items():
+        table = Table(title=f"{run_name} vs. {comparison['baseline']}")
+        for column in ("metric", "pairs", "baseline", "run", "delta", "relative", "p-value", ""):
+            table.add_column(column, justify="left" if column == "metric" else "right")
+        for metric_name, stats in run_comparison.items():
+            relative_delta = f"{stats['relative_delta']:+.1%}" if stats["relative_delta"] is not None else ""
+            table.add_row(
+                metric_name,
+                str(stats["pairs"]),
+                f"{stats['baseline_mean']:g}",
+                f"{stats['mean']:g}",
+                f"{stats['delta']:+g}",
+                relative_delta,
+                f"{stats['p_value']:.4f}",
+                "[red]regression[/red]" if stats["regression"] else "",
+            )
+        console.print(table)
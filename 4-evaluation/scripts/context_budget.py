@@ -0,0 +1,85 @@
+import functools
+import logging
+import re
+
+import tiktoken
+
+logger = logging.getLogger("scripts")
+
+# Data points are joined with blank lines into the context, in send_question_to_target()
+CHUNK_SEPARATOR = "\n\n"
+WORD_PATTERN = re.compile(r"\w{3,}")
+CITATION_PATTERN = re.compile(r"\[([^\]]+)\]")
+
+
+class ApproximateEncoding:
+    """Stand-in for a tiktoken encoding, using ~4 characters per token like estimate_tokens(),
+    for when the tokenizer files can't be downloaded."""
+
+    def encode(self, text: str) -> list[str]:
+        return [text[index : index + 4] for index in range(0, len(text), 4)]
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+@functools.cache
+def get_encoding(model: str | None = None):
+    """Returns the tokenizer for a model, defaulting to the one used by GPT-4 and GPT-3.5."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads the tokenizer files on first use, which fails without network access
+        logger.warning("Couldn't load a tokenizer, approximating token counts from characters instead: %s", e)
+        return ApproximateEncoding()
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    return len(get_encoding(model).encode(text or ""))
+
+
+def rank_chunks(chunks: list[str], answer: str) -> list[int]:
+    """Returns the indexes of the chunks, from most to least relevant to the answer:
+    first the chunks from sources that the answer cites, then by the number of the answer's words they contain.
+    Ties keep the retrieval order."""
+    answer_words = set(WORD_PATTERN.findall(answer.lower()))
+    citations = set(CITATION_PATTERN.findall(answer))
+
+    def get_rank(index):
+        chunk = chunks[index]
+        # Chunks start with their source, like "handbook.pdf#page=2: ..."
+        source = chunk.split(":", 1)[0].strip()
+        overlap = len(answer_words.intersection(WORD_PATTERN.findall(chunk.lower())))
+        return (source not in citations, -overlap, index)
+
+    return sorted(range(len(chunks)), key=get_rank)
+
+
+def truncate_context(context: str, answer: str, max_tokens: int, model: str | None = None) -> tuple[str, int]:
+    """Trims a context to at most `max_tokens` tokens, keeping the chunks most relevant to the answer.
+    Kept chunks stay in their original order. If even the most relevant chunk doesn't fit, it's cut short.
+    Returns the trimmed context and the number of tokens that were dropped."""
+    encoding = get_encoding(model)
+    chunks = (context or "").split(CHUNK_SEPARATOR)
+    chunk_tokens = [encoding.encode(chunk) for chunk in chunks]
+    separator_tokens = len(encoding.encode(CHUNK_SEPARATOR))
+    total_tokens = sum(len(tokens) for tokens in chunk_tokens) + separator_tokens * (len(chunks) - 1)
+    if total_tokens <= max_tokens:
+        return context, 0
+
+    kept = {}
+    used_tokens = 0
+    for index in rank_chunks(chunks, answer or ""):
+        needed_tokens = len(chunk_tokens[index]) + (separator_tokens if kept else 0)
+        if used_tokens + needed_tokens <= max_tokens:
+            kept[index] = chunks[index]
+            used_tokens += needed_tokens
+        elif not kept:
+            kept[index] = encoding.decode(chunk_tokens[index][:max_tokens])
+            used_tokens = max_tokens
+            break
+    truncated_context = CHUNK_SEPARATOR.join(kept[index] for index in sorted(kept))
+    return truncated_context, total_tokens - used_tokens
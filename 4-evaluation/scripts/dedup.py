@@ -0,0 +1,215 @@
+import json
+import logging
+import re
+from pathlib import Path
+
+import numpy as np
+
+from .atomic_write import atomic_write
+
+logger = logging.getLogger("scripts")
+
+NON_WORD_PATTERN = re.compile(r"\W+")
+# Odd 64-bit constant used to mix the shingle hashes (from splitmix64)
+MIX_CONSTANT = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases a text and collapses its punctuation and whitespace, so that they don't affect similarity."""
+    return NON_WORD_PATTERN.sub(" ", str(text).lower()).strip()
+
+
+class NearDuplicateIndex:
+    """Index of texts (like generated questions) that finds near-duplicates with MinHash and locality-sensitive hashing.
+
+    Each text is represented by its character shingles (substrings of `shingle_size` characters). Its MinHash signature
+    estimates the Jaccard similarity of the shingles of two texts, and the signatures are split into `num_bands` bands
+    of `rows_per_band` values, so that only texts that share a whole band are compared. Texts whose estimated similarity
+    with an indexed text is at least `threshold` are near-duplicates.
+    The signatures can be saved and loaded, so that the index is reused across generation runs.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.7,
+        num_bands: int = 16,
+        rows_per_band: int = 8,
+        shingle_size: int = 5,
+        seed: int = 0,
+    ):
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.shingle_size = shingle_size
+        self.seed = seed
+        num_permutations = num_bands * rows_per_band
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash functions, which stand in for random permutations of the shingle hashes
+        self._multipliers = rng.integers(1, 2**63, size=num_permutations, dtype=np.uint64) | np.uint64(1)
+        self._increments = rng.integers(0, 2**63, size=num_permutations, dtype=np.uint64)
+        self._powers = MIX_CONSTANT ** np.arange(shingle_size, dtype=np.uint64)
+        self._band_multipliers = rng.integers(1, 2**63, size=rows_per_band, dtype=np.uint64) | np.uint64(1)
+        self._signatures = np.empty((0, num_permutations), dtype=np.uint32)
+        self._new_signatures = []
+        self._buckets = [{} for _ in range(num_bands)]
+        # Positions of removed texts, which are skipped by lookups and left out when saving
+        self._removed = set()
+
+    def __len__(self) -> int:
+        return self._num_positions() - len(self._removed)
+
+    def _num_positions(self) -> int:
+        return len(self._signatures) + len(self._new_signatures)
+
+    def compute_signatures(self, texts: list[str], batch_size: int = 2000) -> np.ndarray:
+        """Computes the MinHash signatures of texts, vectorized over batches of texts."""
+        signatures = np.empty((len(texts), len(self._multipliers)), dtype=np.uint32)
+        for start in range(0, len(texts), batch_size):
+            encoded = [
+                # Texts shorter than a shingle are padded, so that every text has at least one shingle
+                normalize_text(text).encode().ljust(self.shingle_size, b"\0")
+                for text in texts[start : start + batch_size]
+            ]
+            lengths = np.array([len(text) for text in encoded])
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+            windows = np.lib.stride_tricks.sliding_window_view(data, self.shingle_size)
+            shingle_hashes = windows @ self._powers
+            # Only the windows that are within a single text are shingles
+            shingle_counts = lengths - self.shingle_size + 1
+            shingle_starts = np.repeat(offsets - np.cumsum(np.concatenate(([0], shingle_counts[:-1]))), shingle_counts)
+            shingle_hashes = shingle_hashes[shingle_starts + np.arange(shingle_counts.sum())] * MIX_CONSTANT
+            # One row per hash function, which is much faster to reduce than one column per hash function
+            hashed = np.multiply.outer(self._multipliers, shingle_hashes)
+            hashed += self._increments[:, None]
+            hashed >>= np.uint64(32)
+            segment_starts = np.concatenate(([0], np.cumsum(shingle_counts)[:-1]))
+            signatures[start : start + len(encoded)] = np.minimum.reduceat(hashed, segment_starts, axis=1).T
+        return signatures
+
+    def get_band_keys(self, signatures: np.ndarray) -> list[list[int]]:
+        """Hashes each band of each signature to a single number, so that texts sharing a band share a key."""
+        bands = signatures.reshape(len(signatures), self.num_bands, self.rows_per_band).astype(np.uint64)
+        return (bands * self._band_multipliers).sum(axis=2, dtype=np.uint64).tolist()
+
+    def _get_signature(self, index: int) -> np.ndarray:
+        if index < len(self._signatures):
+            return self._signatures[index]
+        return self._new_signatures[index - len(self._signatures)]
+
+    def find_duplicate(self, signature: np.ndarray, band_keys: list[int]) -> int | None:
+        """Returns the position of an indexed text that is a near-duplicate of the signature's text, or None."""
+        checked = set()
+        for bucket, band_key in zip(self._buckets, band_keys):
+            for candidate in bucket.get(band_key, ()):
+                if candidate in checked or candidate in self._removed:
+                    continue
+                checked.add(candidate)
+                if np.mean(self._get_signature(candidate) == signature) >= self.threshold:
+                    return candidate
+        return None
+
+    def _insert(self, signature: np.ndarray, band_keys: list[int]):
+        position = self._num_positions()
+        self._new_signatures.append(signature)
+        for bucket, band_key in zip(self._buckets, band_keys):
+            bucket.setdefault(band_key, []).append(position)
+
+    def add_all(self, texts: list[str]) -> list[bool]:
+        """Adds the texts that aren't near-duplicates of an indexed text (or of an earlier text in the list),
+        returning whether each text was added."""
+        added = []
+        signatures = self.compute_signatures(texts)
+        for signature, band_keys in zip(signatures, self.get_band_keys(signatures)):
+            is_new = self.find_duplicate(signature, band_keys) is None
+            if is_new:
+                self._insert(signature, band_keys)
+            added.append(is_new)
+        return added
+
+    def add(self, text: str) -> bool:
+        """Adds a text if it isn't a near-duplicate of an indexed text, returning whether it was added."""
+        return self.add_all([text])[0]
+
+    def remove_all(self, texts: list[str]) -> int:
+        """Removes the indexed texts that are the same as the given texts, returning how many were removed."""
+        num_removed = 0
+        signatures = self.compute_signatures(texts)
+        for signature, band_keys in zip(signatures, self.get_band_keys(signatures)):
+            # The same text has the same signature, so it's in the same bucket of every band
+            for candidate in self._buckets[0].get(band_keys[0], ()):
+                if candidate not in self._removed and np.array_equal(self._get_signature(candidate), signature):
+                    self._removed.add(candidate)
+                    num_removed += 1
+                    break
+        return num_removed
+
+    def save(self, path: Path):
+        """Saves the signatures of the indexed texts, which is all that's needed to rebuild the index."""
+        signatures = self._signatures
+        if self._new_signatures:
+            signatures = np.concatenate([signatures, np.array(self._new_signatures, dtype=np.uint32)])
+        if self._removed:
+            signatures = np.delete(signatures, sorted(self._removed), axis=0)
+        # Saved through a file object, so that numpy doesn't add a .npz extension to the path
+        with atomic_write(path, "wb") as f:
+            np.savez(
+                f,
+                signatures=signatures,
+                settings=np.array([self.threshold, self.num_bands, self.rows_per_band, self.shingle_size, self.seed]),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "NearDuplicateIndex":
+        with np.load(path) as data:
+            threshold, num_bands, rows_per_band, shingle_size, seed = data["settings"]
+            index = cls(float(threshold), int(num_bands), int(rows_per_band), int(shingle_size), int(seed))
+            index._signatures = data["signatures"]
+        for position, band_keys in enumerate(index.get_band_keys(index._signatures)):
+            for bucket, band_key in zip(index._buckets, band_keys):
+                bucket.setdefault(band_key, []).append(position)
+        return index
+
+    @classmethod
+    def load_or_create(cls, path: Path | None, threshold: float = 0.7) -> "NearDuplicateIndex":
+        """Loads the index saved at a path, if there is one, or else creates an empty index."""
+        if path is not None and Path(path).exists():
+            index = cls.load(path)
+            logger.info("Loaded near-duplicate index of %d questions from %s", len(index), path)
+            return index
+        return cls(threshold=threshold)
+
+
+def load_index_for_output(path: Path | None, output_file: Path, threshold: float = 0.7) -> NearDuplicateIndex:
+    """Loads or creates the index for generating questions into an output file. The questions already in
+    the output file are removed from the index, since they're about to be overwritten: otherwise they'd be
+    near-duplicates of their own regeneration."""
+    index = NearDuplicateIndex.load_or_create(path, threshold=threshold)
+    if len(index) and Path(output_file).exists():
+        with open(output_file, encoding="utf-8") as f:
+            questions = [json.loads(line)["question"] for line in f if line.strip()]
+        num_removed = index.remove_all(questions)
+        if num_removed:
+            logger.info("Removed %d questions of %s from the near-duplicate index", num_removed, output_file)
+    return index
+
+
+def dedup_jsonl(input_file: Path, output_file: Path, threshold: float = 0.7, index_path: Path | None = None) -> int:
+    """Writes the rows of a JSONL file whose questions aren't near-duplicates of an earlier question
+    (or of a question in the index at `index_path`, which is then updated), returning the number of rows written."""
+    with open(input_file, encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    index = load_index_for_output(index_path, output_file, threshold=threshold)
+    added = index.add_all([json.loads(line)["question"] for line in lines])
+    directory = Path(output_file).parent
+    if not directory.exists():
+        directory.mkdir(parents=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.writelines(line if line.endswith("\n") else line + "\n" for line, is_new in zip(lines, added) if is_new)
+    if index_path is not None:
+        index.save(index_path)
+    num_written = sum(added)
+    logger.info(
+        "Removed %d near-duplicate questions, wrote %d to %s", len(lines) - num_written, num_written, output_file
+    )
+    return num_written
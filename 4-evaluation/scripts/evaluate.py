@@ -1,18 +1,41 @@
+import collections
+import hashlib
+import itertools
 import json
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import jmespath
 import pandas as pd
 import requests
-from rich.progress import track
+from rich.progress import Progress, TextColumn
 
 from . import service_setup
+from .atomic_write import atomic_write
+from .cassette import TargetCassette
+from .context_budget import truncate_context
 from .evaluate_metrics import metrics_by_name
+from .evaluate_metrics.bootstrap import bootstrap_confidence_intervals
+from .evaluate_metrics.combined_metrics import CombinedRatingEvaluator
+from .evaluate_metrics.online_stats import OnlineSummary
+from .http_client import create_target_session, get_connect_time, reset_connect_time
+from .judge_cache import JudgeCache
+from .rate_limit import RateLimiter, TooManyRequestsError
+from .results_store import load_results, write_results_parquet
+from .testdata import iter_jsonl, load_testdata, select_shard
+from .token_usage import collect_usage, summarize_usage
 
 logger = logging.getLogger("scripts")
 
+# Seconds between updates of summary.partial.json while an evaluation runs
+PARTIAL_SUMMARY_INTERVAL = 10
+# The test data selected for a run, and the options it was selected with, saved when the run starts
+SELECTED_TESTDATA_FILENAME = "selected_testdata.jsonl"
+SELECTION_FILENAME = "selection.json"
+
 
 def send_question_to_target(
     question: str,
@@ -21,17 +44,33 @@ def send_question_to_target(
     raise_error=False,
     response_answer_jmespath="message.content",
     response_context_jmespath="context.data_points.text",
+    rate_limiter: RateLimiter | None = None,
+    session: requests.Session | None = None,
+    timeout: tuple[float, float] | None = None,
+    include_raw=False,
 ):
     headers = {"Content-Type": "application/json"}
     body = {
         "messages": [{"content": question, "role": "user"}],
         "context": parameters,
     }
+    post_kwargs = {"timeout": timeout} if timeout else {}
+
+    def post():
+        reset_connect_time()
+        r = (session or requests).post(url, headers=headers, json=body, **post_kwargs)
+        if r.status_code == 429:
+            raise TooManyRequestsError(f"Target {url} responded with 429 Too Many Requests", response=r)
+        return r
+
     try:
-        r = requests.post(url, headers=headers, json=body)
+        r = rate_limiter.call(post) if rate_limiter else post()
         r.encoding = "utf-8"
 
         latency = r.elapsed.total_seconds()
+        # Connection setup is only measured when using a session from create_target_session()
+        connect_time = get_connect_time()
+        connect_time = round(connect_time, 6) if connect_time is not None else None
 
         try:
             response_dict = r.json()
@@ -54,7 +93,15 @@ def send_question_to_target(
                 f"to match the actual schema.\nResponse: {response_dict}"
             )
 
-        response_obj = {"answer": answer, "context": context, "latency": latency}
+        response_obj = {
+            "answer": answer,
+            "context": context,
+            "latency": latency,
+            "connect_time": connect_time,
+            "server_time": round(latency - (connect_time or 0), 6),
+        }
+        if include_raw:
+            response_obj["raw"] = response_dict
         return response_obj
     except Exception as e:
         if raise_error:
@@ -71,8 +118,168 @@ def truncate_for_log(s: str, max_length=50):
 
 
 def load_jsonl(path: Path) -> list[dict]:
+    return list(iter_jsonl(path))
+
+
+def load_completed_rows(path: Path) -> list[dict]:
+    """Loads the rows written so far to a results file, ignoring a truncated last line from an interrupted run."""
+    rows = []
     with open(path, encoding="utf-8") as f:
-        return [json.loads(line) for line in f.readlines()]
+        for line_number, line in enumerate(f, start=1):
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Ignoring incomplete row on line %d of %s", line_number, path)
+    return rows
+
+
+def is_failed_row(row: dict) -> bool:
+    """Returns whether the target call for a result row failed, in which case it's evaluated again on resume."""
+    return row.get("latency") == -1
+
+
+def assign_question_ids(rows: list[dict]) -> list[dict]:
+    """Adds a stable "id" to each row that doesn't already have one, based on a hash of the question and truth.
+    Repeated question/truth pairs get a numeric suffix, so that every row has a unique id."""
+    occurrences = {}
+    for row in rows:
+        if "id" in row:
+            continue
+        question_hash = hashlib.sha256(f"{row['question']}\n{row.get('truth', '')}".encode()).hexdigest()[:16]
+        occurrences[question_hash] = occurrences.get(question_hash, 0) + 1
+        count = occurrences[question_hash]
+        row["id"] = question_hash if count == 1 else f"{question_hash}-{count}"
+    return rows
+
+
+def write_jsonl(path: Path, rows: list[dict]):
+    """Writes rows to a JSONL file, replacing it atomically so that a crash never leaves it half-written."""
+    with atomic_write(path) as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def summarize_results(rows: list[dict] | pd.DataFrame, metrics: list) -> dict:
+    """Computes the summary statistics of each metric over all the result rows,
+    along with bootstrap confidence intervals (like "pass_rate_ci") for the stats that are averages."""
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    summary = {metric.METRIC_NAME: metric.get_aggregate_stats(df) for metric in metrics}
+    samples = {
+        (metric.METRIC_NAME, stat): values
+        for metric in metrics
+        for stat, values in metric.get_bootstrap_samples(df).items()
+    }
+    for (metric_name, stat), interval in bootstrap_confidence_intervals(samples).items():
+        summary[metric_name][f"{stat}_ci"] = interval
+    return summary
+
+
+def reorder_jsonl(path: Path, ids: list):
+    """Rewrites a JSONL file of rows so that they're in the same order as the ids.
+    Only the offset of each row in the file is held in memory, not the rows themselves."""
+    offsets = {}
+    with open(path, "rb") as f, atomic_write(path, "wb") as temp_file:
+        offset = 0
+        for line in f:
+            if line.strip():
+                offsets[json.loads(line)["id"]] = offset
+            offset += len(line)
+        for id in ids:
+            f.seek(offsets[id])
+            temp_file.write(f.readline())
+
+
+def apply_batch_metrics(path: Path, batch_evaluators: dict, chunk_size: int = 1000):
+    """Computes the metrics that have batch evaluators over the rows of a results file, adding them to each row.
+    The file is processed in chunks of rows, so that memory use doesn't grow with the number of rows."""
+    rows = iter_jsonl(path)
+    with atomic_write(path) as f:
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            df = pd.DataFrame(chunk)
+            for metric_name, batch_evaluator in batch_evaluators.items():
+                for row, value in zip(chunk, batch_evaluator(df).tolist()):
+                    row[metric_name] = value
+            for row in chunk:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class SharedCalls:
+    """Calls fn at most once per distinct argument, even from concurrent threads, sharing the result with all callers.
+    Results are only kept until the expected number of callers for that argument have received them."""
+
+    def __init__(self, fn, expected_calls: dict):
+        self._fn = fn
+        self._remaining_calls = dict(expected_calls)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, arg):
+        with self._lock:
+            entry = self._entries.get(arg)
+            is_owner = entry is None
+            if is_owner:
+                entry = self._entries[arg] = {"done": threading.Event()}
+        if is_owner:
+            try:
+                entry["result"] = self._fn(arg)
+            except Exception as e:
+                entry["error"] = e
+            finally:
+                entry["done"].set()
+        else:
+            entry["done"].wait()
+        with self._lock:
+            self._remaining_calls[arg] = self._remaining_calls.get(arg, 1) - 1
+            if self._remaining_calls[arg] <= 0:
+                self._entries.pop(arg, None)
+        if "error" in entry:
+            raise entry["error"]
+        return entry["result"]
+
+
+def map_concurrently(
+    fn, items: list, max_workers=1, description="Processing...", on_result=None, get_status=None, keep_results=True
+):
+    """Applies fn to each item using a pool of worker threads.
+    Results are returned in the same order as the items, regardless of completion order.
+    If given, on_result(index, result) is called from the calling thread as soon as each result is ready,
+    and get_status() is called after it to show a status next to the progress bar.
+    With keep_results=False, results are dropped once on_result has handled them, and None is returned."""
+    results = [None] * len(items) if keep_results else None
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    progress = Progress(*Progress.get_default_columns(), TextColumn("{task.fields[status]}"))
+    try:
+        futures = {executor.submit(fn, item): index for index, item in enumerate(items)}
+        with progress:
+            task = progress.add_task(description, total=len(futures), status="")
+            for future in as_completed(futures):
+                # Completed futures are dropped as we go, so that their results can be garbage collected
+                index = futures.pop(future)
+                result = future.result()
+                if keep_results:
+                    results[index] = result
+                if on_result:
+                    on_result(index, result)
+                progress.update(task, advance=1, status=get_status() if get_status else "")
+    finally:
+        # If a row fails or the run is interrupted, don't start any of the remaining items
+        executor.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
+def write_partial_summary(path: Path, online_summary: OnlineSummary, total_rows: int):
+    """Writes the summary stats of the rows completed so far, replacing the file atomically."""
+    with atomic_write(path) as f:
+        f.write(
+            json.dumps(
+                {
+                    "completed_rows": online_summary.rows,
+                    "total_rows": total_rows,
+                    "summary": online_summary.get_stats(),
+                },
+                indent=4,
+            )
+        )
 
 
 def run_evaluation(
@@ -85,114 +292,451 @@ def run_evaluation(
     num_questions=None,
     target_response_answer_jmespath=None,
     target_response_context_jmespath=None,
+    concurrency=1,
+    judge_concurrency=None,
+    rate_limits={},
+    target_client={},
+    resume=False,
+    judge_cache_path=None,
+    judge_cache_max_size_mb=256,
+    record_path=None,
+    replay_path=None,
+    combined_judge=False,
+    sampling="head",
+    seed=None,
+    stratify_field=None,
+    offset=0,
+    limit=None,
+    shard=None,
+    token_prices={},
+    context_token_budgets={},
 ):
     logger.info("Running evaluation using data from %s", testdata_path)
-    testdata = load_jsonl(testdata_path)
-    if num_questions:
-        logger.info("Limiting evaluation to %s questions", num_questions)
-        testdata = testdata[:num_questions]
-
-    logger.info("Sending a test question to the target to ensure it is running...")
-    try:
-        question = "What information is in your knowledge base?"
-        target_data = send_question_to_target(
-            question,
-            target_url,
-            target_parameters,
-            raise_error=True,
-            response_answer_jmespath=target_response_answer_jmespath,
-            response_context_jmespath=target_response_context_jmespath,
-        )
-        logger.info(
-            'Successfully received response from target for question: "%s"\n"answer": "%s"\n"context": "%s"',
-            truncate_for_log(question),
-            truncate_for_log(target_data["answer"]),
-            truncate_for_log(target_data["context"]),
-        )
-    except Exception as e:
-        logger.error("Failed to send a test question to the target due to error: \n%s", e)
+    if shard and sampling != "head" and seed is None:
+        # Every shard must sample the same questions, or they wouldn't partition the same test set
+        logger.error("A seed must be specified to shard an evaluation that uses %s sampling", sampling)
         return False
-
-    logger.info("Sending a test chat completion to the GPT deployment to ensure it is running...")
-    try:
-        gpt_response = service_setup.get_openai_client(openai_config).chat.completions.create(
-            model=openai_config.model,
-            messages=[{"role": "user", "content": "Hello!"}],
-            n=1,
+    selection = {
+        "testdata_path": str(testdata_path),
+        "num_questions": num_questions,
+        "sampling": sampling,
+        "seed": seed,
+        "stratify_field": stratify_field,
+        "offset": offset,
+        "limit": limit,
+        "shard": f"{shard[0]}/{shard[1]}" if shard else None,
+    }
+    selected_testdata_path = results_dir / SELECTED_TESTDATA_FILENAME
+    selection_path = results_dir / SELECTION_FILENAME
+    reuse_selection = resume and selected_testdata_path.exists() and selection_path.exists()
+    if reuse_selection:
+        # The same questions are evaluated as when the run started, even if they were sampled without a seed
+        saved_selection = json.loads(selection_path.read_text(encoding="utf-8"))
+        changed_options = [name for name, value in selection.items() if saved_selection.get(name) != value]
+        if changed_options:
+            logger.warning(
+                "Resuming with the test data selected when the run started, ignoring the changed options: %s",
+                ", ".join(changed_options),
+            )
+        selection = saved_selection
+        testdata = load_jsonl(selected_testdata_path)
+    else:
+        if num_questions:
+            logger.info("Limiting evaluation to %s questions, using %s sampling", num_questions, sampling)
+        testdata = assign_question_ids(
+            load_testdata(
+                testdata_path,
+                num_questions=num_questions,
+                sampling=sampling,
+                seed=seed,
+                stratify_field=stratify_field,
+                offset=offset,
+                limit=limit,
+            )
         )
-        logger.info('Successfully received response from GPT: "%s"', gpt_response.choices[0].message.content)
-    except Exception as e:
-        logger.error("Failed to send a test chat completion to the GPT deployment due to error: \n%s", e)
-        return False
-
-    logger.info("Starting evaluation...")
-    for metric in requested_metrics:
-        if metric not in metrics_by_name:
-            logger.error(f"Requested metric {metric} is not available. Available metrics: {metrics_by_name.keys()}")
+        if shard:
+            shard_index, shard_count = shard
+            testdata = select_shard(testdata, shard_index, shard_count)
+            logger.info("Evaluating shard %d of %d, with %d questions", shard_index, shard_count, len(testdata))
+
+    # A single session is used for the whole run, so that connections to the target are kept alive and reused
+    target_session = create_target_session(
+        pool_size=target_client.get("pool_size", max(concurrency, 10)), proxies=target_client.get("proxies")
+    )
+    target_timeout = (target_client.get("connect_timeout", 10), target_client.get("read_timeout", 600))
+    cassette = None
+    if replay_path:
+        cassette = TargetCassette(replay_path, "replay", target_url, target_parameters)
+    elif record_path:
+        cassette = TargetCassette(record_path, "record", target_url, target_parameters)
+    with target_session:
+        if cassette is not None and cassette.mode == "replay":
+            logger.info("Replaying target responses from %s instead of calling the target", cassette.path)
+        else:
+            logger.info("Sending a test question to the target to ensure it is running...")
+            try:
+                question = "What information is in your knowledge base?"
+                target_data = send_question_to_target(
+                    question,
+                    target_url,
+                    target_parameters,
+                    raise_error=True,
+                    response_answer_jmespath=target_response_answer_jmespath,
+                    response_context_jmespath=target_response_context_jmespath,
+                    session=target_session,
+                    timeout=target_timeout,
+                )
+                logger.info(
+                    'Successfully received response from target for question: "%s"\n"answer": "%s"\n"context": "%s"',
+                    truncate_for_log(question),
+                    truncate_for_log(target_data["answer"]),
+                    truncate_for_log(target_data["context"]),
+                )
+            except Exception as e:
+                logger.error("Failed to send a test question to the target due to error: \n%s", e)
+                return False
+
+        logger.info("Sending a test chat completion to the GPT deployment to ensure it is running...")
+        try:
+            gpt_response = service_setup.get_openai_client(openai_config).chat.completions.create(
+                model=openai_config.model,
+                messages=[{"role": "user", "content": "Hello!"}],
+                n=1,
+            )
+            logger.info('Successfully received response from GPT: "%s"', gpt_response.choices[0].message.content)
+        except Exception as e:
+            logger.error("Failed to send a test chat completion to the GPT deployment due to error: \n%s", e)
             return False
 
-    requested_metrics = [
-        metrics_by_name[metric_name] for metric_name in requested_metrics if metric_name in metrics_by_name
-    ]
-
-    def evaluate_row(row):
-        output = {}
-        output["question"] = row["question"]
-        output["truth"] = row["truth"]
-        target_response = send_question_to_target(
-            question=row["question"],
-            url=target_url,
-            parameters=target_parameters,
-            response_answer_jmespath=target_response_answer_jmespath,
-            response_context_jmespath=target_response_context_jmespath,
+        logger.info("Starting evaluation...")
+        for metric in requested_metrics:
+            if metric not in metrics_by_name:
+                logger.error(f"Requested metric {metric} is not available. Available metrics: {metrics_by_name.keys()}")
+                return False
+
+        requested_metrics = [
+            metrics_by_name[metric_name] for metric_name in requested_metrics if metric_name in metrics_by_name
+        ]
+
+        # Target calls and judge calls are limited separately, since they usually have different rate limits
+        judge_concurrency = judge_concurrency or concurrency
+        target_semaphore = threading.BoundedSemaphore(concurrency)
+        judge_semaphore = threading.BoundedSemaphore(judge_concurrency)
+        # Rate limiters are shared by all rows, so that 429s from one call slow down all the others
+        target_rate_limiter = RateLimiter.from_config("target", rate_limits.get("target"), max_concurrency=concurrency)
+        judge_rate_limiter = RateLimiter.from_config(
+            "judge", rate_limits.get("judge"), max_concurrency=judge_concurrency
         )
-        output.update(target_response)
+
+        for metric_name in context_token_budgets:
+            if metric_name not in [metric.METRIC_NAME for metric in requested_metrics]:
+                logger.warning("Ignoring the context token budget for %s, which isn't a requested metric", metric_name)
+
+        # Cheap metrics with batch evaluators are computed over all the rows once the target calls are done,
+        # instead of row by row on the workers
+        batch_evaluators = {}
         for metric in requested_metrics:
-            result = metric.evaluator_fn(openai_config=openai_config)(
-                question=row["question"],
-                answer=output["answer"],
-                context=output["context"],
-                ground_truth=row["truth"],
-            )
-            output.update(result)
-
-        return output
-
-    # Run evaluations in serial to avoid rate limiting
-    questions_with_ratings = []
-    for row in track(testdata, description="Processing..."):
-        questions_with_ratings.append(evaluate_row(row))
-
-    logger.info("Evaluation calls have completed. Calculating overall metrics now...")
-    # Make the results directory if it doesn't exist
-    results_dir.mkdir(parents=True, exist_ok=True)
-    # Save the results
-    with open(results_dir / "eval_results.jsonl", "w", encoding="utf-8") as results_file:
-        for row in questions_with_ratings:
-            results_file.write(json.dumps(row, ensure_ascii=False) + "\n")
-
-    # Calculate aggregate metrics
-    df = pd.DataFrame(questions_with_ratings)
-    summary = {}
-    for metric in requested_metrics:
-        summary[metric.METRIC_NAME] = metric.get_aggregate_stats(df)
-
-    # summary statistics
-    with open(results_dir / "summary.json", "w", encoding="utf-8") as summary_file:
-        summary_file.write(json.dumps(summary, indent=4))
-
-    with open(results_dir / "evaluate_parameters.json", "w", encoding="utf-8") as parameters_file:
-        parameters = {
-            "evaluation_gpt_model": openai_config.model,
-            "evaluation_timestamp": int(time.time()),
-            "testdata_path": str(testdata_path),
-            "target_url": target_url,
-            "target_parameters": target_parameters,
-            "num_questions": num_questions,
+            batch_evaluator = metric.batch_evaluator_fn()
+            if batch_evaluator is not None:
+                batch_evaluators[metric.METRIC_NAME] = batch_evaluator
+        row_metrics = [metric for metric in requested_metrics if metric.METRIC_NAME not in batch_evaluators]
+        # The batch metrics are only added to the results once all the rows are done, so the online summary
+        # computes them for each completed row with their row evaluators, which are cheap for a single row
+        batch_row_evaluators = [metrics_by_name[metric_name].evaluator_fn() for metric_name in batch_evaluators]
+
+        # Evaluators are created once per run and shared by all workers, since they're stateless once created.
+        # Creating them up front also loads and parses the .prompty files before the first row is evaluated.
+        logger.info("Loading evaluators for %d metrics...", len(row_metrics))
+        evaluators = {
+            metric.METRIC_NAME: metric.evaluator_fn(openai_config=openai_config, rate_limiter=judge_rate_limiter)
+            for metric in row_metrics
         }
-        parameters_file.write(json.dumps(parameters, indent=4))
-    logger.info("Evaluation results saved in %s", results_dir)
-    return True
+
+        judge_cache = None
+        if judge_cache_path:
+            logger.info("Using judge cache at %s", judge_cache_path)
+            judge_cache = JudgeCache(judge_cache_path, max_size_mb=judge_cache_max_size_mb)
+        cache_fingerprints = {metric.METRIC_NAME: metric.get_cache_fingerprint() for metric in row_metrics}
+
+        def get_cache_key(metric_name, fingerprint, row_inputs):
+            if judge_cache is None or fingerprint is None:
+                return None
+            return JudgeCache.make_key(metric_name, fingerprint, openai_config.model, **row_inputs)
+
+        def evaluate_metric(metric, row_inputs, judge_usage):
+            cache_key = get_cache_key(metric.METRIC_NAME, cache_fingerprints[metric.METRIC_NAME], row_inputs)
+            if cache_key:
+                cached_result = judge_cache.get(cache_key)
+                if cached_result is not None:
+                    return cached_result
+            with judge_semaphore, collect_usage() as usage:
+                result = evaluators[metric.METRIC_NAME](**row_inputs)
+            if usage.calls:
+                judge_usage[metric.METRIC_NAME] = usage.to_dict()
+            if cache_key:
+                judge_cache.put(cache_key, metric.METRIC_NAME, result)
+            return result
+
+        # With the combined judge, all the rating metrics that it supports are scored in a single call per row
+        combined_metric_names = []
+        if combined_judge:
+            combined_metric_names = [
+                metric.METRIC_NAME for metric in row_metrics if CombinedRatingEvaluator.can_combine(metric.METRIC_NAME)
+            ]
+        if len(combined_metric_names) > 1:
+            logger.info("Using a combined judge call for metrics: %s", ", ".join(combined_metric_names))
+            combined_evaluator = CombinedRatingEvaluator(openai_config, evaluators, rate_limiter=judge_rate_limiter)
+        else:
+            combined_metric_names = []
+        separate_metrics = [metric for metric in row_metrics if metric.METRIC_NAME not in combined_metric_names]
+
+        def evaluate_combined_metrics(row_inputs, judge_usage):
+            output = {}
+            cache_keys = {}
+            for metric_name in combined_metric_names:
+                fingerprint = CombinedRatingEvaluator.get_cache_fingerprint(metric_name)
+                cache_keys[metric_name] = get_cache_key(metric_name, fingerprint, row_inputs)
+                cached_result = judge_cache.get(cache_keys[metric_name]) if cache_keys[metric_name] else None
+                if cached_result is not None:
+                    output.update(cached_result)
+            uncached_metric_names = [metric_name for metric_name in combined_metric_names if metric_name not in output]
+            if uncached_metric_names:
+                with judge_semaphore, collect_usage() as usage:
+                    result = combined_evaluator(metric_names=uncached_metric_names, **row_inputs)
+                if usage.calls:
+                    judge_usage["combined"] = usage.to_dict()
+                for metric_name in uncached_metric_names:
+                    output[metric_name] = result[metric_name]
+                    if cache_keys[metric_name]:
+                        judge_cache.put(cache_keys[metric_name], metric_name, {metric_name: result[metric_name]})
+            return output
+
+        def get_target_response(question):
+            if cassette is not None and cassette.mode == "replay":
+                recorded_response = cassette.get(question)
+                if recorded_response is not None:
+                    return recorded_response
+                logger.warning("No recorded response for question: %s", truncate_for_log(question))
+                error = f"No recorded response in cassette {cassette.path}"
+                return {"answer": error, "context": error, "latency": -1}
+            with target_semaphore:
+                target_response = send_question_to_target(
+                    question=question,
+                    url=target_url,
+                    parameters=target_parameters,
+                    response_answer_jmespath=target_response_answer_jmespath,
+                    response_context_jmespath=target_response_context_jmespath,
+                    rate_limiter=target_rate_limiter,
+                    session=target_session,
+                    timeout=target_timeout,
+                    include_raw=cassette is not None,
+                )
+            # Only successful responses are recorded, so that failed questions are retried on the next run
+            if cassette is not None and target_response["latency"] != -1:
+                cassette.record(question, target_response)
+            return target_response
+
+        def get_budgeted_inputs(row_inputs, metric_names, truncated_contexts, context_dropped_tokens):
+            """Returns the inputs for judging the given metrics, with the context trimmed to the smallest of their
+            token budgets, if any, and records how many context tokens were dropped for each metric."""
+            budgets = [context_token_budgets[name] for name in metric_names if name in context_token_budgets]
+            if not budgets:
+                return row_inputs
+            budget = min(budgets)
+            # Metrics with the same budget share the trimmed context
+            if budget not in truncated_contexts:
+                truncated_contexts[budget] = truncate_context(
+                    row_inputs["context"], row_inputs["answer"], budget, model=openai_config.model
+                )
+            context, dropped_tokens = truncated_contexts[budget]
+            for metric_name in metric_names:
+                context_dropped_tokens[metric_name] = dropped_tokens
+            return dict(row_inputs, context=context)
+
+        def evaluate_row(row):
+            output = {}
+            output["id"] = row["id"]
+            output["question"] = row["question"]
+            output["truth"] = row["truth"]
+            target_response = dict(get_shared_target_response(row["question"]))
+            target_response.pop("raw", None)
+            output.update(target_response)
+            row_inputs = {
+                "question": row["question"],
+                "answer": output["answer"],
+                "context": output["context"],
+                "ground_truth": row["truth"],
+            }
+            # Tokens used and time taken by the judge calls for this row, for each metric (cached results are free)
+            judge_usage = {}
+            truncated_contexts = {}
+            context_dropped_tokens = {}
+            for metric in separate_metrics:
+                metric_inputs = get_budgeted_inputs(
+                    row_inputs, [metric.METRIC_NAME], truncated_contexts, context_dropped_tokens
+                )
+                output.update(evaluate_metric(metric, metric_inputs, judge_usage))
+            if combined_metric_names:
+                combined_inputs = get_budgeted_inputs(
+                    row_inputs, combined_metric_names, truncated_contexts, context_dropped_tokens
+                )
+                output.update(evaluate_combined_metrics(combined_inputs, judge_usage))
+            if context_token_budgets:
+                output["context_dropped_tokens"] = context_dropped_tokens
+            output["judge_prompt_tokens"] = sum(usage["prompt_tokens"] for usage in judge_usage.values())
+            output["judge_completion_tokens"] = sum(usage["completion_tokens"] for usage in judge_usage.values())
+            output["judge_seconds"] = round(sum(usage["seconds"] for usage in judge_usage.values()), 3)
+            output["judge_usage"] = judge_usage
+
+            return output
+
+        # Make the results directory if it doesn't exist
+        results_dir.mkdir(parents=True, exist_ok=True)
+        results_path = results_dir / "eval_results.jsonl"
+        partial_summary_path = results_dir / "summary.partial.json"
+        # Summary stats are updated as rows complete, so that they can be followed while the evaluation runs
+        online_summary = OnlineSummary(requested_metrics)
+
+        def update_online_summary(row):
+            if batch_row_evaluators:
+                row = dict(row)
+                for batch_row_evaluator in batch_row_evaluators:
+                    row.update(batch_row_evaluator(answer=row.get("answer"), ground_truth=row.get("truth", "")))
+            online_summary.update(row)
+
+        completed_ids = set()
+        if resume and results_path.exists():
+            rows = assign_question_ids(load_completed_rows(results_path))
+            completed_rows = {row["id"]: row for row in rows if not is_failed_row(row)}
+            num_failed = len(rows) - len(completed_rows)
+            del rows
+            selected_ids = {row["id"] for row in testdata}
+            unselected_ids = [id for id in completed_rows if id not in selected_ids]
+            if unselected_ids:
+                # Only possible for runs started before the selection was saved, with different options
+                logger.error(
+                    "%d completed rows in %s aren't in the selected test data, and would be lost by resuming. "
+                    "Resume with the same test data options as the run was started with.",
+                    len(unselected_ids),
+                    results_path,
+                )
+                return False
+            # Rewrite the rows that were completed, in case the last one was only partially written.
+            # Rows whose target call failed are left out, so that they're evaluated again.
+            write_jsonl(results_path, list(completed_rows.values()))
+            for row in completed_rows.values():
+                update_online_summary(row)
+            completed_ids = set(completed_rows)
+            del completed_rows
+            logger.info("Resuming evaluation, skipping %d completed rows", len(completed_ids))
+            if num_failed:
+                logger.info("Retrying %d rows whose target call failed", num_failed)
+        if not reuse_selection:
+            write_jsonl(selected_testdata_path, testdata)
+            with open(selection_path, "w", encoding="utf-8") as selection_file:
+                selection_file.write(json.dumps(selection, indent=4))
+        remaining_testdata = [row for row in testdata if row["id"] not in completed_ids]
+
+        # Identical questions in the test data only result in one call to the target
+        question_counts = collections.Counter(row["question"] for row in remaining_testdata)
+        get_shared_target_response = SharedCalls(get_target_response, question_counts)
+        if len(question_counts) < len(remaining_testdata):
+            logger.info("Sending %d distinct questions to the target", len(question_counts))
+
+        # Each row is appended to the results file as soon as it completes, so that an interrupted run can be resumed
+        with open(results_path, "a" if resume else "w", encoding="utf-8") as results_file:
+
+            last_partial_summary_time = time.monotonic()
+
+            def save_row(index, row):
+                nonlocal last_partial_summary_time
+                results_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+                results_file.flush()
+                completed_ids.add(row["id"])
+                update_online_summary(row)
+                if time.monotonic() - last_partial_summary_time >= PARTIAL_SUMMARY_INTERVAL:
+                    write_partial_summary(partial_summary_path, online_summary, len(testdata))
+                    last_partial_summary_time = time.monotonic()
+
+            # With the default concurrency of 1, rows are evaluated in serial to avoid rate limiting
+            logger.info(
+                "Evaluating with concurrency of %d target calls and %d judge calls", concurrency, judge_concurrency
+            )
+            evaluation_start_time = time.perf_counter()
+            map_concurrently(
+                evaluate_row,
+                remaining_testdata,
+                max_workers=max(concurrency, judge_concurrency),
+                description="Processing...",
+                on_result=save_row,
+                get_status=online_summary.get_status,
+                keep_results=False,
+            )
+
+        evaluation_seconds = time.perf_counter() - evaluation_start_time
+        if judge_cache:
+            logger.info("Judge cache had %d hits and %d misses", judge_cache.hits, judge_cache.misses)
+            judge_cache.close()
+
+        logger.info("Evaluation calls have completed. Calculating overall metrics now...")
+        aggregation_start_time = time.perf_counter()
+        # Rows complete in any order, so the final results are rewritten in the same order as the test data
+        reorder_jsonl(results_path, [row["id"] for row in testdata])
+        if batch_evaluators:
+            logger.info("Computing metrics over all rows: %s", ", ".join(batch_evaluators))
+            apply_batch_metrics(results_path, batch_evaluators)
+        write_results_parquet(results_path, metric_names=[metric.METRIC_NAME for metric in requested_metrics])
+
+        # Calculate aggregate metrics, only loading the columns that they need
+        results_df = load_results(
+            results_dir, columns=[metric.METRIC_NAME for metric in requested_metrics] + ["judge_usage"]
+        )
+        summary = summarize_results(results_df, requested_metrics)
+        model_prices = token_prices.get(openai_config.model)
+        if token_prices and model_prices is None:
+            logger.warning("No token prices for model %s, so the cost can't be estimated", openai_config.model)
+        if "judge_usage" in results_df:
+            summary["usage"] = summarize_usage(results_df["judge_usage"], model_prices)
+            logger.info(
+                "Judge calls used %d prompt tokens and %d completion tokens",
+                summary["usage"]["total"]["prompt_tokens"],
+                summary["usage"]["total"]["completion_tokens"],
+            )
+
+        # summary statistics
+        with open(results_dir / "summary.json", "w", encoding="utf-8") as summary_file:
+            summary_file.write(json.dumps(summary, indent=4))
+        partial_summary_path.unlink(missing_ok=True)
+        aggregation_seconds = time.perf_counter() - aggregation_start_time
+
+        with open(results_dir / "evaluate_parameters.json", "w", encoding="utf-8") as parameters_file:
+            parameters = {
+                "evaluation_gpt_model": openai_config.model,
+                "evaluation_timestamp": int(time.time()),
+                "target_url": target_url,
+                "target_parameters": target_parameters,
+                "requested_metrics": [metric.METRIC_NAME for metric in requested_metrics],
+                "concurrency": concurrency,
+                "judge_concurrency": judge_concurrency,
+                "rate_limits": rate_limits,
+                "target_client": target_client,
+                "resumed": bool(resume),
+                "record_path": str(record_path) if record_path else None,
+                "replay_path": str(replay_path) if replay_path else None,
+                "combined_judge": combined_judge,
+                # The options that the test data was selected with, which are the original ones when resuming
+                **selection,
+                "token_prices": model_prices,
+                "context_token_budgets": context_token_budgets,
+                # Time spent evaluating the rows, and then reordering them and calculating the metrics over all rows
+                "timings": {
+                    "evaluation_seconds": round(evaluation_seconds, 3),
+                    "aggregation_seconds": round(aggregation_seconds, 3),
+                },
+            }
+            parameters_file.write(json.dumps(parameters, indent=4))
+        logger.info("Evaluation results saved in %s", results_dir)
+        return True
 
 
 def process_config(obj: dict):
@@ -213,14 +757,40 @@ def process_config(obj: dict):
                     obj[key] = f.read()
 
 
-def run_evaluate_from_config(working_dir, config_path, num_questions, target_url):
+def run_evaluate_from_config(
+    working_dir,
+    config_path,
+    num_questions,
+    target_url,
+    concurrency=None,
+    judge_concurrency=None,
+    resume_dir=None,
+    use_judge_cache=True,
+    record_path=None,
+    replay_path=None,
+    combined_judge=False,
+    sampling=None,
+    seed=None,
+    stratify_field=None,
+    offset=None,
+    limit=None,
+    shard=None,
+):
     config_path = working_dir / Path(config_path)
     logger.info("Running evaluation from config %s", config_path)
     with open(config_path, encoding="utf-8") as f:
         config = json.load(f)
         process_config(config)
 
-    results_dir = working_dir / Path(config["results_dir"])
+    experiment_dir = working_dir / Path(config["results_dir"])
+    if resume_dir:
+        results_dir = working_dir / Path(resume_dir)
+        logger.info("Resuming evaluation in %s", results_dir)
+    elif shard:
+        # Each shard writes to its own directory, so that shards can run side by side and be merged afterwards
+        results_dir = experiment_dir / f"shard-{shard[0]}-of-{shard[1]}"
+    else:
+        results_dir = experiment_dir
 
     evaluation_run_complete = run_evaluation(
         openai_config=service_setup.get_openai_config(),
@@ -235,6 +805,25 @@ def run_evaluate_from_config(working_dir, config_path, num_questions, target_url
         ),
         target_response_answer_jmespath=config.get("target_response_answer_jmespath"),
         target_response_context_jmespath=config.get("target_response_context_jmespath"),
+        concurrency=concurrency or config.get("concurrency", 1),
+        judge_concurrency=judge_concurrency or config.get("judge_concurrency"),
+        rate_limits=config.get("rate_limits", {}),
+        target_client=config.get("target_client", {}),
+        resume=resume_dir is not None,
+        # The cache lives in the results root, so that it's shared by all the experiments stored there
+        judge_cache_path=experiment_dir.parent / "judge_cache.sqlite" if use_judge_cache else None,
+        judge_cache_max_size_mb=config.get("judge_cache_max_size_mb", 256),
+        record_path=working_dir / Path(record_path) if record_path else None,
+        replay_path=working_dir / Path(replay_path) if replay_path else None,
+        combined_judge=combined_judge or config.get("combined_judge", False),
+        sampling=sampling or config.get("sampling", "head"),
+        seed=seed if seed is not None else config.get("seed"),
+        stratify_field=stratify_field or config.get("stratify_field"),
+        offset=offset if offset is not None else config.get("offset", 0),
+        limit=limit if limit is not None else config.get("limit"),
+        shard=shard,
+        token_prices=config.get("token_prices", {}),
+        context_token_budgets=config.get("context_token_budgets", {}),
     )
 
     if evaluation_run_complete:
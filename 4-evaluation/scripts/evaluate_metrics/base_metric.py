@@ -9,6 +9,10 @@ logger = logging.getLogger("scripts")
 class BaseMetric(ABC):
 
     METRIC_NAME = "name_of_metric"
+    # Ratings at or above this threshold count as passing, for metrics that report a pass rate
+    PASS_THRESHOLD = None
+    # Whether an increase in the metric is an improvement, or None if neither direction is, for comparing runs
+    HIGHER_IS_BETTER = True
 
     @classmethod
     @abstractmethod
@@ -17,15 +21,32 @@ class BaseMetric(ABC):
         pass
 
     @classmethod
-    def get_aggregate_stats_for_numeric_rating(cls, df, rating_column_name):
-        # Narrow down dataframe to just the metric
-        df = df[[rating_column_name]]
+    def batch_evaluator_fn(cls, **kwargs):
+        """Returns a function that computes the metric for a DataFrame of result rows at once, from its columns
+        (like "answer" and "truth"), returning a Series of values. Metrics with a batch evaluator are computed
+        after all the target calls instead of row by row, and can be recomputed from saved results.
+        Metrics that return None (the default) are computed row by row with evaluator_fn."""
+        return None
+
+    @classmethod
+    def get_cache_fingerprint(cls) -> str | None:
+        """Returns a string identifying how the metric is computed, used as part of the judge cache key.
+        Metrics that return None (like the cheap code metrics) are never cached."""
+        return None
+
+    @classmethod
+    def get_bootstrap_samples(cls, df) -> dict[str, pd.Series]:
+        """Returns the per-row values averaged by each aggregate stat that should get a confidence interval,
+        keyed by stat name. Rows that the stat ignores are NaN. Metrics that return {} get no intervals."""
+        return {}
 
+    @classmethod
+    def get_aggregate_stats_for_numeric_rating(cls, df, rating_column_name):
         # Drop invalid ratings - strings like "Failed"
-        rows_before = len(df)
-        df = df.apply(pd.to_numeric, errors="coerce")
-        df = df.dropna()
-        rows_after = len(df)
+        ratings = pd.to_numeric(df[rating_column_name], errors="coerce")
+        rows_before = len(ratings)
+        valid_ratings = ratings.dropna()
+        rows_after = len(valid_ratings)
         if rows_before != rows_after:
             logger.warning(
                 "Dropped %d invalid ratings for metric %s",
@@ -34,10 +55,16 @@ class BaseMetric(ABC):
             )
 
         # Count how many ratings passed threshold of 4+
-        pass_count = int(df[rating_column_name].apply(lambda rating: rating >= 4).sum())
+        pass_count = int((valid_ratings >= cls.PASS_THRESHOLD).sum())
 
         return {
             "pass_count": pass_count,
             "pass_rate": round(pass_count / rows_before, 2),
-            "mean_rating": round(df[rating_column_name].mean(), 2),
+            "mean_rating": round(valid_ratings.mean(), 2),
         }
+
+    @classmethod
+    def get_bootstrap_samples_for_numeric_rating(cls, df, rating_column_name):
+        ratings = pd.to_numeric(df[rating_column_name], errors="coerce")
+        # Invalid ratings count as failures in the pass rate, but are left out of the mean rating
+        return {"pass_rate": (ratings >= cls.PASS_THRESHOLD).astype(float), "mean_rating": ratings}
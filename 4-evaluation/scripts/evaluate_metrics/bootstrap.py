@@ -0,0 +1,41 @@
+import numpy as np
+
+# Upper bound on the number of resampled rows drawn at once, to keep memory flat for large result sets
+MAX_ROWS_PER_CHUNK = 4_000_000
+
+
+def bootstrap_confidence_intervals(
+    samples: dict, n_resamples: int = 1000, confidence_level: float = 0.95, seed: int = 0
+) -> dict:
+    """Computes percentile bootstrap confidence intervals for the mean of each sample.
+
+    All samples must be per-row values for the same rows, with NaN for rows that a sample ignores.
+    The rows are resampled once for all samples, so every interval is computed in the same vectorized pass.
+    Returns a [lower, upper] interval for each key of `samples` that has at least one value.
+    """
+    samples = {key: np.asarray(values, dtype=float) for key, values in samples.items()}
+    samples = {key: values for key, values in samples.items() if not np.isnan(values).all()}
+    if not samples:
+        return {}
+    values = np.column_stack(list(samples.values()))
+    present = (~np.isnan(values)).astype(float)
+    filled = np.where(np.isnan(values), 0.0, values)
+    num_rows = len(values)
+
+    rng = np.random.default_rng(seed)
+    chunk_size = max(1, MAX_ROWS_PER_CHUNK // num_rows)
+    resampled_means = []
+    for start in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - start)
+        indexes = rng.integers(0, num_rows, size=(size, num_rows))
+        # How many times each row was drawn in each resample, so that the sums are a single matrix product
+        offsets = np.arange(size)[:, np.newaxis] * num_rows
+        counts = np.bincount((indexes + offsets).ravel(), minlength=size * num_rows).reshape(size, num_rows)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # A resample can miss every row of a sparse sample, which gives a NaN mean that the percentiles ignore
+            resampled_means.append((counts @ filled) / (counts @ present))
+    resampled_means = np.concatenate(resampled_means)
+
+    tail = (1 - confidence_level) / 2 * 100
+    lower, upper = np.nanpercentile(resampled_means, [tail, 100 - tail], axis=0)
+    return {key: [round(float(low), 2), round(float(high), 2)] for key, low, high in zip(samples, lower, upper)}
@@ -1,3 +1,5 @@
+from importlib.metadata import version
+
 from promptflow.evals.evaluators import (
     CoherenceEvaluator,
     F1ScoreEvaluator,
@@ -7,23 +9,39 @@ from promptflow.evals.evaluators import (
     SimilarityEvaluator,
 )
 
+from ..rate_limit import rate_limited
+from ..token_usage import track_evaluator_usage
 from .base_metric import BaseMetric
 
 
 class BuiltinRatingMetric(BaseMetric):
 
+    PASS_THRESHOLD = 4
+
     @classmethod
     def get_aggregate_stats(cls, df):
         return cls.get_aggregate_stats_for_numeric_rating(df, cls.METRIC_NAME)
 
+    @classmethod
+    def get_bootstrap_samples(cls, df):
+        return cls.get_bootstrap_samples_for_numeric_rating(df, cls.METRIC_NAME)
+
+    @classmethod
+    def get_cache_fingerprint(cls):
+        # The builtin prompts only change with the SDK version
+        return f"promptflow-evals=={version('promptflow-evals')}"
+
 
 class BuiltinRelevanceMetric(BuiltinRatingMetric):
 
     METRIC_NAME = "gpt_relevance"
 
     @classmethod
-    def evaluator_fn(cls, openai_config, **kwargs):
-        return RelevanceEvaluator(openai_config)
+    def evaluator_fn(cls, openai_config, rate_limiter=None, **kwargs):
+        return rate_limited(
+            track_evaluator_usage(RelevanceEvaluator(openai_config), openai_config, retry=rate_limiter is None),
+            rate_limiter,
+        )
 
 
 class BuiltinCoherenceMetric(BuiltinRatingMetric):
@@ -31,8 +49,11 @@ class BuiltinCoherenceMetric(BuiltinRatingMetric):
     METRIC_NAME = "gpt_coherence"
 
     @classmethod
-    def evaluator_fn(cls, openai_config, **kwargs):
-        return CoherenceEvaluator(openai_config)
+    def evaluator_fn(cls, openai_config, rate_limiter=None, **kwargs):
+        return rate_limited(
+            track_evaluator_usage(CoherenceEvaluator(openai_config), openai_config, retry=rate_limiter is None),
+            rate_limiter,
+        )
 
 
 class BuiltinGroundednessMetric(BuiltinRatingMetric):
@@ -40,8 +61,11 @@ class BuiltinGroundednessMetric(BuiltinRatingMetric):
     METRIC_NAME = "gpt_groundedness"
 
     @classmethod
-    def evaluator_fn(cls, openai_config, **kwargs):
-        return GroundednessEvaluator(openai_config)
+    def evaluator_fn(cls, openai_config, rate_limiter=None, **kwargs):
+        return rate_limited(
+            track_evaluator_usage(GroundednessEvaluator(openai_config), openai_config, retry=rate_limiter is None),
+            rate_limiter,
+        )
 
 
 class BuiltinSimilarityMetric(BuiltinRatingMetric):
@@ -49,8 +73,11 @@ class BuiltinSimilarityMetric(BuiltinRatingMetric):
     METRIC_NAME = "gpt_similarity"
 
     @classmethod
-    def evaluator_fn(cls, openai_config, **kwargs):
-        return SimilarityEvaluator(openai_config)
+    def evaluator_fn(cls, openai_config, rate_limiter=None, **kwargs):
+        return rate_limited(
+            track_evaluator_usage(SimilarityEvaluator(openai_config), openai_config, retry=rate_limiter is None),
+            rate_limiter,
+        )
 
 
 class BuiltinFluencyMetric(BuiltinRatingMetric):
@@ -58,8 +85,11 @@ class BuiltinFluencyMetric(BuiltinRatingMetric):
     METRIC_NAME = "gpt_fluency"
 
     @classmethod
-    def evaluator_fn(cls, openai_config, **kwargs):
-        return FluencyEvaluator(openai_config)
+    def evaluator_fn(cls, openai_config, rate_limiter=None, **kwargs):
+        return rate_limited(
+            track_evaluator_usage(FluencyEvaluator(openai_config), openai_config, retry=rate_limiter is None),
+            rate_limiter,
+        )
 
 
 class BuiltinF1ScoreMetric(BaseMetric):
@@ -77,3 +107,7 @@ class BuiltinF1ScoreMetric(BaseMetric):
             "max": round(df[cls.METRIC_NAME].max(), 2),
             "min": round(df[cls.METRIC_NAME].min(), 2),
         }
+
+    @classmethod
+    def get_bootstrap_samples(cls, df):
+        return {"mean": df[cls.METRIC_NAME].astype(float)}
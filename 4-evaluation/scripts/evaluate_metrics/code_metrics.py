@@ -1,14 +1,32 @@
 import logging
 import re
 
+import numpy as np
+import pandas as pd
+
 from .base_metric import BaseMetric
 
 logger = logging.getLogger("scripts")
 
+# Any bracketed text, like "[file.pdf]"
+CITATION_PATTERN = re.compile(r"\[[^\]]+\]")
+# The name of a cited file, without its extension
+CITED_FILE_PATTERN = re.compile(r"\[([^\]]+)\.\w{3,4}\]")
+
+
+def find_missing_answers(answers: pd.Series, metric_name: str) -> pd.Series:
+    missing = answers.isna()
+    if missing.any():
+        logger.warning(
+            "Received %d answers of None, can't compute %s metric. Setting to -1.", missing.sum(), metric_name
+        )
+    return missing
+
 
 class AnswerLengthMetric(BaseMetric):
 
     METRIC_NAME = "answer_length"
+    HIGHER_IS_BETTER = None
 
     @classmethod
     def evaluator_fn(cls, **kwargs):
@@ -20,6 +38,14 @@ class AnswerLengthMetric(BaseMetric):
 
         return answer_length
 
+    @classmethod
+    def batch_evaluator_fn(cls, **kwargs):
+        def answer_length(df):
+            find_missing_answers(df["answer"], cls.METRIC_NAME)
+            return pd.to_numeric(df["answer"].str.len()).fillna(-1).astype(int)
+
+        return answer_length
+
     @classmethod
     def get_aggregate_stats(cls, df):
         # remove -1 values from the mean calculation
@@ -30,6 +56,10 @@ class AnswerLengthMetric(BaseMetric):
             "min": int(df[cls.METRIC_NAME].min()),
         }
 
+    @classmethod
+    def get_bootstrap_samples(cls, df):
+        return {"mean": df[cls.METRIC_NAME].where(df[cls.METRIC_NAME] != -1).astype(float)}
+
 
 class HasCitationMetric(BaseMetric):
 
@@ -41,7 +71,15 @@ class HasCitationMetric(BaseMetric):
             if answer is None:
                 logger.warning("Received answer of None, can't compute has_citation metric. Setting to -1.")
                 return {cls.METRIC_NAME: -1}
-            return {cls.METRIC_NAME: bool(re.search(r"\[[^\]]+\]", answer))}
+            return {cls.METRIC_NAME: bool(CITATION_PATTERN.search(answer))}
+
+        return has_citation
+
+    @classmethod
+    def batch_evaluator_fn(cls, **kwargs):
+        def has_citation(df):
+            missing = find_missing_answers(df["answer"], cls.METRIC_NAME)
+            return df["answer"].str.contains(CITATION_PATTERN).astype(object).where(~missing, -1)
 
         return has_citation
 
@@ -53,6 +91,10 @@ class HasCitationMetric(BaseMetric):
             "rate": round(df[cls.METRIC_NAME].mean(), 2),
         }
 
+    @classmethod
+    def get_bootstrap_samples(cls, df):
+        return {"rate": df[cls.METRIC_NAME].where(df[cls.METRIC_NAME] != -1).astype(float)}
+
 
 class CitationMatchMetric(BaseMetric):
 
@@ -65,13 +107,27 @@ class CitationMatchMetric(BaseMetric):
                 logger.warning("Received answer of None, can't compute citation_match metric. Setting to -1.")
                 return {cls.METRIC_NAME: -1}
             # Return true if all citations in the truth are present in the answer
-            truth_citations = set(re.findall(r"\[([^\]]+)\.\w{3,4}\]", ground_truth))
-            answer_citations = set(re.findall(r"\[([^\]]+)\.\w{3,4}\]", answer))
+            truth_citations = set(CITED_FILE_PATTERN.findall(ground_truth))
+            answer_citations = set(CITED_FILE_PATTERN.findall(answer))
             citation_match = truth_citations.issubset(answer_citations)
             return {cls.METRIC_NAME: citation_match}
 
         return citation_match
 
+    @classmethod
+    def batch_evaluator_fn(cls, **kwargs):
+        def citation_match(df):
+            missing = find_missing_answers(df["answer"], cls.METRIC_NAME)
+            truth_citations = df["truth"].fillna("").str.findall(CITED_FILE_PATTERN)
+            answer_citations = df["answer"].fillna("").str.findall(CITED_FILE_PATTERN)
+            matches = [
+                set(truth_files).issubset(answer_files)
+                for truth_files, answer_files in zip(truth_citations, answer_citations)
+            ]
+            return pd.Series(matches, index=df.index, dtype=object).where(~missing, -1)
+
+        return citation_match
+
     @classmethod
     def get_aggregate_stats(cls, df):
         df = df[df[cls.METRIC_NAME] != -1]
@@ -80,10 +136,15 @@ class CitationMatchMetric(BaseMetric):
             "rate": round(df[cls.METRIC_NAME].mean(), 2),
         }
 
+    @classmethod
+    def get_bootstrap_samples(cls, df):
+        return {"rate": df[cls.METRIC_NAME].where(df[cls.METRIC_NAME] != -1).astype(float)}
+
 
 class LatencyMetric(BaseMetric):
 
     METRIC_NAME = "latency"
+    HIGHER_IS_BETTER = False
 
     @classmethod
     def evaluator_fn(cls, **kwargs):
@@ -93,10 +154,23 @@ class LatencyMetric(BaseMetric):
 
         return latency
 
+    PERCENTILES = (50, 90, 95, 99)
+
     @classmethod
     def get_aggregate_stats(cls, df):
-        return {
+        stats = {
             "mean": round(df[cls.METRIC_NAME].mean(), 2),
             "max": df[cls.METRIC_NAME].max(),
             "min": df[cls.METRIC_NAME].min(),
         }
+        # Percentiles only include successful calls, since failed calls are recorded with a latency of -1
+        latencies = df[cls.METRIC_NAME].to_numpy(dtype=float)
+        latencies = latencies[latencies >= 0]
+        if len(latencies):
+            percentiles = np.percentile(latencies, cls.PERCENTILES)
+            stats.update({f"p{p}": round(float(value), 2) for p, value in zip(cls.PERCENTILES, percentiles)})
+        return stats
+
+    @classmethod
+    def get_bootstrap_samples(cls, df):
+        return {"mean": df[cls.METRIC_NAME].astype(float)}
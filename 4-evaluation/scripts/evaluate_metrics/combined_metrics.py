@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import re
+from pathlib import Path
+
+from ..rate_limit import estimate_tokens
+from ..token_usage import UsageTrackingFlow
+
+PROMPT_PATH = Path(__file__).resolve().parent / "prompts" / "combined.prompty"
+
+logger = logging.getLogger("scripts")
+
+RELEVANCE = (
+    "Relevance measures how well the answer addresses the main aspects of the question, based on the context. "
+    "1 means the answer completely lacks relevance, 5 means the answer has perfect relevance."
+)
+COHERENCE = (
+    "Coherence measures how well all the sentences of the answer fit together and sound naturally as a whole. "
+    "1 means the answer completely lacks coherence, 5 means the answer has perfect coherency."
+)
+GROUNDEDNESS = (
+    "Groundedness measures whether the claims in the answer follow logically from the information in the context. "
+    "1 means the answer is false according to the context, 5 means the answer follows logically from the context."
+)
+FLUENCY = (
+    "Fluency measures the quality of individual sentences in the answer: whether they are well-written and "
+    "grammatically correct. 1 means the answer completely lacks fluency, 5 means the answer has perfect fluency."
+)
+SIMILARITY = (
+    "Similarity measures how similar the answer is to the ground truth answer, in meaning and content. "
+    "1 means the answer is not at all similar to the ground truth, 5 means the answer is completely similar."
+)
+DONTKNOWNESS = (
+    "I-don't-know-ness measures how much the answer conveys a lack of knowledge or uncertainty. "
+    "1 means the answer completely answers the question and conveys no uncertainty, "
+    "5 means the answer says straightforwardly that it doesn't know and makes no attempt to answer."
+)
+
+# Definitions of the rating metrics that can be scored by the combined judge
+METRIC_DEFINITIONS = {
+    "gpt_relevance": RELEVANCE,
+    "myrelevance": RELEVANCE,
+    "gpt_coherence": COHERENCE,
+    "mycoherence": COHERENCE,
+    "gpt_groundedness": GROUNDEDNESS,
+    "mygroundedness": GROUNDEDNESS,
+    "gpt_fluency": FLUENCY,
+    "gpt_similarity": SIMILARITY,
+    "dontknowness": DONTKNOWNESS,
+}
+
+
+def parse_ratings(llm_output: str, metric_names: list[str]) -> dict:
+    """Parses the ratings from the JSON object in the LLM output.
+    Metrics without a valid 1-5 rating are left out of the returned dictionary."""
+    match = re.search(r"\{.*\}", llm_output or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        ratings = json.loads(match.group())
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(ratings, dict):
+        return {}
+    parsed = {}
+    for metric_name in metric_names:
+        try:
+            rating = float(ratings.get(metric_name))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= rating <= 5:
+            parsed[metric_name] = rating
+    return parsed
+
+
+class CombinedRatingEvaluator:
+    """Scores several rating metrics with a single judge call, returning the same columns as the individual metrics.
+    Metrics whose rating can't be parsed from the combined output are scored by their own evaluator instead."""
+
+    def __init__(self, model_config, fallback_evaluators: dict, rate_limiter=None):
+        self._flow = UsageTrackingFlow(PROMPT_PATH, model_config, retry=rate_limiter is None)
+        self._fallback_evaluators = fallback_evaluators
+        self._rate_limiter = rate_limiter
+
+    @staticmethod
+    def can_combine(metric_name: str) -> bool:
+        return metric_name in METRIC_DEFINITIONS
+
+    @staticmethod
+    def get_cache_fingerprint(metric_name: str) -> str:
+        """Identifies how a metric is scored by the combined judge, so it's cached separately from the metric itself."""
+        prompt_hash = hashlib.sha256(PROMPT_PATH.read_bytes() + METRIC_DEFINITIONS[metric_name].encode()).hexdigest()
+        return f"combined:{prompt_hash}"
+
+    def __call__(self, *, metric_names: list[str], question, answer, context, ground_truth, **kwargs) -> dict:
+        inputs = {
+            "question": question,
+            "answer": answer,
+            "context": context,
+            "ground_truth": ground_truth,
+            "metrics": "\n".join(f"{name}: {METRIC_DEFINITIONS[name]}" for name in metric_names),
+            "metric_names": ", ".join(metric_names),
+        }
+        if self._rate_limiter:
+            llm_output = self._rate_limiter.call(
+                self._flow, estimated_tokens=estimate_tokens(*inputs.values()), **inputs
+            )
+        else:
+            llm_output = self._flow(**inputs)
+
+        output = parse_ratings(llm_output, metric_names)
+        for metric_name in metric_names:
+            if metric_name not in output:
+                logger.warning("No %s rating found in combined judge output, evaluating it separately", metric_name)
+                output.update(
+                    self._fallback_evaluators[metric_name](
+                        question=question, answer=answer, context=context, ground_truth=ground_truth
+                    )
+                )
+        return output
@@ -0,0 +1,130 @@
+import math
+
+# Code metrics record -1 for rows they couldn't compute, like a failed call to the target
+FAILED_VALUE = -1
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream of values, updated in constant memory (Welford's algorithm)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._sum_squared_deviations = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._sum_squared_deviations += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def variance(self) -> float:
+        return self._sum_squared_deviations / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class LogHistogram:
+    """Histogram of positive values with logarithmically sized buckets, like an HDR histogram.
+    Quantiles are within `relative_accuracy` of the exact value, and memory only grows with the range of the values,
+    not with how many there are."""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets = {}
+        self._zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 0:
+            self._zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                # The value that is within the relative accuracy of every value in the bucket
+                return 2 * self._gamma**index / (self._gamma + 1)
+
+
+class OnlineSummary:
+    """Summary statistics of the requested metrics, updated as each result row completes.
+    Each metric's stats take constant memory, so that partial summaries can be reported during long runs."""
+
+    def __init__(self, metrics: list):
+        self.metrics = metrics
+        self.rows = 0
+        self._stats = {metric.METRIC_NAME: RunningStats() for metric in metrics}
+        self._pass_counts = {metric.METRIC_NAME: 0 for metric in metrics}
+        self._histograms = {
+            metric.METRIC_NAME: LogHistogram() for metric in metrics if getattr(metric, "PERCENTILES", None)
+        }
+
+    def update(self, row: dict):
+        self.rows += 1
+        for metric in self.metrics:
+            value = row.get(metric.METRIC_NAME)
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                # Invalid values, like "Failed" ratings, are left out of the stats, as in the final summary
+                continue
+            if math.isnan(value) or value == FAILED_VALUE:
+                continue
+            self._stats[metric.METRIC_NAME].add(value)
+            if metric.PASS_THRESHOLD is not None and value >= metric.PASS_THRESHOLD:
+                self._pass_counts[metric.METRIC_NAME] += 1
+            if metric.METRIC_NAME in self._histograms:
+                self._histograms[metric.METRIC_NAME].add(value)
+
+    def get_stats(self) -> dict:
+        summary = {}
+        for metric in self.metrics:
+            stats = self._stats[metric.METRIC_NAME]
+            metric_summary = {
+                "count": stats.count,
+                "mean": round(stats.mean, 2) if stats.count else None,
+                "std": round(stats.std, 2),
+                "min": stats.min,
+                "max": stats.max,
+            }
+            if metric.PASS_THRESHOLD is not None:
+                pass_count = self._pass_counts[metric.METRIC_NAME]
+                metric_summary["pass_count"] = pass_count
+                metric_summary["pass_rate"] = round(pass_count / self.rows, 2) if self.rows else None
+            histogram = self._histograms.get(metric.METRIC_NAME)
+            if histogram and histogram.count:
+                for percentile in metric.PERCENTILES:
+                    metric_summary[f"p{percentile}"] = round(histogram.quantile(percentile / 100), 2)
+            summary[metric.METRIC_NAME] = metric_summary
+        return summary
+
+    def get_status(self) -> str:
+        """Returns a short description of the current stats, for showing next to the progress bar."""
+        parts = []
+        for metric_name, metric_summary in self.get_stats().items():
+            if metric_summary["mean"] is None:
+                continue
+            part = f"{metric_name} {metric_summary['mean']:g}"
+            if "p95" in metric_summary:
+                part += f" (p95 {metric_summary['p95']:g})"
+            parts.append(part)
+        return " | ".join(parts)
@@ -1,10 +1,12 @@
+import hashlib
 import logging
 import re
 from pathlib import Path
 
 import numpy as np
-from promptflow.client import load_flow
 
+from ..rate_limit import estimate_tokens
+from ..token_usage import UsageTrackingFlow
 from .base_metric import BaseMetric
 
 PROMPT_TEMPLATE_DIR = Path(__file__).resolve().parent / "prompts"
@@ -14,13 +16,21 @@ logger = logging.getLogger("scripts")
 
 class PromptBasedEvaluator:
 
-    def __init__(self, model_config, path, name):
-        prompty_model_config = {"configuration": model_config}
+    # Increment when changing how the LLM output is parsed, to invalidate cached judge results
+    EVALUATOR_VERSION = 1
+
+    def __init__(self, model_config, path, name, rate_limiter=None):
         self._name = name
-        self._flow = load_flow(source=path, model=prompty_model_config)
+        self._flow = UsageTrackingFlow(path, model_config, retry=rate_limiter is None)
+        self._rate_limiter = rate_limiter
 
     def __call__(self, **kwargs) -> dict:
-        llm_output = self._flow(**kwargs)
+        if self._rate_limiter:
+            llm_output = self._rate_limiter.call(
+                self._flow, estimated_tokens=estimate_tokens(*kwargs.values()), **kwargs
+            )
+        else:
+            llm_output = self._flow(**kwargs)
 
         score = np.nan
         if llm_output:
@@ -39,16 +49,30 @@ class PromptBasedEvaluator:
 
 class CustomRatingMetric(BaseMetric):
 
+    PASS_THRESHOLD = 4
+
     @classmethod
-    def evaluator_fn(cls, openai_config, **kwargs):
+    def evaluator_fn(cls, openai_config, rate_limiter=None, **kwargs):
         return PromptBasedEvaluator(
-            openai_config, path=PROMPT_TEMPLATE_DIR / f"{cls.METRIC_NAME}.prompty", name=cls.METRIC_NAME
+            openai_config,
+            path=PROMPT_TEMPLATE_DIR / f"{cls.METRIC_NAME}.prompty",
+            name=cls.METRIC_NAME,
+            rate_limiter=rate_limiter,
         )
 
     @classmethod
     def get_aggregate_stats(cls, df):
         return cls.get_aggregate_stats_for_numeric_rating(df, cls.METRIC_NAME)
 
+    @classmethod
+    def get_bootstrap_samples(cls, df):
+        return cls.get_bootstrap_samples_for_numeric_rating(df, cls.METRIC_NAME)
+
+    @classmethod
+    def get_cache_fingerprint(cls):
+        prompty_hash = hashlib.sha256((PROMPT_TEMPLATE_DIR / f"{cls.METRIC_NAME}.prompty").read_bytes()).hexdigest()
+        return f"v{PromptBasedEvaluator.EVALUATOR_VERSION}:{prompty_hash}"
+
 
 class RelevanceMetric(CustomRatingMetric):
 
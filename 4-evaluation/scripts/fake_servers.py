@@ -0,0 +1,222 @@
+"""Local stand-ins for the chat target and the Azure OpenAI judge deployment,
+for testing, benchmarking and load-testing the evaluation without live endpoints."""
+
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from promptflow.core import AzureOpenAIModelConfiguration
+
+logger = logging.getLogger("scripts")
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "lognormal")
+
+# The combined judge prompt asks for a JSON object with these keys
+JSON_KEYS_PATTERN = re.compile(r"JSON object that has exactly these keys: ([\w, ]+)\.")
+
+
+class FakeServerBehavior:
+    """How a fake server responds: how long it takes, and how often it fails.
+
+    * latency: "constant" (always `latency_mean` seconds), "uniform" (within `latency_spread` of the mean),
+      or "lognormal" (with a median of `latency_mean` and a sigma of `latency_spread`).
+    * error_rate: fraction of requests that fail with a 500.
+    * rate_limit_rate: fraction of requests that fail with a 429, asking to retry after `retry_after` seconds.
+    Random choices are seeded, so that runs are reproducible.
+    """
+
+    def __init__(
+        self,
+        latency: str = "constant",
+        latency_mean: float = 0.0,
+        latency_spread: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.01,
+        seed: int = 0,
+    ):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {latency}, must be one of {LATENCY_DISTRIBUTIONS}")
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            if self.latency == "uniform":
+                return max(0.0, self._random.uniform(-self.latency_spread, self.latency_spread) + self.latency_mean)
+            if self.latency == "lognormal":
+                return self._random.lognormvariate(0, self.latency_spread) * self.latency_mean
+            return self.latency_mean
+
+    def sample_failure(self) -> int | None:
+        """Returns the status code of the failure to inject, or None to respond normally."""
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.rate_limit_rate:
+            return 429
+        if draw < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+
+def deterministic_score(*texts: str) -> int:
+    """Returns a score between 1 and 5 that only depends on the texts."""
+    return int(hashlib.sha256("\n".join(texts).encode()).hexdigest(), 16) % 5 + 1
+
+
+class FakeServer(ThreadingHTTPServer):
+    """HTTP server on a free local port, counting the requests it receives by response status."""
+
+    daemon_threads = True
+
+    def __init__(self, handler_class, behavior: FakeServerBehavior | None = None, path: str = ""):
+        super().__init__(("127.0.0.1", 0), handler_class)
+        self.behavior = behavior or FakeServerBehavior()
+        self.url = f"http://127.0.0.1:{self.server_port}{path}"
+        self.status_counts = {}
+        self._counts_lock = threading.Lock()
+
+    def count(self, status: int):
+        with self._counts_lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.status_counts.values())
+
+
+class FakeJSONHandler(BaseHTTPRequestHandler, ABC):
+    """Responds to POSTs of JSON to paths that end with `PATH`, and with a 404 to any other path,
+    so that requests sent to the wrong URL fail like they would against the real endpoint."""
+
+    # Keep-alive, like the real endpoints, so that connection reuse can be measured
+    protocol_version = "HTTP/1.1"
+    PATH = ""
+
+    @abstractmethod
+    def respond(self, request: dict) -> dict:
+        """Returns the body of a successful response to the request."""
+
+    def send_json(self, status: int, body: dict, headers: dict | None = None):
+        encoded = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+        self.server.count(status)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.split("?")[0].endswith(self.PATH):
+            self.send_json(404, {"error": {"code": "404", "message": f"Unknown path {self.path}"}})
+            return
+        behavior = self.server.behavior
+        time.sleep(behavior.sample_latency())
+        failure = behavior.sample_failure()
+        if failure == 429:
+            retry_after = behavior.retry_after
+            headers = {"Retry-After": str(max(1, round(retry_after))), "retry-after-ms": str(int(retry_after * 1000))}
+            self.send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded"}}, headers)
+        elif failure == 500:
+            self.send_json(500, {"error": {"code": "500", "message": "Injected server error"}})
+        else:
+            self.send_json(200, self.respond(request))
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeChatTargetHandler(FakeJSONHandler):
+    """Answers questions in the format expected by send_question_to_target by default,
+    with the answer in message.content and the sources in context.data_points.text."""
+
+    PATH = "/chat"
+
+    def respond(self, request):
+        question = request["messages"][-1]["content"]
+        source = f"source{deterministic_score(question)}.pdf"
+        return {
+            "message": {"content": f"Answer to {question} [{source}]", "role": "assistant"},
+            "context": {"data_points": {"text": [f"{source}: Context for {question}"]}},
+        }
+
+
+class FakeOpenAIHandler(FakeJSONHandler):
+    """Serves chat completions like an Azure OpenAI deployment (or the OpenAI API), replying with a judge score.
+    Prompts that ask for a JSON object of scores (like the combined judge) get one, and others get a single score."""
+
+    PATH = "/chat/completions"
+
+    def respond(self, request):
+        prompt = "\n".join(str(message.get("content")) for message in request.get("messages", []))
+        keys_match = JSON_KEYS_PATTERN.search(prompt)
+        if keys_match:
+            keys = [key.strip() for key in keys_match.group(1).split(",")]
+            content = json.dumps({key: deterministic_score(prompt, key) for key in keys})
+        else:
+            content = str(deterministic_score(prompt))
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        return {
+            "id": f"chatcmpl-{hashlib.sha256(prompt.encode()).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake-gpt"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+@contextmanager
+def run_in_background(server: FakeServer):
+    """Serves requests on a background thread until the block exits."""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info("Started %s at %s", server.RequestHandlerClass.__name__, server.url)
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_fake_chat_target(**behavior_kwargs):
+    """Starts a fake chat target, whose `url` can be used as the evaluation's target_url."""
+    return run_in_background(
+        FakeServer(FakeChatTargetHandler, FakeServerBehavior(**behavior_kwargs), path=FakeChatTargetHandler.PATH)
+    )
+
+
+def run_fake_openai(**behavior_kwargs):
+    """Starts a fake OpenAI server, whose `url` can be used as the AZURE_OPENAI_ENDPOINT (or OpenAI base URL)."""
+    return run_in_background(FakeServer(FakeOpenAIHandler, FakeServerBehavior(**behavior_kwargs)))
+
+
+def get_fake_openai_config(server: FakeServer, model: str = "gpt-4") -> AzureOpenAIModelConfiguration:
+    """Returns the configuration of a judge deployment on a fake OpenAI server, like service_setup.get_openai_config.
+    The model name is the one that run_evaluation records and looks up token prices with."""
+    openai_config = AzureOpenAIModelConfiguration(
+        azure_deployment=model, azure_endpoint=server.url, api_key="fake", api_version="2024-02-15-preview"
+    )
+    openai_config.model = model
+    return openai_config
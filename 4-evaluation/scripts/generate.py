@@ -2,12 +2,20 @@ import json
 import logging
 import math
 import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
 from azure.ai.generative.synthetic.qa import QADataGenerator, QAType
 from azure.search.documents import SearchClient
 
 from . import service_setup
+from .context_budget import count_tokens
+from .dedup import load_index_for_output
+from .generation_manifest import GenerationManifest, get_manifest_path
+from .rate_limit import RateLimiter, estimate_tokens
+from .search_documents import iter_search_documents, merge_source_chunks
+from .token_usage import TokenUsage, collect_usage, record_usage
 
 logger = logging.getLogger("scripts")
 
@@ -18,7 +26,22 @@ def generate_test_qa_data(
     num_questions_total: int,
     num_questions_per_source: int,
     output_file: Path,
+    concurrency: int = 4,
+    rate_limits: dict | None = None,
+    dedup_index_path: Path | None = None,
+    incremental: bool = True,
+    key_field: str = "id",
 ):
+    """Generates questions and answers from all the documents in the search index, for up to `concurrency` documents
+    at a time, writing each document's questions to the output file as soon as they're generated.
+    Stops once exactly `num_questions_total` questions have been written, so the questions follow the order
+    in which the documents finished, not the order of the search results.
+    Questions that are near-duplicates of an earlier question (or of a question in the index at `dedup_index_path`,
+    which is then updated) are skipped, and don't count towards the total. The questions that the output file
+    already has are left out of the index, since they're regenerated.
+    The rows generated for each document are saved in a manifest next to the output file. If `incremental`,
+    the rows of documents whose content hasn't changed since the previous run are reused instead of regenerated.
+    The search results are sorted on the source page and on `key_field`, the unique key of the search index."""
     logger.info(
         "Generating %d questions total, %d per source, based on search results",
         num_questions_total,
@@ -26,40 +49,137 @@ def generate_test_qa_data(
     )
 
     qa_generator = QADataGenerator(model_config=openai_config)
+    # Calls are paced by the rate limits, if given, and back off when the deployment responds with 429s
+    rate_limiter = RateLimiter.from_config("generator", rate_limits, max_concurrency=concurrency)
 
-    r = search_client.search("", top=1000)
-    qa: list[dict] = []
-    for doc in r:
-        if len(qa) > num_questions_total:
-            break
-        logger.info("Processing search document %s", doc["sourcepage"])
-        text = doc["content"]
-
-        result = qa_generator.generate(
-            text=text,
+    def generate_for_document(doc):
+        start_time = time.perf_counter()
+        result = rate_limiter.call(
+            qa_generator.generate,
+            text=doc["content"],
             qa_type=QAType.LONG_ANSWER,
             num_questions=num_questions_per_source,
+            estimated_tokens=estimate_tokens(doc["content"]),
         )
+        return result, time.perf_counter() - start_time
 
-        for question, answer in result["question_answers"]:
-            citation = f"[{doc['sourcepage']}]"
-            qa.append({"question": question, "truth": answer + citation})
-
-    logger.info("Writing %d questions to %s", len(qa), output_file)
+    # Chunks from the same page are merged, so that questions can draw on the whole page
+    docs = merge_source_chunks(iter_search_documents(search_client, key_field=key_field))
+    dedup_index = load_index_for_output(dedup_index_path, output_file)
+    manifest_path = get_manifest_path(output_file)
+    if incremental:
+        manifest = GenerationManifest.load(manifest_path, num_questions_per_source)
+    else:
+        manifest = GenerationManifest(manifest_path, num_questions_per_source)
+    num_written = 0
+    num_duplicates = 0
+    num_reused = 0
+    usage = TokenUsage()
     directory = Path(output_file).parent
     if not directory.exists():
         directory.mkdir(parents=True)
-    with open(output_file, "w", encoding="utf-8") as f:
-        for item in qa:
-            f.write(json.dumps(item) + "\n")
+    with open(output_file, "w", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+        while num_written < num_questions_total:
+            # Only start on documents whose questions may still be needed, so that no calls are wasted at the end
+            while (
+                len(pending) < concurrency
+                and num_written + len(pending) * num_questions_per_source < num_questions_total
+            ):
+                doc = next(docs, None)
+                if doc is None:
+                    break
+                key = manifest.make_key(doc["sourcepage"], doc["content"])
+                previous_rows = manifest.get(key)
+                if previous_rows is None:
+                    logger.info("Processing search document %s", doc["sourcepage"])
+                    pending[executor.submit(generate_for_document, doc)] = key
+                    continue
+                # The document is unchanged, so its rows aren't generated again. All its rows are kept in the manifest,
+                # even if only some are needed to reach the total, but the rows that are near-duplicates of questions
+                # written before them (like by a document regenerated earlier in this run) are skipped.
+                manifest.put(key, previous_rows)
+                rows = previous_rows[: num_questions_total - num_written]
+                added = dedup_index.add_all([row["question"] for row in rows])
+                num_duplicates += added.count(False)
+                rows = [row for row, is_new in zip(rows, added) if is_new]
+                num_reused += 1
+                f.writelines(json.dumps(row) + "\n" for row in rows)
+                num_written += len(rows)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                sourcepage = key[0]
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    logger.error("Failed to generate questions for search document %s: %s", sourcepage, e)
+                    continue
+                token_usage = result.get("token_usage", {})
+                usage.add(token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0), seconds)
+                citation = f"[{sourcepage}]"
+                all_question_answers = result["question_answers"]
+                question_answers = all_question_answers[: num_questions_total - num_written]
+                added = dedup_index.add_all([question for question, _ in question_answers])
+                num_duplicates += added.count(False)
+                rows = [
+                    {"question": question, "truth": answer + citation}
+                    for (question, answer), is_new in zip(question_answers, added)
+                    if is_new
+                ]
+                # Documents whose questions were cut off at the total are generated again by the next run,
+                # rather than reusing fewer rows than the other documents have
+                if len(question_answers) == len(all_question_answers):
+                    manifest.put(key, rows)
+                f.writelines(json.dumps(row) + "\n" for row in rows)
+                f.flush()
+                num_written += len(rows)
 
+    log_usage(usage)
+    if num_reused:
+        logger.info("Reused the questions of %d unchanged search documents", num_reused)
+    if num_duplicates:
+        logger.info("Skipped %d near-duplicate questions", num_duplicates)
+    manifest.save()
+    if dedup_index_path is not None:
+        dedup_index.save(dedup_index_path)
+    if num_written < num_questions_total:
+        logger.warning("Only %d questions could be generated from the search documents", num_written)
+    logger.info("Wrote %d questions to %s", num_written, output_file)
 
-def generate_based_on_questions(openai_client, model: str, qa: list, num_questions: int, prompt: str):
-    existing_questions = ""
-    if qa:
-        qa = random.sample(qa, len(qa))  # Shuffle questions for some randomness
-        existing_questions = "\n".join([item["question"] for item in qa])
 
+def log_usage(usage: TokenUsage):
+    logger.info(
+        "Generation used %d prompt tokens and %d completion tokens in %d calls, taking %.1f seconds",
+        usage.prompt_tokens,
+        usage.completion_tokens,
+        usage.calls,
+        usage.seconds,
+    )
+
+
+def sample_questions(qa: list, max_tokens: int, rng: random.Random, model: str | None = None) -> list[str]:
+    """Randomly samples questions until they'd exceed `max_tokens`, so that the prompts that include them
+    don't grow with the number of questions."""
+    questions = []
+    num_tokens = 0
+    for item in rng.sample(qa, len(qa)):
+        # Each question is followed by a newline in the prompt
+        question_tokens = count_tokens(item["question"], model) + 1
+        if num_tokens + question_tokens > max_tokens:
+            break
+        questions.append(item["question"])
+        num_tokens += question_tokens
+    return questions
+
+
+def generate_based_on_questions(
+    openai_client, model: str, existing_questions: list[str] | None, num_questions: int, prompt: str
+):
+    existing_questions = "\n".join(existing_questions or [])
+    start_time = time.perf_counter()
     gpt_response = openai_client.chat.completions.create(
         model=model,
         messages=[
@@ -72,6 +192,7 @@ def generate_based_on_questions(openai_client, model: str, qa: list, num_questio
         max_tokens=num_questions * 50,
         temperature=0.3,
     )
+    record_usage(gpt_response.usage, time.perf_counter() - start_time)
 
     qa = []
     for message in gpt_response.choices[0].message.content.split("\n")[0:num_questions]:
@@ -79,43 +200,80 @@ def generate_based_on_questions(openai_client, model: str, qa: list, num_questio
     return qa
 
 
-def generate_dontknows_qa_data(openai_config: dict, num_questions_total: int, input_file: Path, output_file: Path):
+def generate_dontknows_qa_data(
+    openai_config: dict,
+    num_questions_total: int,
+    input_file: Path,
+    output_file: Path,
+    dedup_index_path: Path | None = None,
+    question_token_budget: int = 2000,
+    seed: int | None = None,
+):
+    """Generates off-topic questions in four categories, calling the GPT deployment for every category at once.
+    The prompts include a sample of the input questions of up to `question_token_budget` tokens,
+    which is reproducible when a seed is given."""
     logger.info("Generating off-topic questions based on %s", input_file)
     with open(input_file, encoding="utf-8") as f:
-        qa = [json.loads(line) for line in f.readlines()]
+        qa = [json.loads(line) for line in f if line.strip()]
 
     openai_client = service_setup.get_openai_client(openai_config)
-    dontknows_qa = []
+    model = openai_config["model"]
+    rng = random.Random(seed)
     num_questions_each = math.ceil(num_questions_total / 4)
-    dontknows_qa += generate_based_on_questions(
-        openai_client,
-        openai_config["model"],
-        qa,
-        num_questions_each,
-        f"Given these questions, suggest {num_questions_each} questions that are very related but are not directly answerable by the same sources. Do not simply ask for other examples of the same thing - your question should be standalone.",  # noqa: E501
-    )
-    dontknows_qa += generate_based_on_questions(
-        openai_client,
-        openai_config["model"],
-        qa,
-        num_questions_each,
-        f"Given these questions, suggest {num_questions_each} questions with similar keywords that are about publicly known facts.",  # noqa: E501
-    )
-    dontknows_qa += generate_based_on_questions(
-        openai_client,
-        openai_config["model"],
-        qa,
-        num_questions_each,
-        f"Given these questions, suggest {num_questions_each} questions that are not related to these topics at all but have well known answers.",  # noqa: E501
-    )
-    remaining = num_questions_total - len(dontknows_qa)
-    dontknows_qa += generate_based_on_questions(
-        openai_client,
-        openai_config["model"],
-        qa=None,
-        num_questions=remaining,
-        prompt=f"Suggest {remaining} questions that are nonsensical, and would result in confusion if you asked it.",  # noqa: E501
-    )
+    remaining = max(num_questions_total - 3 * num_questions_each, 0)
+    # Each category samples its own questions, for some variety between them
+    categories = [
+        (
+            sample_questions(qa, question_token_budget, rng, model),
+            num_questions_each,
+            f"Given these questions, suggest {num_questions_each} questions that are very related but are not directly answerable by the same sources. Do not simply ask for other examples of the same thing - your question should be standalone.",  # noqa: E501
+        ),
+        (
+            sample_questions(qa, question_token_budget, rng, model),
+            num_questions_each,
+            f"Given these questions, suggest {num_questions_each} questions with similar keywords that are about publicly known facts.",  # noqa: E501
+        ),
+        (
+            sample_questions(qa, question_token_budget, rng, model),
+            num_questions_each,
+            f"Given these questions, suggest {num_questions_each} questions that are not related to these topics at all but have well known answers.",  # noqa: E501
+        ),
+        (
+            None,
+            remaining,
+            f"Suggest {remaining} questions that are nonsensical, and would result in confusion if you asked it.",
+        ),
+    ]
+
+    def generate_category(existing_questions, num_questions, prompt):
+        # Usage is collected per thread, so each category collects its own
+        with collect_usage() as category_usage:
+            category_qa = generate_based_on_questions(openai_client, model, existing_questions, num_questions, prompt)
+        return category_qa, category_usage
+
+    dontknows_qa = []
+    usage = TokenUsage()
+    with ThreadPoolExecutor(max_workers=len(categories)) as executor:
+        futures = [executor.submit(generate_category, *category) for category in categories if category[1] > 0]
+        for future in futures:
+            category_qa, category_usage = future.result()
+            dontknows_qa += category_qa
+            usage.add(
+                category_usage.prompt_tokens,
+                category_usage.completion_tokens,
+                category_usage.seconds,
+                calls=category_usage.calls,
+            )
+    log_usage(usage)
+
+    # Off-topic questions that are near-duplicates of each other (or of the index's questions) are dropped
+    dedup_index = load_index_for_output(dedup_index_path, output_file)
+    added = dedup_index.add_all([item["question"] for item in dontknows_qa])
+    if not all(added):
+        logger.info("Skipped %d near-duplicate off-topic questions", added.count(False))
+        dontknows_qa = [item for item, is_new in zip(dontknows_qa, added) if is_new]
+    if dedup_index_path is not None:
+        dedup_index.save(dedup_index_path)
 
     logger.info("Writing %d off-topic questions to %s", len(dontknows_qa), output_file)
     directory = Path(output_file).parent
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+from .atomic_write import atomic_write
+
+logger = logging.getLogger("scripts")
+
+
+def get_manifest_path(output_file: Path) -> Path:
+    """Returns the path of the manifest that sits next to a generated QA file, like qa.manifest.json for qa.jsonl."""
+    return Path(output_file).with_suffix(".manifest.json")
+
+
+class GenerationManifest:
+    """QA rows generated for each search document, keyed on its source page and a hash of its content.
+
+    The manifest is saved next to the generated QA file, so that a later run only needs to generate questions
+    for the documents that are new or whose content changed. Documents that weren't used by a run
+    (like documents deleted from the index) are left out of the manifest that it saves, and so are documents
+    whose rows were cut off to stop at the total, so that the next run generates all their rows.
+    """
+
+    def __init__(self, path: Path, num_questions_per_source: int, previous_documents: dict | None = None):
+        self.path = Path(path)
+        self.num_questions_per_source = num_questions_per_source
+        self.previous_documents = previous_documents or {}
+        self.documents = {}
+
+    @classmethod
+    def load(cls, path: Path, num_questions_per_source: int) -> "GenerationManifest":
+        """Loads the documents of a previous run, unless they were generated with a different number per source."""
+        path = Path(path)
+        if not path.exists():
+            return cls(path, num_questions_per_source)
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["num_questions_per_source"] != num_questions_per_source:
+            logger.info(
+                "Regenerating all questions, since %s has %d questions per source",
+                path,
+                manifest["num_questions_per_source"],
+            )
+            return cls(path, num_questions_per_source)
+        previous_documents = {
+            (document["sourcepage"], document["content_hash"]): document["rows"] for document in manifest["documents"]
+        }
+        logger.info("Loaded the questions of %d documents from %s", len(previous_documents), path)
+        return cls(path, num_questions_per_source, previous_documents)
+
+    @staticmethod
+    def make_key(sourcepage: str, content: str) -> tuple[str, str]:
+        return sourcepage, hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key: tuple[str, str]) -> list[dict] | None:
+        """Returns the rows generated by a previous run for a document with the same source page and content."""
+        return self.previous_documents.get(key)
+
+    def put(self, key: tuple[str, str], rows: list[dict]):
+        self.documents[key] = rows
+
+    def save(self):
+        manifest = {
+            "num_questions_per_source": self.num_questions_per_source,
+            "documents": [
+                {"sourcepage": sourcepage, "content_hash": content_hash, "rows": rows}
+                for (sourcepage, content_hash), rows in self.documents.items()
+            ],
+        }
+        with atomic_write(self.path) as f:
+            json.dump(manifest, f)
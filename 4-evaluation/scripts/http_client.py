@@ -0,0 +1,75 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Time spent opening new connections (TCP and TLS handshakes) during the current request on this thread
+_connect_time = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_time.seconds = getattr(_connect_time, "seconds", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_time.seconds = getattr(_connect_time, "seconds", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+_TIMED_POOL_CLASSES = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that keeps connections alive in a pool and measures the time spent opening connections,
+    so that it can be reported separately from the time the server takes to respond."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+        return manager
+
+    def send(self, request, *args, **kwargs):
+        _connect_time.seconds = 0.0
+        return super().send(request, *args, **kwargs)
+
+
+def get_connect_time() -> float | None:
+    """Returns the seconds spent opening connections during the last request sent on this thread
+    through a TimedHTTPAdapter (0 if a pooled connection was reused), or None if not measured."""
+    return getattr(_connect_time, "seconds", None)
+
+
+def reset_connect_time():
+    _connect_time.seconds = None
+
+
+def create_target_session(pool_size: int = 10, proxies: dict | None = None) -> requests.Session:
+    """Creates a session whose connections are kept alive and reused across all calls to the target,
+    with up to `pool_size` connections per host."""
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if proxies:
+        session.proxies.update(proxies)
+    return session
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger("scripts")
+
+
+class JudgeCache:
+    """Persistent cache of GPT judge results, stored in a SQLite database.
+
+    Results are keyed on a hash of everything that can change them: the metric and how it's computed
+    (its cache fingerprint, e.g. the contents of its .prompty file), the judge model, and the row inputs.
+    When the database grows beyond `max_size_mb`, the least recently used results are evicted.
+    """
+
+    def __init__(self, path: Path, max_size_mb: float = 256):
+        self.path = Path(path)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # A single connection is shared by all worker threads, serialized by the lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS judge_results "
+            "(key TEXT PRIMARY KEY, metric TEXT, result TEXT, size INTEGER, last_used REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS judge_results_last_used ON judge_results (last_used)")
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(metric_name: str, fingerprint: str, judge_model: str, **inputs) -> str:
+        key_data = {"metric": metric_name, "fingerprint": fingerprint, "model": judge_model, "inputs": inputs}
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._connection.execute("SELECT result FROM judge_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute("UPDATE judge_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, metric_name: str, result: dict):
+        # Don't cache failed ratings, so that they're retried on the next run
+        if any(isinstance(value, float) and math.isnan(value) for value in result.values()):
+            return
+        serialized = json.dumps(result)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO judge_results (key, metric, result, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, metric_name, serialized, len(key) + len(serialized), time.time()),
+            )
+            self._connection.commit()
+
+    def evict(self):
+        """Deletes the least recently used results until the cache is under its maximum size."""
+        with self._lock:
+            total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM judge_results").fetchone()[0]
+            if total_size <= self.max_size_bytes:
+                return
+            evicted = 0
+            rows = self._connection.execute("SELECT key, size FROM judge_results ORDER BY last_used").fetchall()
+            for key, size in rows:
+                if total_size <= self.max_size_bytes:
+                    break
+                self._connection.execute("DELETE FROM judge_results WHERE key = ?", (key,))
+                total_size -= size
+                evicted += 1
+            self._connection.commit()
+            self._connection.execute("VACUUM")
+        logger.info("Evicted %d results from the judge cache", evicted)
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
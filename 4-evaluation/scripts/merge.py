@@ -0,0 +1,79 @@
+import json
+import logging
+import shutil
+from pathlib import Path
+
+from .evaluate import load_jsonl, summarize_results, write_jsonl
+from .evaluate_metrics import metrics_by_name
+from .results_store import write_results_parquet
+from .testdata import parse_shard
+from .token_usage import summarize_usage
+
+logger = logging.getLogger("scripts")
+
+
+def load_shard(shard_dir: Path) -> tuple[dict, list[dict]]:
+    """Loads the parameters and result rows of a completed shard."""
+    parameters_path = shard_dir / "evaluate_parameters.json"
+    if not parameters_path.exists():
+        raise ValueError(f"{shard_dir} has no evaluate_parameters.json, its evaluation may not have completed")
+    with open(parameters_path, encoding="utf-8") as f:
+        parameters = json.load(f)
+    return parameters, load_jsonl(shard_dir / "eval_results.jsonl")
+
+
+def merge_shard_results(shard_dirs: list[Path], output_dir: Path) -> dict:
+    """Combines the results of evaluations run with --shard into a single results directory,
+    recomputing the summary statistics over all the rows. Returns the merged summary."""
+    shards = [(shard_dir, *load_shard(shard_dir)) for shard_dir in shard_dirs]
+
+    shard_specs = [parameters.get("shard") for _, parameters, _ in shards]
+    if all(shard_specs):
+        indexes, counts = zip(*(parse_shard(spec) for spec in shard_specs))
+        if len(set(counts)) > 1:
+            raise ValueError(f"Can't merge shards from different partitions: {', '.join(shard_specs)}")
+        if len(set(indexes)) < len(indexes):
+            raise ValueError(f"The same shard was given more than once: {', '.join(shard_specs)}")
+        missing = sorted(set(range(1, counts[0] + 1)) - set(indexes))
+        if missing:
+            logger.warning("Shards %s of %d are missing, the summary only covers the given shards", missing, counts[0])
+    else:
+        logger.warning("Some results directories weren't evaluated with --shard, merging them anyway")
+
+    rows = []
+    seen_ids = {}
+    metric_names = []
+    for shard_dir, parameters, shard_rows in shards:
+        for row in shard_rows:
+            if row["id"] in seen_ids:
+                raise ValueError(f"Row {row['id']} is in both {seen_ids[row['id']]} and {shard_dir}")
+            seen_ids[row["id"]] = shard_dir
+        rows.extend(shard_rows)
+        for metric_name in parameters.get("requested_metrics", []):
+            if metric_name not in metric_names:
+                metric_names.append(metric_name)
+    logger.info("Merged %d rows from %d shards", len(rows), len(shards))
+    if not metric_names:
+        raise ValueError("The shards' evaluate_parameters.json don't list their requested metrics")
+
+    summary = summarize_results(rows, [metrics_by_name[metric_name] for metric_name in metric_names])
+    if any("judge_usage" in row for row in rows):
+        summary["usage"] = summarize_usage((row.get("judge_usage") for row in rows), shards[0][1].get("token_prices"))
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_jsonl(output_dir / "eval_results.jsonl", rows)
+    write_results_parquet(output_dir / "eval_results.jsonl", metric_names=metric_names)
+    with open(output_dir / "summary.json", "w", encoding="utf-8") as summary_file:
+        summary_file.write(json.dumps(summary, indent=4))
+    with open(output_dir / "evaluate_parameters.json", "w", encoding="utf-8") as parameters_file:
+        parameters = dict(shards[0][1])
+        parameters["requested_metrics"] = metric_names
+        parameters["shard"] = None
+        parameters["merged_shards"] = {str(shard_dir): spec for (shard_dir, _, _), spec in zip(shards, shard_specs)}
+        parameters_file.write(json.dumps(parameters, indent=4))
+    # All shards run from the same config, so the first one is kept as the merged run's config
+    shard_config_path = shards[0][0] / "config.json"
+    if shard_config_path.exists() and shard_config_path.resolve() != (output_dir / "config.json").resolve():
+        shutil.copyfile(shard_config_path, output_dir / "config.json")
+    logger.info("Merged results saved in %s", output_dir)
+    return summary
@@ -0,0 +1,228 @@
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger("scripts")
+
+
+class TooManyRequestsError(Exception):
+    """Raised when a service responds with HTTP 429."""
+
+    status_code = 429
+
+    def __init__(self, message, retry_after=None, response=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.response = response
+
+
+class TokenBucket:
+    """Token bucket that refills continuously at `rate_per_minute`, up to one minute's worth of tokens."""
+
+    def __init__(self, rate_per_minute: float, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_second = rate_per_minute / 60
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount: float = 1):
+        # Requests larger than the bucket are allowed through once it is full, leaving the bucket in debt
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate_per_second
+            self._sleep(wait)
+
+    def drain(self):
+        """Empties the bucket, so that no calls go out until it refills."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0)
+
+
+def estimate_tokens(*texts) -> int:
+    """Roughly estimates the number of tokens in some texts, using ~4 characters per token."""
+    return sum(len(text) for text in texts if isinstance(text, str)) // 4
+
+
+def get_status_error(exc: BaseException, is_retryable_status):
+    """Returns the exception in the chain of `exc` whose HTTP status code matches `is_retryable_status`, or None.
+    Handles errors from requests, openai, and openai errors wrapped by promptflow."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        status_code = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+        if isinstance(status_code, int) and is_retryable_status(status_code):
+            return exc
+        exc = getattr(exc, "_ex", None) or exc.__cause__ or exc.__context__
+    return None
+
+
+def get_rate_limit_error(exc: BaseException):
+    """Returns the exception in the chain of `exc` that represents an HTTP 429, or None."""
+    return get_status_error(exc, lambda status_code: status_code == 429)
+
+
+def get_server_error(exc: BaseException):
+    """Returns the exception in the chain of `exc` that represents an HTTP 5xx, or None."""
+    return get_status_error(exc, lambda status_code: status_code >= 500)
+
+
+def get_retry_after(exc: BaseException) -> float | None:
+    """Returns the number of seconds the service asked us to wait, based on the Retry-After headers."""
+    if getattr(exc, "retry_after", None) is not None:
+        return float(exc.retry_after)
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # Retry-After can also be an HTTP date, in which case we fall back to our own backoff
+        pass
+    return None
+
+
+class RateLimiter:
+    """Rate limiter shared by all calls to one service (e.g. the target app or the GPT judge deployment).
+
+    * Calls are paced by token buckets sized from the requests/minute and tokens/minute quotas, if given.
+    * The number of calls in flight adapts to the service: it is halved on a 429 response (at most once
+      per backoff window, so that a burst of concurrent 429s only halves it once), and grows back by one
+      after every `increase_after` successful calls, up to `max_concurrency`.
+    * Calls that fail with a 429 are retried up to `max_retries` times, waiting for the Retry-After
+      duration if the service sent one, and otherwise using exponential backoff with full jitter.
+      Calls that fail with a 5xx are retried the same way, without reducing the concurrency.
+
+    Clients called through the limiter shouldn't retry on their own, or their retries hide the 429s from it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_concurrency: int = 1,
+        min_concurrency: int = 1,
+        increase_after: int = 10,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute, clock, sleep) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, clock, sleep) if tokens_per_minute else None
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.min_concurrency = min_concurrency
+        self.concurrency = self.max_concurrency
+        self.increase_after = increase_after
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._backoff_until = None
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, name: str, config: dict | None, max_concurrency: int = 1):
+        config = dict(config or {})
+        config.setdefault("max_concurrency", max_concurrency)
+        return cls(name, **config)
+
+    def _enter(self):
+        with self._condition:
+            while self._in_flight >= self.concurrency:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def _exit(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def _on_success(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.concurrency < self.max_concurrency:
+                self._successes = 0
+                self.concurrency += 1
+                self._condition.notify()
+
+    def _on_rate_limited(self, delay: float):
+        with self._condition:
+            self._successes = 0
+            now = self._clock()
+            if self._backoff_until is not None and now < self._backoff_until:
+                # Calls that were already in flight when the first 429 came back are part of the same burst
+                return
+            self._backoff_until = now + delay
+            new_concurrency = max(self.min_concurrency, self.concurrency // 2)
+            if new_concurrency != self.concurrency:
+                logger.info("Rate limited by %s, reducing concurrency to %d", self.name, new_concurrency)
+            self.concurrency = new_concurrency
+        if self.request_bucket:
+            self.request_bucket.drain()
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def call(self, fn, *args, estimated_tokens: int = 0, **kwargs):
+        """Calls fn(*args, **kwargs) within the rate limits, retrying on 429 responses."""
+        for attempt in range(self.max_retries + 1):
+            if self.request_bucket:
+                self.request_bucket.acquire(1)
+            if self.token_bucket and estimated_tokens:
+                self.token_bucket.acquire(estimated_tokens)
+            self._enter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                rate_limit_error = get_rate_limit_error(e)
+                server_error = get_server_error(e) if rate_limit_error is None else None
+                if (rate_limit_error is None and server_error is None) or attempt == self.max_retries:
+                    raise
+                if rate_limit_error is not None:
+                    delay = self.backoff(attempt, get_retry_after(rate_limit_error))
+                    self._on_rate_limited(delay)
+                    logger.info("Rate limited by %s, retrying in %.1f seconds", self.name, delay)
+                else:
+                    delay = self.backoff(attempt)
+                    logger.info("Server error from %s, retrying in %.1f seconds: %s", self.name, delay, server_error)
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._exit()
+            self._sleep(delay)
+
+
+def rate_limited(evaluator, rate_limiter: RateLimiter | None):
+    """Wraps an evaluator so that its calls go through the rate limiter, if there is one."""
+    if rate_limiter is None:
+        return evaluator
+
+    def rate_limited_evaluator(**kwargs):
+        return rate_limiter.call(evaluator, estimated_tokens=estimate_tokens(*kwargs.values()), **kwargs)
+
+    return rate_limited_evaluator
@@ -0,0 +1,52 @@
+import json
+import logging
+from pathlib import Path
+
+from .evaluate import apply_batch_metrics, summarize_results
+from .evaluate_metrics import metrics_by_name
+from .results_store import load_results, write_results_parquet
+
+logger = logging.getLogger("scripts")
+
+
+def recompute_metrics(results_dir: Path, metric_names: list[str] | None = None) -> dict:
+    """Recomputes metrics that have batch evaluators (like the code metrics) over the saved results of an evaluation,
+    without calling the target or the GPT judge, and updates its summary.json. Returns the updated summary.
+    Defaults to all the metrics with batch evaluators that the evaluation requested."""
+    with open(results_dir / "evaluate_parameters.json", encoding="utf-8") as f:
+        parameters = json.load(f)
+    requested_metrics = parameters.get("requested_metrics", [])
+    if metric_names is None:
+        metric_names = [
+            metric_name
+            for metric_name in requested_metrics
+            if metric_name in metrics_by_name and metrics_by_name[metric_name].batch_evaluator_fn() is not None
+        ]
+    batch_evaluators = {}
+    for metric_name in metric_names:
+        if metric_name not in metrics_by_name:
+            raise ValueError(f"Metric {metric_name} is not available. Available metrics: {metrics_by_name.keys()}")
+        batch_evaluator = metrics_by_name[metric_name].batch_evaluator_fn()
+        if batch_evaluator is None:
+            raise ValueError(f"Metric {metric_name} can only be computed while running an evaluation")
+        batch_evaluators[metric_name] = batch_evaluator
+
+    results_path = results_dir / "eval_results.jsonl"
+    logger.info("Recomputing metrics %s in %s", ", ".join(metric_names), results_path)
+    apply_batch_metrics(results_path, batch_evaluators)
+    write_results_parquet(results_path, metric_names=requested_metrics + metric_names)
+
+    summary_path = results_dir / "summary.json"
+    summary = json.loads(summary_path.read_text(encoding="utf-8")) if summary_path.exists() else {}
+    metrics = [metrics_by_name[metric_name] for metric_name in metric_names]
+    summary.update(summarize_results(load_results(results_dir, columns=metric_names), metrics))
+    with open(summary_path, "w", encoding="utf-8") as summary_file:
+        summary_file.write(json.dumps(summary, indent=4))
+
+    parameters["requested_metrics"] = requested_metrics + [
+        metric_name for metric_name in metric_names if metric_name not in requested_metrics
+    ]
+    with open(results_dir / "evaluate_parameters.json", "w", encoding="utf-8") as parameters_file:
+        parameters_file.write(json.dumps(parameters, indent=4))
+    logger.info("Updated summary saved in %s", summary_path)
+    return summary
@@ -0,0 +1,83 @@
+import itertools
+import json
+import logging
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .atomic_write import atomic_write
+from .testdata import iter_jsonl
+
+logger = logging.getLogger("scripts")
+
+PARQUET_FILENAME = "eval_results.parquet"
+
+# Columns that are always stored as text. The large ones (answer and context) are only read when asked for.
+TEXT_COLUMNS = ("id", "question", "truth", "answer", "context")
+
+
+def infer_results_schema(jsonl_path: Path, metric_names=()) -> pa.Schema:
+    """Infers typed columns for the rows of a results file.
+    Metric columns are always numbers, so that they can be aggregated without parsing. Invalid values become null."""
+    column_types = {}
+    for row in iter_jsonl(jsonl_path):
+        for column, value in row.items():
+            column_types.setdefault(column, set()).add(type(value))
+    fields = []
+    for column, types in column_types.items():
+        types.discard(type(None))
+        if column in TEXT_COLUMNS:
+            field_type = pa.string()
+        elif column in metric_names:
+            field_type = pa.float64()
+        elif types == {int}:
+            field_type = pa.int64()
+        elif types == {bool}:
+            field_type = pa.bool_()
+        elif types and types <= {int, float, bool}:
+            field_type = pa.float64()
+        else:
+            # Strings, and nested values like lists of contexts, which are stored as JSON
+            field_type = pa.string()
+        fields.append(pa.field(column, field_type))
+    return pa.schema(fields)
+
+
+def to_arrow_column(values: list, field_type: pa.DataType) -> pa.Array:
+    if pa.types.is_floating(field_type):
+        return pa.array(pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").astype(float), field_type)
+    if pa.types.is_string(field_type):
+        values = [value if value is None or isinstance(value, str) else json.dumps(value) for value in values]
+    return pa.array(values, field_type)
+
+
+def write_results_parquet(jsonl_path: Path, metric_names=(), chunk_size: int = 1000) -> Path:
+    """Writes a copy of a results file as Parquet, next to it, with one typed column per field.
+    Rows are converted in chunks, so that memory use doesn't grow with the number of rows."""
+    parquet_path = jsonl_path.with_name(PARQUET_FILENAME)
+    schema = infer_results_schema(jsonl_path, metric_names)
+    rows = iter_jsonl(jsonl_path)
+    with atomic_write(parquet_path, "wb") as f, pq.ParquetWriter(f, schema) as writer:
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            columns = [to_arrow_column([row.get(field.name) for row in chunk], field.type) for field in schema]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+    logger.info("Results saved as Parquet in %s", parquet_path)
+    return parquet_path
+
+
+def load_results(results_dir: Path, columns: list[str] | None = None) -> pd.DataFrame:
+    """Loads the results of an evaluation as a DataFrame, only reading the given columns.
+    Reads the memory-mapped Parquet copy of the results if it's up to date, and the JSONL results otherwise."""
+    jsonl_path = results_dir / "eval_results.jsonl"
+    parquet_path = results_dir / PARQUET_FILENAME
+    if parquet_path.exists() and parquet_path.stat().st_mtime_ns >= jsonl_path.stat().st_mtime_ns:
+        if columns is not None:
+            available_columns = pq.read_schema(parquet_path).names
+            columns = [column for column in columns if column in available_columns]
+        return pq.read_table(parquet_path, columns=columns, memory_map=True).to_pandas()
+    rows = iter_jsonl(jsonl_path)
+    if columns is not None:
+        rows = ({column: row[column] for column in columns if column in row} for row in rows)
+    return pd.DataFrame(list(rows))
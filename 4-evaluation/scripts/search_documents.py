@@ -0,0 +1,91 @@
+import hashlib
+import logging
+from collections.abc import Iterable, Iterator
+
+from azure.core.exceptions import HttpResponseError
+from azure.search.documents import SearchClient
+
+logger = logging.getLogger("scripts")
+
+# Azure AI Search returns at most 1000 results per request
+PAGE_SIZE = 1000
+# and doesn't allow skipping more than 100,000 results
+MAX_SKIP = 100_000
+# Longest overlap between consecutive chunks of a page that is looked for when merging them
+MAX_OVERLAP_CHARS = 500
+
+
+def iter_search_documents(
+    search_client: SearchClient, page_size: int = PAGE_SIZE, key_field: str = "id"
+) -> Iterator[dict]:
+    """Streams every chunk in the search index, one page of results at a time,
+    only retrieving the fields needed to generate questions.
+    The results are sorted on `sourcepage` and then on the index's unique `key_field`, so that paging neither repeats
+    nor misses chunks, and the chunks of a page come one after the other. If the index can't sort on those fields,
+    the results are paged through unsorted instead, which is logged as a warning.
+    Azure AI Search doesn't allow skipping more than 100,000 results, so the chunks after that can't be reached,
+    which is also logged as a warning."""
+    order_by = ["sourcepage asc", f"{key_field} asc"]
+    skip = 0
+    while True:
+        if skip > MAX_SKIP:
+            logger.warning(
+                "Stopped after %d chunks, since Azure AI Search can't skip more than %d results", skip, MAX_SKIP
+            )
+            return
+        count = 0
+        try:
+            results = search_client.search(
+                "", select=["content", "sourcepage"], top=page_size, skip=skip, order_by=order_by
+            )
+            for result in results:
+                count += 1
+                yield {"content": result["content"], "sourcepage": result["sourcepage"]}
+        except HttpResponseError as e:
+            # Only the first request can fall back, so that no page is read in a different order than the others
+            if order_by is None or skip or count or e.status_code != 400:
+                raise
+            logger.warning(
+                "Paging through the search index unsorted, so chunks may be repeated or missed, "
+                "since it can't sort on %s: %s",
+                ", ".join(order_by),
+                e.message,
+            )
+            order_by = None
+            continue
+        if count < page_size:
+            return
+        skip += count
+        logger.info("Retrieved %d chunks from the search index", skip)
+
+
+def remove_overlap(previous: str, current: str) -> str:
+    """Returns `current` without the start that overlaps with the end of `previous`, as chunks from a splitter do."""
+    for length in range(min(len(previous), len(current), MAX_OVERLAP_CHARS), 0, -1):
+        if previous.endswith(current[:length]):
+            return current[length:]
+    return current
+
+
+def merge_source_chunks(chunks: Iterable[dict], max_chars: int = 8000) -> Iterator[dict]:
+    """Merges consecutive chunks from the same source page into a single document of up to `max_chars` characters,
+    removing the text that overlaps between them, and skips chunks whose content was already seen.
+    Only a hash of each chunk is kept, so memory doesn't grow with the size of the documents."""
+    seen_hashes = set()
+    document = None
+    for chunk in chunks:
+        content = chunk["content"] or ""
+        content_hash = hashlib.sha256(content.encode()).digest()
+        if content_hash in seen_hashes:
+            continue
+        seen_hashes.add(content_hash)
+        if document is not None and document["sourcepage"] == chunk["sourcepage"]:
+            addition = remove_overlap(document["content"], content)
+            if len(document["content"]) + len(addition) <= max_chars:
+                document["content"] += addition
+                continue
+        if document is not None:
+            yield document
+        document = {"sourcepage": chunk["sourcepage"], "content": content}
+    if document is not None:
+        yield document
@@ -0,0 +1,170 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import re
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+
+logger = logging.getLogger("scripts")
+
+SAMPLING_METHODS = ("head", "reservoir", "stratified")
+
+CITATION_PATTERN = re.compile(r"\[([^\]]+\.\w{3,4})\]")
+
+
+def iter_jsonl(path: Path) -> Iterator[dict]:
+    """Yields one row at a time from a JSONL file, without reading the whole file into memory."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def get_stratum(row: dict, field: str):
+    """Returns the value of the field used to stratify a row.
+    The special field "citation" is the first source cited in the row's ground truth, like "[file.pdf]"."""
+    if field == "citation":
+        match = CITATION_PATTERN.search(row.get("truth") or "")
+        return match.group(1) if match else None
+    value = row.get(field)
+    # Unhashable values (like lists of contexts) are stratified by their JSON representation
+    return value if isinstance(value, str | int | float | bool | None) else json.dumps(value, sort_keys=True)
+
+
+def reservoir_sample(rows: Iterable[dict], k: int, rng: random.Random) -> list[dict]:
+    """Uniformly samples k rows from a stream of unknown length in a single pass (Algorithm R),
+    returning them in their original order."""
+    reservoir = []
+    for index, row in enumerate(rows):
+        if index < k:
+            reservoir.append((index, row))
+        else:
+            replace_index = rng.randint(0, index)
+            if replace_index < k:
+                reservoir[replace_index] = (index, row)
+    return [row for _, row in sorted(reservoir, key=lambda item: item[0])]
+
+
+def allocate_strata(counts: dict, k: int, rng: random.Random) -> dict:
+    """Splits k rows between strata in proportion to their counts (largest remainder method).
+    Every stratum gets at least one row if k allows it. Otherwise the rows left over after each stratum's
+    whole quota go to strata drawn at random, weighted by the rest of their quota."""
+    total = sum(counts.values())
+    if total <= k:
+        return dict(counts)
+    quotas = {stratum: k * count / total for stratum, count in counts.items()}
+    if len(counts) > k:
+        allocations = {stratum: int(quota) for stratum, quota in quotas.items()}
+        remainders = {stratum: quota - int(quota) for stratum, quota in quotas.items() if quota > int(quota)}
+        # Weighted sampling without replacement (Efraimidis-Spirakis), so that no stratum is favored by its position
+        drawn = heapq.nlargest(
+            k - sum(allocations.values()),
+            remainders,
+            key=lambda stratum: rng.random() ** (1 / remainders[stratum]),
+        )
+        for stratum in drawn:
+            allocations[stratum] += 1
+        return allocations
+
+    allocations = {stratum: max(1, int(quota)) for stratum, quota in quotas.items()}
+    by_remainder = sorted(counts, key=lambda stratum: quotas[stratum] - int(quotas[stratum]), reverse=True)
+    for stratum in itertools.cycle(by_remainder):
+        if sum(allocations.values()) >= k:
+            break
+        if allocations[stratum] < counts[stratum]:
+            allocations[stratum] += 1
+    # The minimum of one row can overshoot k: take rows back from the largest allocations
+    while sum(allocations.values()) > k:
+        largest = max(allocations, key=lambda stratum: allocations[stratum])
+        allocations[largest] -= 1
+    return allocations
+
+
+def stratified_sample(get_rows: Callable[[], Iterable[dict]], k: int, field: str, rng: random.Random) -> list[dict]:
+    """Samples k rows so that each stratum (value of the field) is represented in proportion to its size,
+    returning them in their original order. Every stratum gets at least one row if k allows it.
+
+    The rows are streamed twice, from `get_rows()`: once to count the strata, and once to sample each stratum's
+    allocation with a reservoir. So only the counts and the k sampled rows are kept in memory."""
+    counts = {}
+    for row in get_rows():
+        stratum = get_stratum(row, field)
+        counts[stratum] = counts.get(stratum, 0) + 1
+    allocations = allocate_strata(counts, k, rng)
+
+    reservoirs = {stratum: [] for stratum, allocation in allocations.items() if allocation}
+    seen = dict.fromkeys(reservoirs, 0)
+    for index, row in enumerate(get_rows()):
+        stratum = get_stratum(row, field)
+        reservoir = reservoirs.get(stratum)
+        if reservoir is None:
+            continue
+        if seen[stratum] < allocations[stratum]:
+            reservoir.append((index, row))
+        else:
+            replace_index = rng.randint(0, seen[stratum])
+            if replace_index < allocations[stratum]:
+                reservoir[replace_index] = (index, row)
+        seen[stratum] += 1
+
+    sample = [item for reservoir in reservoirs.values() for item in reservoir]
+    logger.info(
+        "Sampled %d rows from %d of the %d strata of field %s", len(sample), len(reservoirs), len(counts), field
+    )
+    return [row for _, row in sorted(sample, key=lambda item: item[0])]
+
+
+def load_testdata(
+    path: Path,
+    num_questions: int | None = None,
+    sampling: str = "head",
+    seed: int | None = None,
+    stratify_field: str | None = None,
+    offset: int = 0,
+    limit: int | None = None,
+) -> list[dict]:
+    """Loads test data rows by streaming through a JSONL file.
+
+    * offset and limit select a window of the file's rows, before any sampling.
+    * num_questions is the number of rows to select from that window, using the sampling method:
+      "head" takes the first rows, "reservoir" takes a uniform random sample,
+      and "stratified" takes a random sample that is proportional across the values of stratify_field.
+    Random sampling is reproducible when a seed is given.
+    """
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method {sampling}. Available methods: {', '.join(SAMPLING_METHODS)}")
+    if sampling == "stratified" and not stratify_field:
+        raise ValueError("A field to stratify by must be specified for stratified sampling")
+
+    def get_rows():
+        return itertools.islice(iter_jsonl(path), offset, offset + limit if limit is not None else None)
+
+    rows = get_rows()
+    if not num_questions:
+        return list(rows)
+    if sampling == "head":
+        return list(itertools.islice(rows, num_questions))
+    rng = random.Random(seed)
+    if sampling == "reservoir":
+        return reservoir_sample(rows, num_questions, rng)
+    return stratified_sample(get_rows, num_questions, stratify_field, rng)
+
+
+def parse_shard(raw: str) -> tuple[int, int]:
+    """Parses a shard specification like "2/4" (the second of four shards) into (index, count)."""
+    try:
+        index, count = (int(part) for part in raw.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {raw}, must be like 2/4 for the second of four shards") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {raw}, the shard number must be between 1 and the number of shards")
+    return index, count
+
+
+def select_shard(rows: list[dict], index: int, count: int) -> list[dict]:
+    """Returns the rows that belong to a shard, partitioning rows by a hash of their "id".
+    Every row belongs to exactly one shard, regardless of which machine or process computes the partition."""
+    return [row for row in rows if int(hashlib.sha256(str(row["id"]).encode()).hexdigest(), 16) % count == index - 1]
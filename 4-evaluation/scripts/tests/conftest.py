@@ -0,0 +1,20 @@
+import pytest
+
+from scripts.fake_servers import get_fake_openai_config, run_fake_chat_target, run_fake_openai
+
+
+@pytest.fixture
+def fake_target():
+    with run_fake_chat_target() as server:
+        yield server
+
+
+@pytest.fixture
+def fake_judge():
+    with run_fake_openai() as server:
+        yield server
+
+
+@pytest.fixture
+def judge_config(fake_judge):
+    return get_fake_openai_config(fake_judge)
@@ -0,0 +1,24 @@
+import pytest
+
+from scripts.atomic_write import atomic_write
+
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("old")
+    with atomic_write(path) as f:
+        f.write("new")
+        assert path.read_text() == "old"
+    assert path.read_text() == "new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_atomic_write_keeps_file_on_error(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"old")
+    with pytest.raises(ValueError):
+        with atomic_write(path, "wb") as f:
+            f.write(b"partial")
+            raise ValueError("interrupted")
+    assert path.read_bytes() == b"old"
+    assert list(tmp_path.iterdir()) == [path]
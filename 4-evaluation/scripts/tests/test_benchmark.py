@@ -0,0 +1,40 @@
+from scripts.benchmark import find_benchmark_regressions, run_benchmarks
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(sizes=[3], concurrencies=[1, 2], requested_metrics=["gpt_relevance", "answer_length"])
+    assert [(case["rows"], case["concurrency"]) for case in results["cases"]] == [(3, 1), (3, 2)]
+    for case in results["cases"]:
+        assert case["target_calls"] == 3
+        assert case["judge_calls"] == 3
+        assert case["rows_per_second"] > 0
+        assert case["aggregation_seconds"] >= 0
+        assert case["peak_memory_mb"] > 0
+    assert results["settings"]["requested_metrics"] == ["gpt_relevance", "answer_length"]
+
+
+def test_run_benchmarks_combined_judge_without_memory():
+    results = run_benchmarks(
+        sizes=[2],
+        concurrencies=[1],
+        requested_metrics=["gpt_relevance", "gpt_coherence"],
+        combined_judge=True,
+        trace_memory=False,
+    )
+    (case,) = results["cases"]
+    assert case["judge_calls"] == 2
+    assert case["peak_memory_mb"] is None
+
+
+def test_find_benchmark_regressions():
+    baseline = {"cases": [{"rows": 100, "concurrency": 1, "rows_per_second": 10.0}]}
+    results = {
+        "cases": [
+            {"rows": 100, "concurrency": 1, "rows_per_second": 7.0},
+            {"rows": 1000, "concurrency": 1, "rows_per_second": 1.0},
+        ]
+    }
+    assert find_benchmark_regressions(baseline, results, tolerance=0.2) == [
+        "100 rows with concurrency 1: 7 rows/sec vs. 10 (-30%)"
+    ]
+    assert find_benchmark_regressions(baseline, results, tolerance=0.5) == []
@@ -0,0 +1,67 @@
+import json
+import logging
+
+import pytest
+
+from scripts.cassette import TargetCassette
+from scripts.evaluate import run_evaluation, write_jsonl
+
+
+def test_cassette_record_and_replay(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    cassette = TargetCassette(path, "record", "http://target/chat", {"top": 3})
+    response = {"answer": "A", "context": "C", "latency": 1.5, "raw": {"message": {"content": "A"}}}
+    cassette.record("Question?", response)
+
+    replay = TargetCassette(path, "replay", "http://target/chat", {"top": 3})
+    assert len(replay) == 1
+    assert replay.get("Question?") == response
+    assert replay.get("Other question?") is None
+    entry = json.loads(path.read_text())
+    assert (entry["target_url"], entry["target_parameters"]) == ("http://target/chat", {"top": 3})
+
+
+def test_cassette_replays_latest_recording(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    TargetCassette(path, "record").record("Question?", {"answer": "Old"})
+    cassette = TargetCassette(path, "record")
+    # Record mode doesn't read back old responses
+    assert len(cassette) == 0
+    cassette.record("Question?", {"answer": "New"})
+    assert TargetCassette(path, "replay").get("Question?") == {"answer": "New"}
+
+
+def test_cassette_warns_about_other_targets(tmp_path, caplog):
+    path = tmp_path / "cassette.jsonl"
+    TargetCassette(path, "record", "http://target/chat", {"top": 3}).record("Question?", {"answer": "A"})
+    with caplog.at_level(logging.WARNING, logger="scripts"):
+        TargetCassette(path, "replay", "http://target/chat", {"top": 3})
+        assert "different target" not in caplog.text
+        TargetCassette(path, "replay", "http://target/chat", {"top": 5})
+        assert "1 of the responses" in caplog.text
+
+
+def test_cassette_replay_requires_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        TargetCassette(tmp_path / "missing.jsonl", "replay")
+
+
+def test_run_evaluation_records_over_existing_cassette(tmp_path, judge_config, fake_target):
+    write_jsonl(tmp_path / "testdata.jsonl", [{"question": "Q1", "truth": "T"}, {"question": "Q2", "truth": "T"}])
+    cassette_path = tmp_path / "cassette.jsonl"
+    TargetCassette(cassette_path, "record").record("Q1", {"answer": "Stale", "context": "C", "latency": 1})
+    for mode in ("record", "replay"):
+        assert run_evaluation(
+            openai_config=judge_config,
+            testdata_path=tmp_path / "testdata.jsonl",
+            results_dir=tmp_path / mode,
+            target_url=fake_target.url,
+            requested_metrics=["answer_length"],
+            target_response_answer_jmespath="message.content",
+            target_response_context_jmespath="context.data_points.text",
+            **{f"{mode}_path": cassette_path},
+        )
+    # The test question and both questions were sent to the target when recording, and none when replaying
+    assert fake_target.request_count == 3
+    rows = [json.loads(line) for line in (tmp_path / "replay" / "eval_results.jsonl").read_text().splitlines()]
+    assert [row["answer"].split(" [")[0] for row in rows] == ["Answer to Q1", "Answer to Q2"]
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pytest
+
+from scripts import compare
+from scripts.compare import compare_runs, load_run, paired_permutation_test
+
+
+def write_run(results_dir, rows, requested_metrics=("gpt_relevance", "latency", "answer_length")):
+    results_dir.mkdir()
+    (results_dir / "eval_results.jsonl").write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    parameters = {"requested_metrics": list(requested_metrics)}
+    (results_dir / "evaluate_parameters.json").write_text(json.dumps(parameters), encoding="utf-8")
+
+
+@pytest.fixture
+def runs(tmp_path):
+    rng = np.random.default_rng(0)
+    questions = [f"Question {i}" for i in range(200)]
+    baseline_ratings = rng.integers(3, 6, size=200)
+    baseline = [
+        {"question": question, "gpt_relevance": int(rating), "latency": 1.0, "answer_length": 100}
+        for question, rating in zip(questions, baseline_ratings)
+    ]
+    # The candidate is worse on relevance and faster, and misses a few questions
+    candidate = [
+        {"question": question, "gpt_relevance": int(max(1, rating - 1)), "latency": 0.5, "answer_length": 100}
+        for question, rating in zip(questions[:190], baseline_ratings)
+    ]
+    candidate[0]["gpt_relevance"] = "Failed"
+    candidate[1]["latency"] = -1
+    write_run(tmp_path / "baseline", baseline)
+    write_run(tmp_path / "candidate", candidate)
+    return tmp_path / "baseline", tmp_path / "candidate"
+
+
+def test_compare_runs(runs):
+    comparison = compare_runs(list(runs))
+    assert comparison["baseline"] == str(runs[0])
+    stats = comparison["runs"][str(runs[1])]
+    assert stats["gpt_relevance"]["pairs"] == 189
+    assert stats["gpt_relevance"]["delta"] == -1.0
+    assert stats["gpt_relevance"]["p_value"] < 0.01
+    assert stats["gpt_relevance"]["regression"]
+    # Lower latency is an improvement, not a regression
+    assert stats["latency"]["pairs"] == 189
+    assert stats["latency"]["delta"] == -0.5
+    assert not stats["latency"]["regression"]
+    assert stats["answer_length"]["p_value"] == 1.0
+    assert not stats["answer_length"]["regression"]
+
+
+def test_compare_runs_ignores_small_changes(runs):
+    comparison = compare_runs(list(runs), threshold=0.5)
+    assert not comparison["runs"][str(runs[1])]["gpt_relevance"]["regression"]
+
+
+def test_load_run_caches_parsed_results(runs, monkeypatch):
+    first = load_run(runs[0])
+    assert (runs[0] / compare.CACHE_FILENAME).exists()
+    monkeypatch.setattr(compare, "load_results", lambda *args, **kwargs: pytest.fail("The cache wasn't used"))
+    assert load_run(runs[0]).equals(first)
+
+
+def test_load_run_ignores_stale_or_unreadable_cache(runs):
+    first = load_run(runs[0])
+    results_path = runs[0] / "eval_results.jsonl"
+    results_path.write_text(results_path.read_text() + results_path.read_text().splitlines()[0] + "\n")
+    assert load_run(runs[0]).equals(first)
+    (runs[0] / compare.CACHE_FILENAME).write_bytes(b"not parquet")
+    assert load_run(runs[0]).equals(first)
+
+
+def test_paired_permutation_test():
+    rng = np.random.default_rng(1)
+    signs = rng.choice([-1.0, 1.0], size=(2000, 100))
+    noise = rng.normal(0, 1, size=100)
+    noise -= noise.mean()
+    differences = np.column_stack([noise, noise + 1, np.where(np.arange(100) < 50, np.nan, noise + 1)])
+    p_values = paired_permutation_test(differences, signs)
+    assert p_values[0] > 0.5
+    assert p_values[1] < 0.01
+    assert p_values[2] < 0.01
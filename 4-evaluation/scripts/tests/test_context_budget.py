@@ -0,0 +1,58 @@
+import json
+
+from scripts.context_budget import ApproximateEncoding, count_tokens, rank_chunks, truncate_context
+from scripts.evaluate import run_evaluation, write_jsonl
+
+CHUNKS = [
+    "intro.pdf: Welcome to the employee handbook, which covers many topics.",
+    "benefits.pdf: The dental plan covers two cleanings per year and fillings.",
+    "vacation.pdf: Employees get fifteen vacation days per year.",
+]
+CONTEXT = "\n\n".join(CHUNKS)
+
+
+def test_rank_chunks_prefers_cited_sources_then_overlap():
+    assert rank_chunks(CHUNKS, "You get fifteen vacation days per year.") == [2, 1, 0]
+    assert rank_chunks(CHUNKS, "The handbook says so [benefits.pdf]") == [1, 0, 2]
+    assert rank_chunks(CHUNKS, "") == [0, 1, 2]
+
+
+def test_truncate_context_within_budget():
+    assert truncate_context(CONTEXT, "answer", 10_000) == (CONTEXT, 0)
+
+
+def test_truncate_context_keeps_most_relevant_chunks_in_order():
+    answer = "Fifteen vacation days per year, and the dental plan covers cleanings."
+    budget = count_tokens(CHUNKS[1]) + count_tokens("\n\n") + count_tokens(CHUNKS[2])
+    truncated, dropped_tokens = truncate_context(CONTEXT, answer, budget)
+    assert truncated == CHUNKS[1] + "\n\n" + CHUNKS[2]
+    assert dropped_tokens == count_tokens(CHUNKS[0]) + count_tokens("\n\n")
+
+
+def test_truncate_context_cuts_chunk_that_does_not_fit():
+    truncated, dropped_tokens = truncate_context(CONTEXT, "vacation days", 5)
+    assert CHUNKS[2].startswith(truncated)
+    assert count_tokens(truncated) <= 5
+    assert dropped_tokens > 0
+
+
+def test_approximate_encoding_round_trips():
+    encoding = ApproximateEncoding()
+    assert encoding.encode("abcdefghij") == ["abcd", "efgh", "ij"]
+    assert encoding.decode(encoding.encode(CONTEXT)[:3]) == CONTEXT[:12]
+
+
+def test_run_evaluation_trims_context_for_budgeted_metrics(tmp_path, judge_config, fake_target):
+    write_jsonl(tmp_path / "testdata.jsonl", [{"question": "Q", "truth": "T"}])
+    assert run_evaluation(
+        openai_config=judge_config,
+        testdata_path=tmp_path / "testdata.jsonl",
+        results_dir=tmp_path / "results",
+        target_url=fake_target.url,
+        requested_metrics=["gpt_groundedness", "gpt_relevance"],
+        target_response_answer_jmespath="message.content",
+        target_response_context_jmespath="context.data_points.text",
+        context_token_budgets={"gpt_groundedness": 3},
+    )
+    (row,) = [json.loads(line) for line in (tmp_path / "results" / "eval_results.jsonl").read_text().splitlines()]
+    assert row["context_dropped_tokens"] == {"gpt_groundedness": count_tokens(row["context"]) - 3}
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+
+from scripts.dedup import NearDuplicateIndex, dedup_jsonl, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text("  What's the  PTO policy?? ") == "what s the pto policy"
+
+
+def test_signatures_estimate_similarity():
+    index = NearDuplicateIndex()
+    signatures = index.compute_signatures(
+        [
+            "What is included in my Northwind Health Plus plan that is not in standard?",
+            "What is included in my Northwind Health Plus plan that isn't in standard?",
+            "How many vacation days do new employees get in their first year?",
+            "Hi",
+        ]
+    )
+    assert signatures.shape == (4, 128)
+    assert np.mean(signatures[0] == signatures[1]) > 0.7
+    assert np.mean(signatures[0] == signatures[2]) < 0.2
+    # Signatures are the same whether texts are hashed alone or in a batch
+    assert (index.compute_signatures(["Hi"])[0] == signatures[3]).all()
+
+
+def test_add_all_skips_near_duplicates():
+    index = NearDuplicateIndex()
+    added = index.add_all(
+        [
+            "What is the deductible for the Northwind Standard plan?",
+            "what is the deductible for the Northwind Standard plan",
+            "What is the deductible for the Northwind Health Plus plan?",
+            "Does the plan cover eye exams?",
+        ]
+    )
+    assert added == [True, False, True, True]
+    assert len(index) == 3
+    assert not index.add("Does the plan cover eye exams??")
+    assert index.add("Who do I contact about payroll questions?")
+
+
+def test_save_and_load(tmp_path):
+    index = NearDuplicateIndex(threshold=0.8)
+    index.add_all(["What is the dental plan?", "How do I request time off?"])
+    index.save(tmp_path / "questions.index")
+    loaded = NearDuplicateIndex.load_or_create(tmp_path / "questions.index")
+    assert len(loaded) == 2
+    assert loaded.threshold == 0.8
+    assert loaded.add_all(["How do I request time off?", "Where is the office?"]) == [False, True]
+    assert len(NearDuplicateIndex.load_or_create(tmp_path / "missing.index")) == 0
+
+
+def test_remove_all(tmp_path):
+    index = NearDuplicateIndex()
+    index.add_all(["What is the dental plan?", "How do I request time off?", "Where is the office?"])
+    assert index.remove_all(["What is the dental plan?", "Is there a gym?"]) == 1
+    assert len(index) == 2
+    assert index.add("What is the dental plan?")
+    assert not index.add("How do I request time off?")
+    index.remove_all(["Where is the office?"])
+    index.save(tmp_path / "questions.index")
+    loaded = NearDuplicateIndex.load_or_create(tmp_path / "questions.index")
+    assert len(loaded) == 2
+    assert loaded.add_all(["Where is the office?", "What is the dental plan?"]) == [True, False]
+
+
+def test_dedup_jsonl(tmp_path):
+    input_file = tmp_path / "input.jsonl"
+    rows = [{"question": f"Question number {index} about topic {index * 7919}?", "truth": "T"} for index in range(200)]
+    rows += [{"question": row["question"].upper(), "truth": "Duplicate"} for row in rows[:50]]
+    input_file.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    index_file = tmp_path / "questions.index"
+    num_written = dedup_jsonl(input_file, tmp_path / "output.jsonl", index_path=index_file)
+    output_rows = [json.loads(line) for line in (tmp_path / "output.jsonl").read_text().splitlines()]
+    assert num_written == len(output_rows)
+    assert all(row["truth"] == "T" for row in output_rows)
+    assert len(output_rows) >= 150
+    # Deduplicating against the saved index removes everything
+    assert dedup_jsonl(input_file, tmp_path / "again.jsonl", index_path=index_file) == 0
+    # except when writing the same output again, whose questions are left out of the index
+    assert dedup_jsonl(input_file, tmp_path / "output.jsonl", index_path=index_file) == num_written
@@ -1,8 +1,29 @@
+import json
+import random
+import threading
+import time
 from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 
+import pytest
 import requests
 
-from scripts.evaluate import send_question_to_target
+from scripts import evaluate
+from scripts.evaluate import (
+    SharedCalls,
+    assign_question_ids,
+    load_completed_rows,
+    map_concurrently,
+    reorder_jsonl,
+    run_evaluation,
+    send_question_to_target,
+    summarize_results,
+)
+from scripts.evaluate_metrics import metrics_by_name
+from scripts.evaluate_metrics.base_metric import BaseMetric
+from scripts.http_client import create_target_session
+from scripts.rate_limit import RateLimiter
 
 
 def test_send_question_to_target_valid():
@@ -89,10 +110,267 @@ def test_send_question_to_target_missing_context():
         )
 
 
+def test_send_question_to_target_retries_rate_limit():
+    response = {
+        "message": {"content": "This is the answer"},
+        "context": {"data_points": {"text": ["Context 1", "Context 2"]}},
+    }
+    responses = [MockResponse({}, status_code=429, headers={"Retry-After": "0"}), MockResponse(response)]
+    requests.post = lambda url, headers, json: responses.pop(0)
+    rate_limiter = RateLimiter("target", backoff_base=0.01)
+    result = send_question_to_target("Question", "http://example.com", rate_limiter=rate_limiter)
+    assert result["answer"] == "This is the answer"
+    assert result["latency"] == 1
+    assert rate_limiter.concurrency == 1
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        question = request["messages"][0]["content"]
+        body = json.dumps(
+            {"message": {"content": f"Answer to {question}"}, "context": {"data_points": {"text": ["Context"]}}}
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def target_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChatHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/chat"
+    server.shutdown()
+
+
+def test_send_question_to_target_session_reuses_connection(target_url):
+    with create_target_session(pool_size=1) as session:
+        first = send_question_to_target("Question", target_url, session=session, timeout=(5, 5), raise_error=True)
+        second = send_question_to_target("Question", target_url, session=session, timeout=(5, 5), raise_error=True)
+    assert first["answer"] == "Answer to Question"
+    assert first["connect_time"] > 0
+    assert second["connect_time"] == 0
+    assert second["server_time"] == second["latency"]
+
+
+def test_map_concurrently_preserves_order():
+    def slow_square(x):
+        time.sleep(random.uniform(0, 0.01))
+        return x * x
+
+    assert map_concurrently(slow_square, list(range(20)), max_workers=8) == [x * x for x in range(20)]
+
+
 class MockResponse:
-    def __init__(self, json_data):
+    def __init__(self, json_data, status_code=200, headers={}):
         self.json_data = json_data
+        self.status_code = status_code
+        self.headers = headers
         self.elapsed = timedelta(seconds=1)
 
     def json(self):
         return self.json_data
+
+
+def test_map_concurrently_without_keeping_results():
+    received = {}
+    results = map_concurrently(
+        lambda item: item * 2,
+        list(range(10)),
+        max_workers=3,
+        on_result=lambda index, result: received.update({index: result}),
+        get_status=lambda: f"{len(received)} done",
+        keep_results=False,
+    )
+    assert results is None
+    assert received == {index: index * 2 for index in range(10)}
+
+
+def test_reorder_jsonl(tmp_path):
+    path = tmp_path / "eval_results.jsonl"
+    path.write_text("".join(json.dumps({"id": id, "answer": f"Answer {id}"}) + "\n" for id in "cab"), encoding="utf-8")
+    reorder_jsonl(path, ["a", "b", "c"])
+    assert [json.loads(line)["id"] for line in path.read_text().splitlines()] == ["a", "b", "c"]
+
+
+def test_assign_question_ids():
+    rows = [
+        {"question": "Q1", "truth": "T1"},
+        {"question": "Q2", "truth": "T2"},
+        {"question": "Q1", "truth": "T1"},
+        {"id": "custom", "question": "Q3", "truth": "T3"},
+    ]
+    assign_question_ids(rows)
+    assert rows[0]["id"] != rows[1]["id"]
+    assert rows[2]["id"] == rows[0]["id"] + "-2"
+    assert rows[3]["id"] == "custom"
+    assert assign_question_ids([{"question": "Q1", "truth": "T1"}])[0]["id"] == rows[0]["id"]
+
+
+def test_load_completed_rows_ignores_truncated_line(tmp_path):
+    path = tmp_path / "eval_results.jsonl"
+    path.write_text('{"id": "a", "answer": "A"}\n{"id": "b", "answer": "B"}\n{"id": "c", "ans', encoding="utf-8")
+    assert [row["id"] for row in load_completed_rows(path)] == ["a", "b"]
+
+
+def test_shared_calls_calls_once_per_argument():
+    calls = []
+
+    def slow_upper(question):
+        calls.append(question)
+        time.sleep(0.01)
+        return question.upper()
+
+    questions = ["a", "b", "a", "a", "c", "b"]
+    shared_upper = SharedCalls(slow_upper, {"a": 3, "b": 2, "c": 1})
+    assert map_concurrently(shared_upper, questions, max_workers=6) == ["A", "B", "A", "A", "C", "B"]
+    assert sorted(calls) == ["a", "b", "c"]
+
+
+def test_summarize_results_adds_confidence_intervals():
+    rows = [
+        {"gpt_relevance": rating, "latency": latency}
+        for rating, latency in zip([5, 4, 3, 5, 1, "Failed"] * 10, [0.5, 0.6, 0.7, 0.8, 0.9, 1.0] * 10)
+    ]
+    summary = summarize_results(rows, [metrics_by_name["gpt_relevance"], metrics_by_name["latency"]])
+    relevance = summary["gpt_relevance"]
+    # The existing summary keys are unchanged
+    assert (relevance["pass_count"], relevance["pass_rate"], relevance["mean_rating"]) == (30, 0.5, 3.6)
+    assert relevance["pass_rate_ci"][0] < 0.5 < relevance["pass_rate_ci"][1]
+    assert relevance["mean_rating_ci"][0] < 3.6 < relevance["mean_rating_ci"][1]
+    assert summary["latency"]["mean_ci"][0] < summary["latency"]["mean"] < summary["latency"]["mean_ci"][1]
+    assert summary["latency"]["p99"] == 1.0
+
+
+def test_run_evaluation_creates_evaluators_once(tmp_path, target_url, monkeypatch):
+    evaluator_fn_calls = []
+
+    class QuestionLengthMetric(BaseMetric):
+        METRIC_NAME = "question_length"
+
+        @classmethod
+        def evaluator_fn(cls, **kwargs):
+            evaluator_fn_calls.append(kwargs)
+            return lambda *, question, **kwargs: {cls.METRIC_NAME: len(question)}
+
+        @classmethod
+        def get_aggregate_stats(cls, df):
+            return {"mean": round(df[cls.METRIC_NAME].mean(), 2)}
+
+    gpt_response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Hi"))])
+    openai_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: gpt_response))
+    )
+    monkeypatch.setattr(evaluate.service_setup, "get_openai_client", lambda config: openai_client, raising=False)
+    monkeypatch.setitem(evaluate.metrics_by_name, "question_length", QuestionLengthMetric)
+    testdata_path = tmp_path / "qa.jsonl"
+    testdata_path.write_text(
+        "".join(json.dumps({"question": f"Question {i}", "truth": "Truth"}) + "\n" for i in range(12)), encoding="utf-8"
+    )
+
+    assert run_evaluation(
+        openai_config=SimpleNamespace(model="gpt-4"),
+        testdata_path=testdata_path,
+        results_dir=tmp_path / "results",
+        target_url=target_url,
+        requested_metrics=["question_length", "answer_length"],
+        target_response_answer_jmespath="message.content",
+        target_response_context_jmespath="context.data_points.text",
+        concurrency=4,
+    )
+
+    assert len(evaluator_fn_calls) == 1
+    results = load_completed_rows(tmp_path / "results" / "eval_results.jsonl")
+    assert [row["question"] for row in results] == [f"Question {i}" for i in range(12)]
+    assert results[11]["answer"] == "Answer to Question 11"
+    assert results[11]["question_length"] == 11
+    summary = json.loads((tmp_path / "results" / "summary.json").read_text())
+    assert summary["question_length"] == {"mean": 10.17}
+    assert (tmp_path / "results" / "eval_results.parquet").exists()
+
+
+@pytest.fixture
+def run_resumable_evaluation(tmp_path, target_url, monkeypatch):
+    gpt_response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Hi"))])
+    openai_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: gpt_response))
+    )
+    monkeypatch.setattr(evaluate.service_setup, "get_openai_client", lambda config: openai_client, raising=False)
+    testdata_path = tmp_path / "qa.jsonl"
+    testdata_path.write_text(
+        "".join(json.dumps({"question": f"Question {i}", "truth": "Truth"}) + "\n" for i in range(8)), encoding="utf-8"
+    )
+
+    def run(**kwargs):
+        return run_evaluation(
+            openai_config=SimpleNamespace(model="gpt-4"),
+            testdata_path=testdata_path,
+            results_dir=tmp_path / "results",
+            target_url=target_url,
+            requested_metrics=["answer_length"],
+            target_response_answer_jmespath="message.content",
+            target_response_context_jmespath="context.data_points.text",
+            **kwargs,
+        )
+
+    return run
+
+
+def interrupt_after(results_path, num_rows, failed_row=None):
+    rows = load_completed_rows(results_path)[:num_rows]
+    if failed_row is not None:
+        rows[failed_row].update(answer="Connection refused", context="Connection refused", latency=-1)
+    results_path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+
+
+def test_run_evaluation_resumes_with_original_selection(tmp_path, run_resumable_evaluation, caplog):
+    # Sampled without a seed, so selecting again would give other questions
+    assert run_resumable_evaluation(num_questions=6, sampling="reservoir")
+    results_path = tmp_path / "results" / "eval_results.jsonl"
+    first_questions = [row["question"] for row in load_completed_rows(results_path)]
+    interrupt_after(results_path, 5, failed_row=2)
+
+    with caplog.at_level("WARNING", logger="scripts"):
+        assert run_resumable_evaluation(num_questions=2, sampling="reservoir", resume=True)
+    assert "ignoring the changed options: num_questions" in caplog.text
+    rows = load_completed_rows(results_path)
+    assert [row["question"] for row in rows] == first_questions
+    # The row whose target call failed was evaluated again
+    assert all(row["latency"] != -1 for row in rows)
+    parameters = json.loads((tmp_path / "results" / "evaluate_parameters.json").read_text())
+    assert parameters["num_questions"] == 6
+
+
+def test_run_evaluation_refuses_to_drop_completed_rows(tmp_path, run_resumable_evaluation):
+    assert run_resumable_evaluation()
+    results_path = tmp_path / "results" / "eval_results.jsonl"
+    interrupt_after(results_path, 5)
+    # Like a run started before the selection was saved
+    (tmp_path / "results" / evaluate.SELECTION_FILENAME).unlink()
+    results = results_path.read_text()
+
+    assert not run_resumable_evaluation(num_questions=2, resume=True)
+    assert results_path.read_text() == results
+
+
+def test_run_evaluation_includes_batch_metrics_in_partial_summary(run_resumable_evaluation, monkeypatch):
+    partial_stats = []
+    monkeypatch.setattr(evaluate, "PARTIAL_SUMMARY_INTERVAL", 0)
+    monkeypatch.setattr(
+        evaluate,
+        "write_partial_summary",
+        lambda path, online_summary, total_rows: partial_stats.append(online_summary.get_stats()["answer_length"]),
+    )
+    assert run_resumable_evaluation()
+    assert len(partial_stats) == 8
+    # "Answer to Question 0" has 20 characters
+    assert partial_stats[0]["mean"] == 20
@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
+from promptflow.core import Prompty
 
-from scripts.evaluate_metrics import builtin_metrics, code_metrics, prompt_metrics
+from scripts.evaluate_metrics import builtin_metrics, code_metrics, combined_metrics, prompt_metrics
+from scripts.evaluate_metrics.bootstrap import bootstrap_confidence_intervals
 
 
 def test_answer_length():
@@ -78,7 +81,23 @@ def test_latency():
     assert callable(metric_function)
     assert metric_function(data={"latency": 20}) == {}
     df = pd.DataFrame([{"latency": 20}, {"latency": 10}, {"latency": 5}])
-    assert metric.get_aggregate_stats(df) == {"mean": 11.67, "max": 20, "min": 5}
+    assert metric.get_aggregate_stats(df) == {
+        "mean": 11.67,
+        "max": 20,
+        "min": 5,
+        "p50": 10.0,
+        "p90": 18.0,
+        "p95": 19.0,
+        "p99": 19.8,
+    }
+
+
+def test_latency_percentiles_ignore_failed_calls():
+    metric = code_metrics.LatencyMetric()
+    df = pd.DataFrame({"latency": [-1] + [float(latency) for latency in range(1, 101)]})
+    stats = metric.get_aggregate_stats(df)
+    assert stats["min"] == -1
+    assert (stats["p50"], stats["p90"], stats["p95"], stats["p99"]) == (50.5, 90.1, 95.05, 99.01)
 
 
 def test_custom_relevance():
@@ -160,3 +179,90 @@ def test_builtin_coherence_missing_values():
     assert metric.METRIC_NAME == "gpt_coherence"
     df = pd.DataFrame([{"gpt_coherence": "Failed"}, {"gpt_coherence": 4}, {"gpt_coherence": 3}])
     assert metric.get_aggregate_stats(df) == {"mean_rating": 3.5, "pass_count": 1, "pass_rate": 0.33}
+
+
+def test_combined_parse_ratings():
+    metric_names = ["gpt_groundedness", "gpt_relevance", "gpt_coherence"]
+    llm_output = 'Here you go: {"gpt_groundedness": 5, "gpt_relevance": "4", "gpt_coherence": 7}'
+    assert combined_metrics.parse_ratings(llm_output, metric_names) == {"gpt_groundedness": 5.0, "gpt_relevance": 4.0}
+    assert combined_metrics.parse_ratings("I cannot rate this.", metric_names) == {}
+    assert combined_metrics.parse_ratings('{"gpt_groundedness": 5', metric_names) == {}
+
+
+def test_combined_evaluator_falls_back_to_separate_metric():
+    fallback_calls = []
+
+    def coherence_evaluator(**kwargs):
+        fallback_calls.append(kwargs)
+        return {"gpt_coherence": 2.0}
+
+    evaluator = combined_metrics.CombinedRatingEvaluator(
+        None, fallback_evaluators={"gpt_coherence": coherence_evaluator}
+    )
+    evaluator._flow = lambda **kwargs: '{"gpt_groundedness": 5, "gpt_relevance": 4}'
+    result = evaluator(
+        metric_names=["gpt_groundedness", "gpt_relevance", "gpt_coherence"],
+        question="Q",
+        answer="A",
+        context="C",
+        ground_truth="T",
+    )
+    assert result == {"gpt_groundedness": 5.0, "gpt_relevance": 4.0, "gpt_coherence": 2.0}
+    assert len(fallback_calls) == 1
+
+
+def test_combined_prompt_lists_requested_metrics():
+    prompt = Prompty.load(source=combined_metrics.PROMPT_PATH).render(
+        question="Q",
+        answer="A",
+        context="C",
+        ground_truth="T",
+        metrics="gpt_relevance: " + combined_metrics.RELEVANCE,
+        metric_names="gpt_relevance",
+    )
+    assert "exactly these keys: gpt_relevance" in prompt
+    assert combined_metrics.CombinedRatingEvaluator.can_combine("mygroundedness")
+    assert not combined_metrics.CombinedRatingEvaluator.can_combine("answer_length")
+
+
+def test_bootstrap_samples_for_numeric_rating():
+    metric = prompt_metrics.RelevanceMetric()
+    df = pd.DataFrame([{"myrelevance": 5}, {"myrelevance": 3}, {"myrelevance": "Failed"}])
+    samples = metric.get_bootstrap_samples(df)
+    assert samples["pass_rate"].tolist() == [1.0, 0.0, 0.0]
+    assert samples["mean_rating"].tolist()[:2] == [5.0, 3.0]
+    assert np.isnan(samples["mean_rating"].tolist()[2])
+
+
+def test_bootstrap_confidence_intervals():
+    rng = np.random.default_rng(1)
+    ratings = rng.integers(1, 6, size=500).astype(float)
+    sparse = np.where(np.arange(500) % 2, ratings, np.nan)
+    intervals = bootstrap_confidence_intervals(
+        {"mean": ratings, "sparse": sparse, "empty": np.full(500, np.nan)}, n_resamples=200
+    )
+    assert set(intervals) == {"mean", "sparse"}
+    low, high = intervals["mean"]
+    assert low < ratings.mean() < high
+    assert high - low < 0.5
+    # Intervals are reproducible, and wider for the sample with half the values
+    assert bootstrap_confidence_intervals({"mean": ratings}, n_resamples=200)["mean"] == intervals["mean"]
+    assert intervals["sparse"][1] - intervals["sparse"][0] > high - low
+
+
+def test_code_metric_batch_evaluators_match_row_evaluators():
+    rows = [
+        {"answer": "See [file.pdf] and [other.html].", "truth": "From [file.pdf]", "latency": 1.5},
+        {"answer": "No citations here", "truth": "From [file.pdf]", "latency": 0.5},
+        {"answer": "Only [notes]", "truth": "No sources", "latency": 2.0},
+        {"answer": None, "truth": "From [file.pdf]", "latency": -1},
+        {"answer": "[a.pdf][b.pdf]", "truth": "[b.pdf] then [a.pdf]", "latency": 1.0},
+    ]
+    df = pd.DataFrame(rows)
+    for metric in [code_metrics.AnswerLengthMetric, code_metrics.HasCitationMetric, code_metrics.CitationMatchMetric]:
+        row_evaluator = metric.evaluator_fn()
+        expected = [row_evaluator(answer=row["answer"], ground_truth=row["truth"])[metric.METRIC_NAME] for row in rows]
+        assert metric.batch_evaluator_fn()(df).tolist() == expected
+    # Latency is already in each row, so it has no batch step
+    assert code_metrics.LatencyMetric.batch_evaluator_fn() is None
+    assert prompt_metrics.RelevanceMetric.batch_evaluator_fn() is None
@@ -0,0 +1,134 @@
+import json
+
+import openai
+import pytest
+
+from scripts.evaluate import send_question_to_target
+from scripts.evaluate_metrics import builtin_metrics, prompt_metrics
+from scripts.evaluate_metrics.combined_metrics import CombinedRatingEvaluator
+from scripts.fake_servers import FakeServerBehavior, get_fake_openai_config, run_fake_chat_target, run_fake_openai
+from scripts.http_client import create_target_session
+from scripts.rate_limit import RateLimiter
+
+
+def ask(url, question, **kwargs):
+    with create_target_session() as session:
+        return send_question_to_target(question, url, session=session, timeout=(5, 5), **kwargs)
+
+
+def create_client(url):
+    return openai.AzureOpenAI(azure_endpoint=url, api_key="fake", api_version="2024-02-15-preview", max_retries=0)
+
+
+def test_fake_chat_target_matches_default_schema():
+    with run_fake_chat_target() as server:
+        result = ask(server.url, "What is the capital of France?", raise_error=True)
+    assert result["answer"].startswith("Answer to What is the capital of France? [source")
+    assert result["context"].endswith(": Context for What is the capital of France?")
+    assert server.status_counts == {200: 1}
+
+
+def test_fake_chat_target_rate_limits_are_retried():
+    limiter = RateLimiter("target", max_retries=20, backoff_base=0.001)
+    with run_fake_chat_target(rate_limit_rate=0.5, retry_after=0.001, seed=1) as server:
+        results = [ask(server.url, f"Question {i}", raise_error=True, rate_limiter=limiter) for i in range(10)]
+    assert all(result["answer"].startswith("Answer to Question") for result in results)
+    assert server.status_counts[200] == 10
+    assert server.status_counts[429] > 0
+
+
+def test_fake_chat_target_injects_errors():
+    with run_fake_chat_target(error_rate=1) as server:
+        result = ask(server.url, "Question")
+    assert result["latency"] == -1
+    assert server.status_counts == {500: 1}
+
+
+def test_fake_servers_reject_unknown_paths():
+    with run_fake_chat_target() as target, run_fake_openai() as judge:
+        result = ask(target.url.removesuffix("/chat") + "/ask", "Question")
+        with pytest.raises(openai.NotFoundError):
+            openai.OpenAI(base_url=judge.url, api_key="fake", max_retries=0).embeddings.create(
+                model="text-embedding-3-small", input="Hello"
+            )
+    assert result["latency"] == -1
+    assert target.status_counts == {404: 1}
+    assert judge.status_counts == {404: 1}
+
+
+def test_fake_server_latency():
+    with run_fake_chat_target(latency_mean=0.05) as server:
+        result = ask(server.url, "Question", raise_error=True)
+    assert result["latency"] >= 0.05
+
+
+@pytest.mark.parametrize("latency", ["constant", "uniform", "lognormal"])
+def test_fake_server_behavior_latency_is_seeded(latency):
+    first = FakeServerBehavior(latency, latency_mean=1, latency_spread=0.5, seed=3)
+    second = FakeServerBehavior(latency, latency_mean=1, latency_spread=0.5, seed=3)
+    samples = [first.sample_latency() for _ in range(100)]
+    assert samples == [second.sample_latency() for _ in range(100)]
+    assert all(sample >= 0 for sample in samples)
+    assert 0.7 < sum(samples) / len(samples) < 1.5
+
+
+def test_fake_server_behavior_unknown_latency():
+    with pytest.raises(ValueError, match="Unknown latency distribution"):
+        FakeServerBehavior("normal")
+
+
+def test_fake_openai_scores_are_deterministic():
+    messages = [{"role": "user", "content": "Rate the relevance of this answer from 1 to 5."}]
+    with run_fake_openai() as server:
+        client = create_client(server.url)
+        first = client.chat.completions.create(model="gpt", messages=messages)
+        second = client.chat.completions.create(model="gpt", messages=messages)
+    assert first.choices[0].message.content in {"1", "2", "3", "4", "5"}
+    assert first.choices[0].message.content == second.choices[0].message.content
+    assert first.usage.total_tokens == first.usage.prompt_tokens + first.usage.completion_tokens
+
+
+def test_fake_openai_answers_json_keys():
+    prompt = "Respond with only a JSON object that has exactly these keys: gpt_relevance, gpt_coherence."
+    with run_fake_openai() as server:
+        response = create_client(server.url).chat.completions.create(
+            model="gpt", messages=[{"role": "user", "content": prompt}]
+        )
+    scores = json.loads(response.choices[0].message.content)
+    assert set(scores) == {"gpt_relevance", "gpt_coherence"}
+    assert all(1 <= score <= 5 for score in scores.values())
+
+
+def test_fake_openai_rate_limit_is_retried():
+    limiter = RateLimiter("judge", max_retries=20, backoff_base=0.001)
+    messages = [{"role": "user", "content": "Rate this."}]
+    with run_fake_openai(rate_limit_rate=0.5, retry_after=0.001, seed=2) as server:
+        client = create_client(server.url)
+        for _ in range(5):
+            limiter.call(client.chat.completions.create, model="gpt", messages=messages)
+    assert server.status_counts[200] == 5
+    assert server.status_counts[429] > 0
+
+
+@pytest.mark.parametrize("metric", [prompt_metrics.RelevanceMetric, builtin_metrics.BuiltinCoherenceMetric])
+def test_judge_rate_limits_reach_the_limiter(metric):
+    limiter = RateLimiter("judge", max_concurrency=8, max_retries=50, backoff_base=0.001)
+    with run_fake_openai(rate_limit_rate=0.5, retry_after=0.001, seed=3) as server:
+        evaluator = metric.evaluator_fn(openai_config=get_fake_openai_config(server), rate_limiter=limiter)
+        for _ in range(5):
+            result = evaluator(question="Q", answer="A", context="C", ground_truth="T")
+            assert 1 <= result[metric.METRIC_NAME] <= 5
+    # The 429s aren't retried by promptflow or the openai client, so the limiter backs off
+    assert server.status_counts[429] > 0
+    assert server.status_counts[200] == 5
+    assert server.request_count == server.status_counts[200] + server.status_counts[429]
+    assert limiter.concurrency < 8
+
+
+def test_fake_openai_serves_combined_judge(fake_judge, judge_config):
+    metric_names = ["gpt_relevance", "gpt_groundedness"]
+    evaluator = CombinedRatingEvaluator(judge_config, fallback_evaluators={})
+    ratings = evaluator(metric_names=metric_names, question="Q", answer="A", context="C", ground_truth="T")
+    assert set(ratings) == set(metric_names)
+    assert all(1 <= rating <= 5 for rating in ratings.values())
+    assert fake_judge.status_counts == {200: 1}
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from scripts import generate
+from scripts.context_budget import count_tokens
+from scripts.generate import generate_dontknows_qa_data, generate_test_qa_data
+
+
+class FakeSearchClient:
+    def __init__(self, num_docs):
+        self.docs = [{"sourcepage": f"doc{index}.pdf", "content": f"Content {index}"} for index in range(num_docs)]
+
+    def search(self, search_text, select, top, skip, order_by):
+        return iter(self.docs[skip : skip + top])
+
+
+class FakeQADataGenerator:
+    calls = []
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def __init__(self, model_config):
+        pass
+
+    def generate(self, text, qa_type, num_questions):
+        cls = FakeQADataGenerator
+        with cls.lock:
+            cls.calls.append(text)
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.02)
+        with cls.lock:
+            cls.in_flight -= 1
+        if text == "Content 1":
+            raise ValueError("Content filtered")
+        return {
+            "question_answers": [(fake_question(text, index), f"A{index}.") for index in range(num_questions)],
+            "token_usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }
+
+
+def fake_question(text, index):
+    # Questions that only differ by a number are near-duplicates, so each question gets distinct text
+    if text.startswith("Content 3"):
+        return "What is the dental plan?"
+    return f"What is {hashlib.sha256(f'{text} {index}'.encode()).hexdigest()}?"
+
+
+@pytest.fixture(autouse=True)
+def fake_generator(monkeypatch):
+    FakeQADataGenerator.calls = []
+    FakeQADataGenerator.max_in_flight = 0
+    monkeypatch.setattr(generate, "QADataGenerator", FakeQADataGenerator)
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_generate_test_qa_data_stops_at_total(tmp_path):
+    output_file = tmp_path / "qa" / "qa.jsonl"
+    generate_test_qa_data({}, FakeSearchClient(20), 7, 3, output_file, concurrency=4)
+    rows = read_jsonl(output_file)
+    assert len(rows) == 7
+    assert all(row["truth"].endswith(".pdf]") for row in rows)
+    # Failed documents are skipped, and documents are only started while their questions may still be needed
+    assert "Content 1" in FakeQADataGenerator.calls
+    assert len(FakeQADataGenerator.calls) <= 5
+    assert FakeQADataGenerator.max_in_flight > 1
+
+
+def test_generate_test_qa_data_without_enough_documents(tmp_path):
+    output_file = tmp_path / "qa.jsonl"
+    generate_test_qa_data({}, FakeSearchClient(3), 100, 2, output_file, concurrency=2)
+    assert len(read_jsonl(output_file)) == 4
+    assert len(FakeQADataGenerator.calls) == 3
+
+
+def test_generate_test_qa_data_serial(tmp_path):
+    output_file = tmp_path / "qa.jsonl"
+    generate_test_qa_data({}, FakeSearchClient(5), 4, 2, output_file, concurrency=1)
+    rows = read_jsonl(output_file)
+    assert [row["truth"] for row in rows] == ["A0.[doc0.pdf]", "A1.[doc0.pdf]", "A0.[doc2.pdf]", "A1.[doc2.pdf]"]
+    assert FakeQADataGenerator.max_in_flight == 1
+
+
+def test_generate_test_qa_data_skips_near_duplicates(tmp_path):
+    output_file = tmp_path / "qa.jsonl"
+    index_file = tmp_path / "questions.index"
+    generate_test_qa_data({}, FakeSearchClient(5), 10, 2, output_file, concurrency=1, dedup_index_path=index_file)
+    questions = [row["question"] for row in read_jsonl(output_file)]
+    # Document 3's questions are the same, so only one of them counts towards the total
+    assert len(questions) == 7
+    assert questions.count("What is the dental plan?") == 1
+
+    # Regenerating the same output isn't filtered by the questions it's about to overwrite
+    generate_test_qa_data(
+        {}, FakeSearchClient(5), 10, 2, output_file, concurrency=1, dedup_index_path=index_file, incremental=False
+    )
+    assert [row["question"] for row in read_jsonl(output_file)] == questions
+
+    # Another output's questions are all near-duplicates of the first output's
+    other_output_file = tmp_path / "other_qa.jsonl"
+    generate_test_qa_data({}, FakeSearchClient(5), 10, 2, other_output_file, concurrency=1, dedup_index_path=index_file)
+    assert read_jsonl(other_output_file) == []
+
+
+def test_generate_test_qa_data_only_regenerates_changed_documents(tmp_path):
+    output_file = tmp_path / "qa.jsonl"
+    search_client = FakeSearchClient(5)
+    generate_test_qa_data({}, search_client, 100, 2, output_file, concurrency=1)
+    first_rows = read_jsonl(output_file)
+    manifest = json.loads((tmp_path / "qa.manifest.json").read_text())
+    assert [document["sourcepage"] for document in manifest["documents"]] == [
+        "doc0.pdf",
+        "doc2.pdf",
+        "doc3.pdf",
+        "doc4.pdf",
+    ]
+
+    search_client.docs[2]["content"] = "Content 2, updated"
+    del search_client.docs[4]
+    FakeQADataGenerator.calls = []
+    generate_test_qa_data({}, search_client, 100, 2, output_file, concurrency=1)
+    # Only the changed document, and the document that failed before, are sent to the generator again
+    assert FakeQADataGenerator.calls == ["Content 1", "Content 2, updated"]
+    rows = read_jsonl(output_file)
+    assert rows[:2] == first_rows[:2]
+    assert [row["question"] for row in rows if row["truth"].endswith("[doc3.pdf]")] == ["What is the dental plan?"]
+    assert not any(row["truth"].endswith("[doc4.pdf]") for row in rows)
+    assert not any(row in first_rows for row in rows if row["truth"].endswith("[doc2.pdf]"))
+    manifest = json.loads((tmp_path / "qa.manifest.json").read_text())
+    assert [document["sourcepage"] for document in manifest["documents"]] == ["doc0.pdf", "doc2.pdf", "doc3.pdf"]
+
+
+def test_generate_test_qa_data_skips_reused_near_duplicates(tmp_path):
+    output_file = tmp_path / "qa.jsonl"
+    search_client = FakeSearchClient(4)
+    generate_test_qa_data({}, search_client, 100, 2, output_file, concurrency=1)
+
+    # The regenerated document now has the same question as the unchanged document after it
+    search_client.docs[2]["content"] = "Content 3, again"
+    generate_test_qa_data({}, search_client, 100, 2, output_file, concurrency=1)
+    questions = [row["question"] for row in read_jsonl(output_file)]
+    assert len(questions) == 3
+    assert questions.count("What is the dental plan?") == 1
+    manifest = json.loads((tmp_path / "qa.manifest.json").read_text())
+    assert [len(document["rows"]) for document in manifest["documents"]] == [2, 1, 1]
+
+
+def test_generate_test_qa_data_regenerates_all_when_not_incremental(tmp_path):
+    output_file = tmp_path / "qa.jsonl"
+    generate_test_qa_data({}, FakeSearchClient(3), 100, 2, output_file, concurrency=1)
+    FakeQADataGenerator.calls = []
+    generate_test_qa_data({}, FakeSearchClient(3), 100, 2, output_file, concurrency=1, incremental=False)
+    assert len(FakeQADataGenerator.calls) == 3
+    # A different number of questions per source also regenerates every document
+    FakeQADataGenerator.calls = []
+    generate_test_qa_data({}, FakeSearchClient(3), 100, 3, output_file, concurrency=1)
+    assert len(FakeQADataGenerator.calls) == 3
+    assert len(read_jsonl(output_file)) == 6
+
+
+class FakeOpenAIClient:
+    def __init__(self):
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, n, max_tokens, temperature):
+        prompt = messages[0]["content"]
+        with self.lock:
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        content = "\n".join(fake_question(prompt, index) for index in range(max_tokens // 50))
+        return SimpleNamespace(
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=10),
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        )
+
+
+def run_dontknows(monkeypatch, tmp_path, num_questions_total, **kwargs):
+    openai_client = FakeOpenAIClient()
+    monkeypatch.setattr(generate.service_setup, "get_openai_client", lambda openai_config: openai_client)
+    input_file = tmp_path / "qa.jsonl"
+    if not input_file.exists():
+        input_file.write_text(
+            "".join(
+                json.dumps({"question": fake_question("Input", index), "truth": "T"}) + "\n" for index in range(5000)
+            )
+        )
+    output_file = tmp_path / "dontknows.jsonl"
+    generate_dontknows_qa_data({"model": "gpt-4"}, num_questions_total, input_file, output_file, **kwargs)
+    return openai_client, read_jsonl(output_file)
+
+
+def test_generate_dontknows_qa_data_concurrently_within_budget(monkeypatch, tmp_path):
+    openai_client, rows = run_dontknows(monkeypatch, tmp_path, 10, question_token_budget=300, seed=1)
+    assert len(rows) == 10
+    assert openai_client.max_in_flight == 4
+    for prompt in openai_client.prompts:
+        existing_questions = prompt.split("\n", 1)[1]
+        assert count_tokens(existing_questions) <= 300
+    assert sum(bool(prompt.split("\n", 1)[1]) for prompt in openai_client.prompts) == 3
+
+    # The same seed samples the same questions
+    same_seed_client, _ = run_dontknows(monkeypatch, tmp_path, 10, question_token_budget=300, seed=1)
+    assert sorted(same_seed_client.prompts) == sorted(openai_client.prompts)
+
+
+def test_generate_dontknows_qa_data_few_questions(monkeypatch, tmp_path):
+    openai_client, rows = run_dontknows(monkeypatch, tmp_path, 3)
+    # Each of the first three categories gets one question, so the last one isn't generated
+    assert len(rows) == 3
+    assert len(openai_client.prompts) == 3
+
+
+def test_generate_test_qa_data_regenerates_documents_cut_off_at_total(tmp_path):
+    output_file = tmp_path / "qa.jsonl"
+    search_client = FakeSearchClient(5)
+    generate_test_qa_data({}, search_client, 5, 3, output_file, concurrency=1)
+    assert len([row for row in read_jsonl(output_file) if row["truth"].endswith("[doc2.pdf]")]) == 2
+
+    FakeQADataGenerator.calls = []
+    generate_test_qa_data({}, search_client, 100, 3, output_file, concurrency=1)
+    # doc2's questions were cut off at the total, so it's generated again rather than reused with fewer rows
+    assert FakeQADataGenerator.calls == ["Content 1", "Content 2", "Content 3", "Content 4"]
+    assert len([row for row in read_jsonl(output_file) if row["truth"].endswith("[doc2.pdf]")]) == 3
@@ -0,0 +1,50 @@
+import math
+
+from scripts.evaluate_metrics import builtin_metrics, code_metrics, prompt_metrics
+from scripts.judge_cache import JudgeCache
+
+
+def test_judge_cache_roundtrip(tmp_path):
+    with JudgeCache(tmp_path / "cache.sqlite") as cache:
+        key = JudgeCache.make_key("myrelevance", "v1:abc", "gpt-4", question="Q", answer="A")
+        assert cache.get(key) is None
+        cache.put(key, "myrelevance", {"myrelevance": 4.0})
+        assert cache.get(key) == {"myrelevance": 4.0}
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    with JudgeCache(tmp_path / "cache.sqlite") as cache:
+        assert cache.get(key) == {"myrelevance": 4.0}
+
+
+def test_judge_cache_key_depends_on_all_inputs():
+    key = JudgeCache.make_key("myrelevance", "v1:abc", "gpt-4", question="Q", answer="A")
+    assert key == JudgeCache.make_key("myrelevance", "v1:abc", "gpt-4", answer="A", question="Q")
+    assert key != JudgeCache.make_key("myrelevance", "v1:abc", "gpt-4", question="Q", answer="B")
+    assert key != JudgeCache.make_key("myrelevance", "v1:def", "gpt-4", question="Q", answer="A")
+    assert key != JudgeCache.make_key("myrelevance", "v1:abc", "gpt-35", question="Q", answer="A")
+
+
+def test_judge_cache_skips_failed_ratings(tmp_path):
+    with JudgeCache(tmp_path / "cache.sqlite") as cache:
+        cache.put("key", "myrelevance", {"myrelevance": math.nan})
+        assert cache.get("key") is None
+
+
+def test_judge_cache_evicts_least_recently_used(tmp_path):
+    with JudgeCache(tmp_path / "cache.sqlite", max_size_mb=0.001) as cache:
+        for i in range(20):
+            cache.put(f"key{i}", "myrelevance", {"myrelevance": 5.0, "padding": "x" * 100})
+        cache.get("key0")
+        cache.evict()
+        assert cache.get("key0") is not None
+        assert cache.get("key1") is None
+        assert cache.get("key19") is not None
+
+
+def test_cache_fingerprints():
+    assert code_metrics.AnswerLengthMetric.get_cache_fingerprint() is None
+    assert builtin_metrics.BuiltinF1ScoreMetric.get_cache_fingerprint() is None
+    assert builtin_metrics.BuiltinRelevanceMetric.get_cache_fingerprint().startswith("promptflow-evals==")
+    relevance_fingerprint = prompt_metrics.RelevanceMetric.get_cache_fingerprint()
+    assert relevance_fingerprint.startswith("v1:")
+    assert relevance_fingerprint != prompt_metrics.CoherenceMetric.get_cache_fingerprint()
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from scripts.merge import merge_shard_results
+
+
+def write_shard(shard_dir, shard, rows, requested_metrics=("answer_length", "latency")):
+    shard_dir.mkdir(parents=True)
+    (shard_dir / "eval_results.jsonl").write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    parameters = {"requested_metrics": list(requested_metrics), "shard": shard}
+    (shard_dir / "evaluate_parameters.json").write_text(json.dumps(parameters), encoding="utf-8")
+    (shard_dir / "config.json").write_text(json.dumps({"results_dir": "results"}), encoding="utf-8")
+
+
+def make_row(id, answer, latency):
+    return {"id": id, "question": f"Question {id}", "answer": answer, "answer_length": len(answer), "latency": latency}
+
+
+def test_merge_shard_results(tmp_path):
+    write_shard(tmp_path / "shard-1-of-2", "1/2", [make_row("a", "Yes", 1.0), make_row("b", "No", 3.0)])
+    write_shard(tmp_path / "shard-2-of-2", "2/2", [make_row("c", "Maybe", 2.0)])
+
+    summary = merge_shard_results([tmp_path / "shard-1-of-2", tmp_path / "shard-2-of-2"], tmp_path)
+
+    assert summary["answer_length"]["mean"] == 3.33
+    assert (summary["answer_length"]["max"], summary["answer_length"]["min"]) == (5, 2)
+    assert summary["latency"]["mean"] == 2.0
+    assert json.loads((tmp_path / "summary.json").read_text()) == summary
+    rows = [json.loads(line) for line in (tmp_path / "eval_results.jsonl").read_text().splitlines()]
+    assert [row["id"] for row in rows] == ["a", "b", "c"]
+    parameters = json.loads((tmp_path / "evaluate_parameters.json").read_text())
+    assert parameters["shard"] is None
+    assert sorted(parameters["merged_shards"].values()) == ["1/2", "2/2"]
+    assert (tmp_path / "config.json").exists()
+
+
+def test_merge_shard_results_rejects_mismatched_shards(tmp_path):
+    write_shard(tmp_path / "one", "1/2", [make_row("a", "Yes", 1.0)])
+    write_shard(tmp_path / "two", "2/3", [make_row("b", "No", 1.0)])
+    write_shard(tmp_path / "again", "1/2", [make_row("a", "Yes", 1.0)])
+    (tmp_path / "incomplete").mkdir()
+
+    with pytest.raises(ValueError, match="different partitions"):
+        merge_shard_results([tmp_path / "one", tmp_path / "two"], tmp_path / "merged")
+    with pytest.raises(ValueError, match="more than once"):
+        merge_shard_results([tmp_path / "one", tmp_path / "again"], tmp_path / "merged")
+    with pytest.raises(ValueError, match="may not have completed"):
+        merge_shard_results([tmp_path / "one", tmp_path / "incomplete"], tmp_path / "merged")
@@ -0,0 +1,52 @@
+import numpy as np
+
+from scripts.evaluate import summarize_results
+from scripts.evaluate_metrics import metrics_by_name
+from scripts.evaluate_metrics.online_stats import LogHistogram, OnlineSummary, RunningStats
+
+
+def test_running_stats():
+    values = [3.0, 1.5, 4.0, 10.0, 2.5]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.count == 5
+    assert stats.mean == np.mean(values)
+    assert round(stats.variance, 10) == round(np.var(values, ddof=1), 10)
+    assert (stats.min, stats.max) == (1.5, 10.0)
+
+
+def test_log_histogram_quantiles_are_within_accuracy():
+    rng = np.random.default_rng(0)
+    latencies = rng.lognormal(mean=0.5, sigma=1.0, size=10_000)
+    histogram = LogHistogram(relative_accuracy=0.01)
+    for latency in latencies:
+        histogram.add(latency)
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = np.quantile(latencies, q, method="lower")
+        assert abs(histogram.quantile(q) - exact) <= 0.011 * exact
+    # Memory depends on the range of the values, not how many there are
+    assert len(histogram._buckets) < 1000
+
+
+def test_online_summary_matches_final_summary():
+    rows = [
+        {"gpt_relevance": rating, "latency": latency, "answer_length": length}
+        for rating, latency, length in zip(
+            [5, 4, 3, 1, "Failed", 4] * 5, [0.5, 1.25, 2.0, 0.75, 3.0, 1.0] * 5, [10, 20, -1, 40, 50, 60] * 5
+        )
+    ]
+    metrics = [metrics_by_name["gpt_relevance"], metrics_by_name["latency"], metrics_by_name["answer_length"]]
+    online_summary = OnlineSummary(metrics)
+    for row in rows:
+        online_summary.update(row)
+
+    stats = online_summary.get_stats()
+    final = summarize_results(rows, metrics)
+    assert stats["gpt_relevance"]["mean"] == final["gpt_relevance"]["mean_rating"]
+    assert stats["gpt_relevance"]["pass_count"] == final["gpt_relevance"]["pass_count"]
+    assert stats["gpt_relevance"]["pass_rate"] == final["gpt_relevance"]["pass_rate"]
+    assert stats["answer_length"]["mean"] == final["answer_length"]["mean"]
+    assert stats["latency"]["mean"] == final["latency"]["mean"]
+    assert abs(stats["latency"]["p50"] - np.quantile([row["latency"] for row in rows], 0.5, method="lower")) < 0.02
+    assert online_summary.get_status().startswith("gpt_relevance 3.4 | latency 1.42 (p95")
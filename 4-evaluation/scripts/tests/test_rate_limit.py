@@ -0,0 +1,123 @@
+import pytest
+
+from scripts.rate_limit import RateLimiter, TokenBucket, TooManyRequestsError, get_rate_limit_error, get_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock, sleep=clock.sleep)
+    for _ in range(60):
+        bucket.acquire()
+    assert clock.now == 0
+    bucket.acquire()
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_token_bucket_allows_oversized_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(100, clock=clock, sleep=clock.sleep)
+    bucket.acquire(500)
+    assert clock.now == 0
+
+
+def test_get_retry_after():
+    assert get_retry_after(TooManyRequestsError("429", retry_after=3)) == 3.0
+
+    class Response:
+        status_code = 429
+        headers = {"retry-after-ms": "1500"}
+
+    class WrappedError(Exception):
+        def __init__(self, ex):
+            self._ex = ex
+
+    error = Exception("rate limited")
+    error.response = Response()
+    assert get_rate_limit_error(WrappedError(error)) is error
+    assert get_retry_after(error) == 1.5
+    assert get_rate_limit_error(ValueError("not rate limited")) is None
+
+
+def test_rate_limiter_retries_and_adapts():
+    clock = FakeClock()
+    limiter = RateLimiter("test", max_concurrency=8, increase_after=2, clock=clock, sleep=clock.sleep)
+    calls = []
+
+    def flaky():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise TooManyRequestsError("429", retry_after=5)
+        return "ok"
+
+    assert limiter.call(flaky) == "ok"
+    assert len(calls) == 3
+    assert clock.now >= 10
+    assert limiter.concurrency == 2
+    limiter.call(lambda: None)
+    assert limiter.concurrency == 3
+
+
+def test_rate_limiter_halves_once_per_burst():
+    clock = FakeClock()
+    limiter = RateLimiter("test", max_concurrency=8, clock=clock, sleep=clock.sleep)
+    # Calls that were in flight together all come back with 429s
+    for _ in range(4):
+        limiter._on_rate_limited(5)
+    assert limiter.concurrency == 4
+    clock.now = 6
+    limiter._on_rate_limited(5)
+    assert limiter.concurrency == 2
+
+
+def test_rate_limiter_retries_server_errors_without_reducing_concurrency():
+    clock = FakeClock()
+    limiter = RateLimiter("test", max_concurrency=8, clock=clock, sleep=clock.sleep)
+    calls = []
+
+    class ServerError(Exception):
+        status_code = 503
+
+    def flaky():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise ServerError("unavailable")
+        return "ok"
+
+    assert limiter.call(flaky) == "ok"
+    assert len(calls) == 3
+    assert limiter.concurrency == 8
+
+
+def test_rate_limiter_gives_up():
+    clock = FakeClock()
+    limiter = RateLimiter("test", max_retries=2, clock=clock, sleep=clock.sleep)
+
+    def always_limited():
+        raise TooManyRequestsError("429")
+
+    with pytest.raises(TooManyRequestsError):
+        limiter.call(always_limited)
+    assert len(clock.sleeps) == 2
+
+
+def test_rate_limiter_does_not_retry_other_errors():
+    limiter = RateLimiter("test")
+
+    def broken():
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        limiter.call(broken)
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from scripts.recompute import recompute_metrics
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    rows = [
+        {
+            "id": "a",
+            "question": "Q1",
+            "truth": "T [a.pdf]",
+            "answer": "Yes [a.pdf]",
+            "latency": 1.0,
+            "gpt_relevance": 5,
+        },
+        {"id": "b", "question": "Q2", "truth": "T [b.pdf]", "answer": "No", "latency": 2.0, "gpt_relevance": 3},
+    ]
+    (tmp_path / "eval_results.jsonl").write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    parameters = {"requested_metrics": ["gpt_relevance", "answer_length"]}
+    (tmp_path / "evaluate_parameters.json").write_text(json.dumps(parameters), encoding="utf-8")
+    summary = {"gpt_relevance": {"pass_count": 1, "pass_rate": 0.5, "mean_rating": 4.0}}
+    (tmp_path / "summary.json").write_text(json.dumps(summary), encoding="utf-8")
+    return tmp_path
+
+
+def test_recompute_metrics(results_dir):
+    summary = recompute_metrics(results_dir)
+    assert set(summary) == {"gpt_relevance", "answer_length"}
+    assert summary["answer_length"]["mean"] == 6.5
+
+    summary = recompute_metrics(results_dir, ["citation_match"])
+    assert summary["citation_match"]["rate"] == 0.5
+    assert json.loads((results_dir / "summary.json").read_text()) == summary
+    rows = [json.loads(line) for line in (results_dir / "eval_results.jsonl").read_text().splitlines()]
+    assert [row["citation_match"] for row in rows] == [True, False]
+    assert [row["answer_length"] for row in rows] == [11, 2]
+    parameters = json.loads((results_dir / "evaluate_parameters.json").read_text())
+    assert parameters["requested_metrics"] == ["gpt_relevance", "answer_length", "citation_match"]
+
+
+def test_recompute_metrics_rejects_row_metrics(results_dir):
+    with pytest.raises(ValueError, match="only be computed while running"):
+        recompute_metrics(results_dir, ["gpt_relevance"])
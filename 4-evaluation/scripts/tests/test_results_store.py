@@ -0,0 +1,73 @@
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from scripts.results_store import PARQUET_FILENAME, load_results, write_results_parquet
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    rows = [
+        {
+            "id": "a",
+            "question": "Q1",
+            "truth": "T1",
+            "answer": "A1 [a.pdf]",
+            "context": "Long context",
+            "latency": 1.5,
+            "connect_time": None,
+            "gpt_relevance": 5,
+            "has_citation": True,
+        },
+        {
+            "id": "b",
+            "question": "Q2",
+            "truth": "T2",
+            "answer": None,
+            "context": ["Context", "as a list"],
+            "latency": -1,
+            "connect_time": 0.25,
+            "gpt_relevance": "Failed",
+            "has_citation": -1,
+        },
+    ]
+    (tmp_path / "eval_results.jsonl").write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    return tmp_path
+
+
+def test_write_results_parquet(results_dir):
+    parquet_path = write_results_parquet(
+        results_dir / "eval_results.jsonl", metric_names=["gpt_relevance", "has_citation"], chunk_size=1
+    )
+    assert parquet_path == results_dir / PARQUET_FILENAME
+    schema = pq.read_schema(parquet_path)
+    assert schema.field("answer").type == pa.string()
+    assert schema.field("latency").type == pa.float64()
+    assert schema.field("connect_time").type == pa.float64()
+    assert schema.field("gpt_relevance").type == pa.float64()
+    assert schema.field("has_citation").type == pa.float64()
+
+    df = load_results(results_dir)
+    assert df["context"].tolist() == ["Long context", '["Context", "as a list"]']
+    assert df["gpt_relevance"].tolist()[0] == 5.0
+    assert df["gpt_relevance"].isna().tolist() == [False, True]
+    assert df["has_citation"].tolist() == [1.0, -1.0]
+
+
+def test_load_results_reads_only_requested_columns(results_dir):
+    write_results_parquet(results_dir / "eval_results.jsonl", metric_names=["gpt_relevance"])
+    df = load_results(results_dir, columns=["latency", "gpt_relevance", "missing"])
+    assert list(df.columns) == ["latency", "gpt_relevance"]
+    assert df["latency"].tolist() == [1.5, -1.0]
+
+
+def test_load_results_falls_back_to_stale_jsonl(results_dir):
+    parquet_path = write_results_parquet(results_dir / "eval_results.jsonl")
+    stat = parquet_path.stat()
+    os.utime(parquet_path, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+    # Without a fresh Parquet copy, the columns are read from the JSONL as they are
+    df = load_results(results_dir, columns=["gpt_relevance"])
+    assert df["gpt_relevance"].tolist() == [5, "Failed"]
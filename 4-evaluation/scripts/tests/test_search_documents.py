@@ -0,0 +1,91 @@
+import logging
+
+from azure.core.exceptions import HttpResponseError
+
+from scripts import search_documents
+from scripts.search_documents import iter_search_documents, merge_source_chunks, remove_overlap
+
+
+class PagedSearchClient:
+    def __init__(self, num_docs, sortable=True):
+        self.sortable = sortable
+        self.docs = [
+            {"id": str(index), "sourcepage": f"doc{index}.pdf", "content": f"Content {index}", "embedding": [0.1]}
+            for index in range(num_docs)
+        ]
+        self.requests = []
+
+    def search(self, search_text, select, top, skip, order_by):
+        self.requests.append((select, top, skip))
+        self.order_by = order_by
+        if order_by and not self.sortable:
+            return self.fail_unsortable(order_by)
+        return iter(self.docs[skip : skip + top])
+
+    def fail_unsortable(self, order_by):
+        # Like the SDK, the request is only sent once the results are iterated
+        error = HttpResponseError(message=f"Field '{order_by[0].split()[0]}' is not sortable.")
+        error.status_code = 400
+        raise error
+        yield
+
+
+def test_iter_search_documents_pages_through_whole_index():
+    client = PagedSearchClient(2500)
+    documents = list(iter_search_documents(client))
+    assert len(documents) == 2500
+    assert documents[-1] == {"sourcepage": "doc2499.pdf", "content": "Content 2499"}
+    assert [skip for _, _, skip in client.requests] == [0, 1000, 2000]
+    assert client.requests[0][0] == ["content", "sourcepage"]
+    assert client.order_by == ["sourcepage asc", "id asc"]
+
+
+def test_iter_search_documents_falls_back_to_unsorted_paging(caplog):
+    client = PagedSearchClient(5, sortable=False)
+    with caplog.at_level(logging.WARNING, logger="scripts"):
+        documents = list(iter_search_documents(client, page_size=2))
+    assert [document["sourcepage"] for document in documents] == [f"doc{index}.pdf" for index in range(5)]
+    assert [skip for _, _, skip in client.requests] == [0, 0, 2, 4]
+    assert client.order_by is None
+    assert "Paging through the search index unsorted" in caplog.text
+    assert "'sourcepage' is not sortable" in caplog.text
+
+
+def test_iter_search_documents_exact_page():
+    client = PagedSearchClient(4)
+    assert len(list(iter_search_documents(client, page_size=2))) == 4
+    assert [skip for _, _, skip in client.requests] == [0, 2, 4]
+
+
+def test_iter_search_documents_warns_at_skip_limit(monkeypatch, caplog):
+    monkeypatch.setattr(search_documents, "MAX_SKIP", 4)
+    client = PagedSearchClient(10)
+    with caplog.at_level(logging.WARNING, logger="scripts"):
+        assert len(list(iter_search_documents(client, page_size=2))) == 6
+    assert [skip for _, _, skip in client.requests] == [0, 2, 4]
+    assert "can't skip more than 4 results" in caplog.text
+
+
+def test_remove_overlap():
+    assert remove_overlap("The quick brown fox", "brown fox jumps") == " jumps"
+    assert remove_overlap("The quick brown fox", "A lazy dog") == "A lazy dog"
+
+
+def test_merge_source_chunks():
+    chunks = [
+        {"sourcepage": "a.pdf#page=1", "content": "First part of page one."},
+        {"sourcepage": "a.pdf#page=1", "content": "page one. Second part."},
+        {"sourcepage": "a.pdf#page=1", "content": "page one. Second part."},
+        {"sourcepage": "a.pdf#page=2", "content": "Page two."},
+        {"sourcepage": "a.pdf#page=1", "content": "First part of page one."},
+    ]
+    assert list(merge_source_chunks(chunks)) == [
+        {"sourcepage": "a.pdf#page=1", "content": "First part of page one. Second part."},
+        {"sourcepage": "a.pdf#page=2", "content": "Page two."},
+    ]
+
+
+def test_merge_source_chunks_splits_long_pages():
+    chunks = [{"sourcepage": "a.pdf", "content": f"Chunk {index}. "} for index in range(4)]
+    documents = list(merge_source_chunks(chunks, max_chars=20))
+    assert [document["content"] for document in documents] == ["Chunk 0. Chunk 1. ", "Chunk 2. Chunk 3. "]
@@ -0,0 +1,112 @@
+import json
+import random
+from collections import Counter
+
+import pytest
+
+from scripts.testdata import (
+    get_stratum,
+    load_testdata,
+    parse_shard,
+    reservoir_sample,
+    select_shard,
+    stratified_sample,
+)
+
+
+@pytest.fixture
+def testdata_path(tmp_path):
+    path = tmp_path / "qa.jsonl"
+    rows = [
+        {"question": f"Q{i}", "truth": f"T{i} [source{i % 3}.pdf]", "context": "Azure" if i % 4 else "Fabric"}
+        for i in range(100)
+    ]
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    return path
+
+
+def test_load_testdata_head_with_window(testdata_path):
+    assert [row["question"] for row in load_testdata(testdata_path, num_questions=3)] == ["Q0", "Q1", "Q2"]
+    rows = load_testdata(testdata_path, offset=10, limit=5)
+    assert [row["question"] for row in rows] == ["Q10", "Q11", "Q12", "Q13", "Q14"]
+    assert len(load_testdata(testdata_path)) == 100
+
+
+def test_load_testdata_reservoir_is_seeded(testdata_path):
+    first = load_testdata(testdata_path, num_questions=10, sampling="reservoir", seed=42)
+    second = load_testdata(testdata_path, num_questions=10, sampling="reservoir", seed=42)
+    assert first == second
+    assert len(first) == 10
+    indexes = [int(row["question"][1:]) for row in first]
+    assert indexes == sorted(indexes)
+    assert max(indexes) >= 10
+
+
+def test_reservoir_sample_is_uniform():
+    counts = Counter()
+    for seed in range(2000):
+        counts.update(row["i"] for row in reservoir_sample(({"i": i} for i in range(10)), 3, random.Random(seed)))
+    assert all(500 < counts[i] < 700 for i in range(10))
+
+
+def test_stratified_sample_is_proportional(testdata_path):
+    rows = load_testdata(testdata_path, num_questions=20, sampling="stratified", stratify_field="context", seed=1)
+    assert Counter(row["context"] for row in rows) == {"Azure": 15, "Fabric": 5}
+
+
+def test_stratified_sample_covers_small_strata():
+    rows = [{"context": "big"} for _ in range(98)] + [{"context": "small1"}, {"context": "small2"}]
+    sample = stratified_sample(lambda: rows, 5, "context", random.Random(0))
+    assert Counter(row["context"] for row in sample) == {"big": 3, "small1": 1, "small2": 1}
+
+
+def test_stratified_sample_with_more_strata_than_k_depends_on_seed(testdata_path):
+    # One stratum per row, so only some strata can be kept
+    samples = [
+        [row["question"] for row in load_testdata(testdata_path, 5, "stratified", seed, stratify_field="question")]
+        for seed in (1, 2, 3)
+    ]
+    assert all(len(sample) == 5 for sample in samples)
+    assert len({tuple(sample) for sample in samples}) == 3
+    assert samples[0] == [
+        row["question"] for row in load_testdata(testdata_path, 5, "stratified", 1, stratify_field="question")
+    ]
+
+
+def test_stratified_sample_draws_strata_weighted_by_count():
+    rows = [{"context": f"c{i}"} for i in range(10) for _ in range(i + 1)]
+    counts = Counter()
+    for seed in range(500):
+        sample = stratified_sample(lambda: rows, 5, "context", random.Random(seed))
+        assert len(sample) == 5
+        counts.update(row["context"] for row in sample)
+    # Every stratum is drawn sometimes, and larger strata more often
+    assert all(counts[f"c{i}"] > 0 for i in range(10))
+    assert counts["c9"] > counts["c4"] > counts["c0"]
+
+
+def test_get_stratum_citation():
+    assert get_stratum({"truth": "Answer [doc.pdf] and [other.pdf]"}, "citation") == "doc.pdf"
+    assert get_stratum({"truth": "No citation"}, "citation") is None
+    assert get_stratum({"context": ["a", "b"]}, "context") == '["a", "b"]'
+
+
+def test_load_testdata_stratified_requires_field(testdata_path):
+    with pytest.raises(ValueError):
+        load_testdata(testdata_path, num_questions=5, sampling="stratified")
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for invalid in ("0/4", "5/4", "2", "a/b", "1/0"):
+        with pytest.raises(ValueError):
+            parse_shard(invalid)
+
+
+def test_select_shard_partitions_rows():
+    rows = [{"id": f"question-{i}"} for i in range(100)]
+    shards = [select_shard(rows, index, 3) for index in (1, 2, 3)]
+    assert sorted(row["id"] for shard in shards for row in shard) == sorted(row["id"] for row in rows)
+    assert all(shard for shard in shards)
+    # The partition only depends on the ids, not on which rows are in the list
+    assert select_shard(rows[:50], 2, 3) == [row for row in shards[1] if row in rows[:50]]
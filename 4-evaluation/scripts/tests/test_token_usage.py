@@ -0,0 +1,87 @@
+import json
+from types import SimpleNamespace
+
+from promptflow.evals.evaluators import RelevanceEvaluator
+
+from scripts.evaluate import run_evaluation, write_jsonl
+from scripts.evaluate_metrics.prompt_metrics import PROMPT_TEMPLATE_DIR
+from scripts.token_usage import (
+    UsageTrackingFlow,
+    collect_usage,
+    estimate_cost,
+    record_usage,
+    summarize_usage,
+    track_evaluator_usage,
+)
+
+
+def test_collect_usage_only_records_inside_block():
+    record_usage(SimpleNamespace(prompt_tokens=100, completion_tokens=1), 1.0)
+    with collect_usage() as usage:
+        record_usage(SimpleNamespace(prompt_tokens=10, completion_tokens=2), 0.5)
+        record_usage(None, 0.25)
+    assert usage.to_dict() == {"calls": 2, "prompt_tokens": 10, "completion_tokens": 2, "seconds": 0.75}
+
+
+def test_usage_tracking_flow(judge_config):
+    flow = UsageTrackingFlow(PROMPT_TEMPLATE_DIR / "myrelevance.prompty", judge_config)
+    with collect_usage() as usage:
+        output = flow(question="Q", answer="A", context="C")
+    assert output in {"1", "2", "3", "4", "5"}
+    assert usage.calls == 1
+    assert usage.prompt_tokens > 0 and usage.completion_tokens > 0
+
+
+def test_track_evaluator_usage(judge_config):
+    evaluator = track_evaluator_usage(RelevanceEvaluator(judge_config), judge_config)
+    with collect_usage() as usage:
+        result = evaluator(question="Q", answer="A", context="C")
+    assert 1 <= result["gpt_relevance"] <= 5
+    assert usage.calls == 1
+
+
+def test_estimate_cost():
+    assert estimate_cost(1_000_000, 100_000, {"prompt": 2.5, "completion": 10}) == 3.5
+    assert estimate_cost(1000, 100, None) is None
+
+
+def test_summarize_usage():
+    usage = {"calls": 1, "prompt_tokens": 1000, "completion_tokens": 10, "seconds": 0.5}
+    column = [
+        {"gpt_relevance": usage, "combined": usage},
+        json.dumps({"gpt_relevance": usage}),
+        float("nan"),
+        {},
+    ]
+    summary = summarize_usage(column, {"prompt": 1, "completion": 100})
+    assert summary["gpt_relevance"] == {
+        "calls": 2,
+        "prompt_tokens": 2000,
+        "completion_tokens": 20,
+        "seconds": 1.0,
+        "cost": 0.004,
+    }
+    assert summary["total"]["calls"] == 3
+    assert summary["total"]["cost"] == 0.006
+
+
+def test_run_evaluation_records_usage(tmp_path, judge_config, fake_target):
+    write_jsonl(tmp_path / "testdata.jsonl", [{"question": f"Q{i}", "truth": "T"} for i in range(3)])
+    assert run_evaluation(
+        openai_config=judge_config,
+        testdata_path=tmp_path / "testdata.jsonl",
+        results_dir=tmp_path / "results",
+        target_url=fake_target.url,
+        requested_metrics=["gpt_relevance", "myrelevance", "answer_length"],
+        target_response_answer_jmespath="message.content",
+        target_response_context_jmespath="context.data_points.text",
+        token_prices={"gpt-4": {"prompt": 2.5, "completion": 10}},
+    )
+    rows = [json.loads(line) for line in (tmp_path / "results" / "eval_results.jsonl").read_text().splitlines()]
+    for row in rows:
+        assert set(row["judge_usage"]) == {"gpt_relevance", "myrelevance"}
+        assert row["judge_prompt_tokens"] == sum(usage["prompt_tokens"] for usage in row["judge_usage"].values())
+    summary = json.loads((tmp_path / "results" / "summary.json").read_text())
+    assert summary["usage"]["gpt_relevance"]["calls"] == 3
+    assert summary["usage"]["total"]["calls"] == 6
+    assert summary["usage"]["total"]["cost"] > 0
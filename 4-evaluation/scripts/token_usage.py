@@ -0,0 +1,122 @@
+import inspect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from promptflow.client import load_flow
+
+logger = logging.getLogger("scripts")
+
+# Usage collected for the calls made on the current thread, while inside collect_usage()
+_current_usage = threading.local()
+
+
+class TokenUsage:
+    """Number of LLM calls, the tokens they used, and the seconds they took."""
+
+    def __init__(self, calls=0, prompt_tokens=0, completion_tokens=0, seconds=0.0):
+        self.calls = calls
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.seconds = seconds
+
+    def add(self, prompt_tokens: int, completion_tokens: int, seconds: float, calls: int = 1):
+        self.calls += calls
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+        self.seconds += seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+@contextmanager
+def collect_usage():
+    """Collects the usage of the LLM calls made through tracked flows on this thread, until the block exits."""
+    usage = TokenUsage()
+    previous_usage = getattr(_current_usage, "usage", None)
+    _current_usage.usage = usage
+    try:
+        yield usage
+    finally:
+        _current_usage.usage = previous_usage
+
+
+def record_usage(usage, seconds: float):
+    """Adds the usage of an OpenAI response (or None, if it had no usage) to the usage being collected, if any."""
+    collected_usage = getattr(_current_usage, "usage", None)
+    if collected_usage is not None:
+        collected_usage.add(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0), seconds=seconds)
+
+
+class UsageTrackingFlow:
+    """Prompty flow that records the token usage and duration of each call, and returns the content
+    of the first choice like a prompty flow does by default.
+
+    Prompty flows retry 429s and 5xx errors up to 10 times on their own. With `retry=False`, those retries are
+    skipped and errors are raised right away (promptflow already creates its openai clients with max_retries=0),
+    so that a rate limiter wrapping the flow sees the 429s and retries the calls itself."""
+
+    def __init__(self, source, model_config, retry: bool = True):
+        # The full response is needed to get the usage
+        self._flow = load_flow(source=source, model={"configuration": model_config, "response": "all"})
+        self._call = self._flow
+        if not retry:
+            # load_flow() wraps the core prompty, whose __call__ has the retrying (and tracing) decorators
+            core_prompty = getattr(self._flow, "_core_prompty", self._flow)
+            self._call = inspect.unwrap(type(core_prompty).__call__).__get__(core_prompty)
+
+    def __call__(self, **kwargs):
+        start_time = time.perf_counter()
+        response = self._call(**kwargs)
+        record_usage(response.usage, time.perf_counter() - start_time)
+        return response.choices[0].message.content
+
+
+def track_evaluator_usage(evaluator, model_config, retry: bool = True):
+    """Makes a promptflow-evals evaluator record the usage of its calls, by reloading its prompty flow
+    so that it returns the full response."""
+    evaluator._flow = UsageTrackingFlow(evaluator._flow.path, model_config, retry=retry)
+    return evaluator
+
+
+def estimate_cost(prompt_tokens: int, completion_tokens: int, prices: dict | None) -> float | None:
+    """Estimates the cost of some tokens using the prices of a model, in cost per million prompt
+    and completion tokens (like {"prompt": 2.5, "completion": 10}), or returns None if there are no prices."""
+    if not prices:
+        return None
+    return round(
+        (prompt_tokens * prices.get("prompt", 0) + completion_tokens * prices.get("completion", 0)) / 1_000_000, 6
+    )
+
+
+def summarize_usage(usage_column, prices: dict | None = None) -> dict:
+    """Adds up the judge usage recorded in each result row, for each metric (or combined judge) and in total,
+    estimating the cost with the given model prices."""
+    totals = {}
+    for row_usage in usage_column:
+        if isinstance(row_usage, str):
+            # Nested values are stored as JSON in the Parquet results
+            row_usage = json.loads(row_usage)
+        if not isinstance(row_usage, dict):
+            # Rows evaluated before usage was recorded
+            continue
+        for name, usage in row_usage.items():
+            totals.setdefault(name, TokenUsage()).add(
+                usage["prompt_tokens"], usage["completion_tokens"], usage["seconds"], calls=usage["calls"]
+            )
+    total = TokenUsage()
+    for usage in totals.values():
+        total.add(usage.prompt_tokens, usage.completion_tokens, usage.seconds, calls=usage.calls)
+    summary = {}
+    for name, usage in [*totals.items(), ("total", total)]:
+        summary[name] = usage.to_dict()
+        summary[name]["cost"] = estimate_cost(usage.prompt_tokens, usage.completion_tokens, prices)
+    return summary